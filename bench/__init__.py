@@ -0,0 +1,3 @@
+from .stub_server import LatencyModel, StubLLMServer
+
+__all__ = ['LatencyModel', 'StubLLMServer']
@@ -0,0 +1,74 @@
+"""Compare two benchmark results and flag latency or throughput regressions
+
+    python -m bench.compare base.json new.json --threshold 0.1
+
+Exits with code 1 when p95 latency of any flow grew, or throughput dropped,
+by more than the threshold.
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Optional
+
+METRICS = ("p50_ms", "p95_ms", "p99_ms")
+
+
+def _change(old: Optional[float], new: Optional[float]) -> Optional[float]:
+    if old is None or new is None or old == 0:
+        return None
+    return (new - old) / old
+
+
+def _format_change(change: Optional[float]) -> str:
+    return "n/a" if change is None else f"{change:+.1%}"
+
+
+def compare(base: Dict, new: Dict, threshold: float) -> List[str]:
+    """Print a comparison table and return the list of regressions"""
+    regressions = []
+    print(f"base: {base['meta'].get('commit')} ({base['meta'].get('timestamp')})")
+    print(f"new:  {new['meta'].get('commit')} ({new['meta'].get('timestamp')})")
+    print()
+    print(f"{'flow':<10} {'metric':<8} {'base':>10} {'new':>10} {'change':>8}")
+
+    for flow in sorted(set(base["flows"]) | set(new["flows"])):
+        old_stats = base["flows"].get(flow, {})
+        new_stats = new["flows"].get(flow, {})
+        for metric in METRICS:
+            old, value = old_stats.get(metric), new_stats.get(metric)
+            change = _change(old, value)
+            print(f"{flow:<10} {metric:<8} {old!s:>10} {value!s:>10} {_format_change(change):>8}")
+            if metric == "p95_ms" and change is not None and change > threshold:
+                regressions.append(f"{flow} p95 {_format_change(change)}")
+
+    old, value = base.get("throughput_flows_per_s"), new.get("throughput_flows_per_s")
+    change = _change(old, value)
+    print(f"{'all':<10} {'flows/s':<8} {old!s:>10} {value!s:>10} {_format_change(change):>8}")
+    if change is not None and change < -threshold:
+        regressions.append(f"throughput {_format_change(change)}")
+
+    old, value = base["memory"].get("max_rss_mb"), new["memory"].get("max_rss_mb")
+    print(f"{'all':<10} {'rss_mb':<8} {old!s:>10} {value!s:>10} {_format_change(_change(old, value)):>8}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative change, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    with open(args.base, encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.new, encoding="utf-8") as f:
+        new = json.load(f)
+
+    regressions = compare(base, new, args.threshold)
+    if regressions:
+        print("\nRegressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,465 @@
+"""End-to-end load test of the bot handlers
+
+Feeds synthetic Telegram updates through the real Dispatcher and router from
+bot/handlers.py. Bot API calls go to an in-memory session, LLM calls go to the
+local stub server (started in-process unless --llm-url is given). Reports
+latency percentiles, throughput and memory per flow as JSON.
+
+    python -m bench.driver --users 50 --requests 1000 --output bench_results.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.bot import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.methods import AnswerCallbackQuery, EditMessageText, SendChatAction, TelegramMethod
+from aiogram.types import Chat, Message, Update
+
+from bench.stub_server import StubLLMServer, add_latency_arguments, latency_from_args
+from bot import feedback, handlers, interactions, usage
+from bot.config import BotConfig
+from llm import (
+    AnswerCache, ConversationMemory, OpenRouterClient, create_http_transport, create_model_router,
+    create_reasoning_classifier,
+)
+
+logger = logging.getLogger(__name__)
+
+BOT_ID = 42
+ADMIN_ID = 1
+
+QUESTIONS = (
+    "Как поступить в ШАД?",
+    "Какие этапы отбора?",
+    "Когда начинается прием заявок?",
+    "Сколько стоит обучение?",
+    "Можно ли учиться онлайн?",
+    "Какие направления есть в ШАД?",
+    "Что спрашивают на собеседовании?",
+    "Какие темы по математике нужно знать?",
+    "Сколько длится обучение?",
+    "Можно ли совмещать ШАД с работой?",
+    "Какой проходной балл на экзамене?",
+    "Нужно ли знать программирование для поступления?",
+)
+
+ADMIN_COMMANDS = ("/config", "/stats", "/usage", "/feedback_list", "/feedback_list positive")
+
+FLOWS = ("question", "fragments", "feedback", "admin")
+
+# Delay between the parts of a question sent as several messages, s
+FRAGMENT_GAP = 0.3
+
+
+class MockSession(BaseSession):
+    """Bot session that answers API calls locally and counts them"""
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: Simulated Telegram API round trip in seconds
+        """
+        super().__init__()
+        self.latency = latency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self._message_id = 0
+
+    async def close(self) -> None:
+        pass
+
+    async def stream_content(self, url, headers=None, timeout=30, chunk_size=65536, raise_for_status=True):
+        yield b""
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+        self.calls[type(method).__name__] += 1
+        # Serialize like AiohttpSession does, so the cost stays in the measurement
+        files = {}
+        for value in method.model_dump(warnings=False).values():
+            self.prepare_value(value, bot=bot, files=files)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if isinstance(method, (AnswerCallbackQuery, SendChatAction)):
+            return True
+
+        chat_id = getattr(method, "chat_id", None) or 0
+        if isinstance(method, EditMessageText):
+            message_id = method.message_id
+        else:
+            self._message_id += 1
+            message_id = self._message_id
+
+        return Message(
+            message_id=message_id,
+            date=datetime.now(),
+            chat=Chat(id=chat_id, type="private"),
+            text=getattr(method, "text", None),
+        ).as_(bot)
+
+
+class UpdateFactory:
+    """Synthetic updates from private chats"""
+
+    def __init__(self):
+        self._update_id = 0
+
+    def _next_id(self) -> int:
+        self._update_id += 1
+        return self._update_id
+
+    @staticmethod
+    def _user(user_id: int) -> Dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}", "username": f"user{user_id}"}
+
+    def message(self, user_id: int, text: str) -> Dict:
+        update_id = self._next_id()
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+                **({"entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]}
+                   if text.startswith("/") else {}),
+            },
+        }
+
+    def callback(self, user_id: int, data: str) -> Dict:
+        update_id = self._next_id()
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "from": self._user(user_id),
+                "chat_instance": str(user_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": BOT_ID, "is_bot": True, "first_name": "Bot"},
+                    "text": "Как тебе работа бота?",
+                },
+            },
+        }
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile, q in [0, 100]"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(q / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int) -> Dict:
+    """Latency statistics in milliseconds"""
+    def ms(value):
+        return round(value * 1000, 2) if value is not None else None
+
+    return {
+        "count": len(latencies),
+        "errors": errors,
+        "mean_ms": ms(sum(latencies) / len(latencies)) if latencies else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(max(latencies)) if latencies else None,
+    }
+
+
+def rss_mb() -> float:
+    """Current resident memory of the process"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except OSError:
+        return max_rss_mb()
+
+
+def max_rss_mb() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return usage / 2 ** 20 if sys.platform == "darwin" else usage / 2 ** 10
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class LoadDriver:
+    """Runs virtual users against the real dispatcher"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot, weights: Dict[str, float], unique_questions: bool = False):
+        self.dp = dp
+        self.bot = bot
+        self.weights = weights
+        self.unique_questions = unique_questions
+        self.updates = UpdateFactory()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def _feed(self, data: Dict):
+        update = Update.model_validate(data, context={"bot": self.bot})
+        await self.dp.feed_update(self.bot, update)
+
+    async def _answered(self, user_id: int):
+        """Wait for the answer when the debounce middleware answers in the background"""
+        if handlers.debounce is not None:
+            await handlers.debounce.wait(user_id)
+
+    async def _question(self, user_id: int):
+        question = random.choice(QUESTIONS)
+        if self.unique_questions:
+            question = f"{question} ({user_id}-{random.randrange(10 ** 6)})"
+        await self._feed(self.updates.message(user_id, question))
+        await self._answered(user_id)
+
+    async def _fragments(self, user_id: int):
+        """One question typed as two or three quick messages"""
+        words = random.choice(QUESTIONS).split()
+        parts = min(len(words), random.choice((2, 3)))
+        size = math.ceil(len(words) / parts)
+
+        async def send(i: int):
+            await asyncio.sleep(i * FRAGMENT_GAP)
+            await self._feed(self.updates.message(user_id, " ".join(words[i * size:(i + 1) * size])))
+
+        await asyncio.gather(*(send(i) for i in range(parts)))
+        await self._answered(user_id)
+
+    async def _feedback(self, user_id: int):
+        await self._feed(self.updates.message(user_id, "/feedback"))
+        await self._feed(self.updates.callback(user_id, random.choice(("feedback_positive", "feedback_negative"))))
+        if random.random() < 0.5:
+            await self._feed(self.updates.message(user_id, "/skip"))
+        else:
+            await self._feed(self.updates.message(user_id, "Спасибо, все понятно"))
+
+    async def _admin(self, user_id: int):
+        await self._feed(self.updates.message(ADMIN_ID, random.choice(ADMIN_COMMANDS)))
+
+    async def run_flow(self, flow: str, user_id: int):
+        started = time.perf_counter()
+        try:
+            await getattr(self, f"_{flow}")(user_id)
+        except Exception as e:
+            logger.warning(f"{flow} flow failed: {e}")
+            self.errors[flow] += 1
+            return
+        self.latencies[flow].append(time.perf_counter() - started)
+
+    async def run(self, users: int, requests: int, duration: float, think_time: float) -> float:
+        """Run virtual users until requests flows are done or duration passes; returns elapsed seconds"""
+        flows = list(self.weights)
+        weights = [self.weights[flow] for flow in flows]
+        remaining = requests
+        deadline = time.perf_counter() + duration if duration else None
+
+        async def user(user_id: int):
+            nonlocal remaining
+            while remaining > 0 and (deadline is None or time.perf_counter() < deadline):
+                remaining -= 1
+                await self.run_flow(random.choices(flows, weights)[0], user_id)
+                if think_time:
+                    await asyncio.sleep(random.expovariate(1 / think_time))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(user(1000 + i) for i in range(users)))
+        return time.perf_counter() - started
+
+
+def parse_weights(value: str) -> Dict[str, float]:
+    """Parse "question=0.8,feedback=0.1,admin=0.1" """
+    weights = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in FLOWS:
+            raise argparse.ArgumentTypeError(f"Unknown flow: {name}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def build_config(args, llm_url: str, workdir: str) -> BotConfig:
+    config = BotConfig(telegram_token=f"{BOT_ID}:bench", openrouter_api_key="bench")
+    config.admin.user_ids = [ADMIN_ID]
+    config.llm.base_url = llm_url
+    config.llm.max_concurrency = args.max_concurrency
+    config.llm.max_queue_size = args.max_queue_size
+    config.llm.coalesce = not args.no_coalesce
+    config.retrieval.mode = args.context_mode
+    config.streaming.enabled = not args.no_streaming
+    config.rate_limit.enabled = args.rate_limit
+    config.debounce.enabled = args.debounce
+    config.cache.enabled = args.cache
+    config.cache.db_path = os.path.join(workdir, "answer_cache.db")
+    config.interactions.path = os.path.join(workdir, "interactions.db")
+    config.usage.path = os.path.join(workdir, "usage.db")
+    config.usage.user_daily_tokens = args.user_daily_tokens
+    if args.data_file:
+        config.data_file = args.data_file
+    return config
+
+
+async def run_benchmark(args) -> Dict:
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    stub = None
+    stub_runner = None
+    llm_url = args.llm_url
+    if llm_url is None:
+        stub = StubLLMServer(latency_from_args(args), answer_tokens=args.answer_tokens)
+        stub_runner = await stub.start(port=args.stub_port)
+        llm_url = f"http://127.0.0.1:{args.stub_port}/v1"
+
+    config = build_config(args, llm_url, workdir)
+
+    # Feedback goes to a scratch database
+    feedback.storage = feedback.FeedbackStorage(os.path.join(workdir, "feedback.db"))
+    await feedback.init_db()
+    await interactions.init_interaction_log(config.interactions)
+    await usage.init_usage(config.usage)
+
+    answer_cache = None
+    if config.cache.enabled:
+        answer_cache = AnswerCache(db_path=config.cache.db_path)
+        await answer_cache.start()
+
+    llm_client = OpenRouterClient(
+        api_key=config.openrouter_api_key,
+        model=config.llm.model,
+        data_file=config.data_file,
+        max_concurrency=config.llm.max_concurrency,
+        max_queue_size=config.llm.max_queue_size,
+        context_mode=config.retrieval.mode,
+        cache=answer_cache,
+        coalesce=config.llm.coalesce,
+        base_url=config.llm.base_url,
+        router=create_model_router(config.routing, config.llm.model),
+        transport=create_http_transport(config.http),
+        memory=ConversationMemory(
+            token_budget=config.memory.token_budget, follow_ups_only=config.memory.follow_ups_only
+        ) if config.memory.enabled else None,
+        reasoning=create_reasoning_classifier(config.reasoning),
+    )
+    handlers.set_dependencies(llm_client, config)
+
+    session = MockSession(latency=args.telegram_latency)
+    bot = Bot(token=config.telegram_token, session=session, default=DefaultBotProperties(parse_mode="Markdown"))
+    dp = Dispatcher(storage=MemoryStorage())
+    handlers.register_handlers(dp)
+
+    driver = LoadDriver(dp, bot, args.mix, unique_questions=args.unique_questions)
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_before = rss_mb()
+    elapsed = await driver.run(args.users, args.requests, args.duration, args.think_time)
+    rss_after = rss_mb()
+    traced_peak = None
+    if args.tracemalloc:
+        traced_peak = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        tracemalloc.stop()
+
+    await handlers.close_debounce()
+    await llm_client.transport.aclose()
+    await feedback.close_db()
+    await interactions.close_interaction_log()
+    await usage.close_usage()
+    if answer_cache is not None:
+        await answer_cache.close()
+    if stub_runner is not None:
+        await stub_runner.cleanup()
+
+    total = sum(len(values) for values in driver.latencies.values())
+    all_latencies = [value for values in driver.latencies.values() for value in values]
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key != "output"},
+        },
+        "duration_s": round(elapsed, 3),
+        "throughput_flows_per_s": round(total / elapsed, 2) if elapsed else None,
+        "overall": summarize(all_latencies, sum(driver.errors.values())),
+        "flows": {flow: summarize(driver.latencies[flow], driver.errors[flow]) for flow in args.mix},
+        "memory": {
+            "rss_before_mb": round(rss_before, 1),
+            "rss_after_mb": round(rss_after, 1),
+            "max_rss_mb": round(max_rss_mb(), 1),
+            "tracemalloc_peak_mb": round(traced_peak, 1) if traced_peak is not None else None,
+        },
+        "telegram_calls": dict(session.calls),
+        "llm": {
+            "upstream_requests": stub.requests if stub else None,
+            "max_concurrent_upstream": stub.max_in_flight if stub else None,
+            "coalescing": llm_client.inflight.stats() if llm_client.inflight else None,
+            "cache": answer_cache.stats() if answer_cache else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=50, help="concurrent virtual users")
+    parser.add_argument("--requests", type=int, default=500, help="total flows to run")
+    parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds, 0 for no limit")
+    parser.add_argument("--think-time", type=float, default=0, help="mean pause between flows of a user, s")
+    parser.add_argument("--mix", type=parse_weights, default=parse_weights("question=0.8,feedback=0.15,admin=0.05"))
+    parser.add_argument("--unique-questions", action="store_true", help="make every question unique (no coalescing)")
+    parser.add_argument("--telegram-latency", type=float, default=0.0, help="simulated Bot API round trip, s")
+    parser.add_argument("--llm-url", help="use an external OpenAI-compatible endpoint instead of the stub")
+    parser.add_argument("--stub-port", type=int, default=8900)
+    add_latency_arguments(parser)
+    parser.add_argument("--max-concurrency", type=int, default=8)
+    parser.add_argument("--max-queue-size", type=int, default=64)
+    parser.add_argument("--context-mode", default="full", choices=["full", "retrieval"])
+    parser.add_argument("--no-streaming", action="store_true")
+    parser.add_argument("--no-coalesce", action="store_true")
+    parser.add_argument("--rate-limit", action="store_true", help="enable per-user rate limiting")
+    parser.add_argument("--cache", action="store_true", help="enable the answer cache")
+    parser.add_argument("--debounce", action="store_true", help="merge quick consecutive messages of a user")
+    parser.add_argument("--user-daily-tokens", type=int, default=0, help="per-user daily token budget, 0 for none")
+    parser.add_argument("--data-file", help="knowledge base file (default from BotConfig)")
+    parser.add_argument("--tracemalloc", action="store_true", help="track Python allocations (slower)")
+    parser.add_argument("--output", help="write results JSON to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    results = asyncio.run(run_benchmark(args))
+
+    text = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,458 @@
+"""Offline evaluation of the answer pipeline on a fixed set of questions
+
+Runs questions from a JSONL file through the real OpenRouterClient (prompt,
+knowledge base context, model routing, reasoning) with limited concurrency
+and records the answer, latency and token usage of each question, one JSON
+line per question. A second command compares two runs, so a prompt change,
+a new data.txt or another model can be checked before it reaches users.
+
+    python -m bench.evaluate run questions.jsonl --output runs/base.jsonl
+    python -m bench.evaluate run questions.jsonl --output runs/ci.jsonl --stub --mean 0.2
+    python -m bench.evaluate diff runs/base.jsonl runs/new.jsonl --threshold 0.1
+
+Question lines look like {"id": "deadline", "question": "...", "expected": ["май"]};
+id and expected are optional. Runs resume: questions already in the output
+file are skipped.
+"""
+import argparse
+import asyncio
+import difflib
+import hashlib
+import json
+import logging
+import os
+import platform
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bench.driver import git_commit, summarize
+from bench.stub_server import StubLLMServer, add_latency_arguments, latency_from_args
+from bot.config import BotConfig
+from llm import (
+    AnswerInfo, OpenRouterClient, create_http_transport, create_model_router, create_reasoning_classifier
+)
+from llm.openrouter_client import ERROR_ANSWER, StreamInterrupted
+
+logger = logging.getLogger(__name__)
+
+QUESTION_FIELDS = ("question", "text", "query", "title")
+
+
+def load_questions(path: str, field: Optional[str] = None, id_field: str = "id") -> List[Dict]:
+    """
+    Read questions from JSONL
+
+    Args:
+        path: File with one JSON object per line
+        field: Field holding the question; by default the first of QUESTION_FIELDS present
+        id_field: Field holding a stable question id; a hash of the question if missing
+
+    Returns:
+        Dicts with id, question and expected keywords
+    """
+    questions = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            name = field or next((name for name in QUESTION_FIELDS if row.get(name)), None)
+            if name is None or not row.get(name):
+                raise ValueError(f"{path}:{number}: no question field, use --field")
+
+            question = str(row[name]).strip()
+            question_id = str(row.get(id_field) or hashlib.sha1(question.encode("utf-8")).hexdigest()[:12])
+            if question_id in seen:
+                logger.warning(f"{path}:{number}: duplicate question id {question_id}, skipped")
+                continue
+            seen.add(question_id)
+
+            expected = row.get("expected") or []
+            if isinstance(expected, str):
+                expected = [expected]
+            questions.append({"id": question_id, "question": question, "expected": expected})
+    return questions
+
+
+def load_run(path: str) -> Dict[str, Dict]:
+    """Rows of a run by question id, empty if the file does not exist"""
+    rows = {}
+    if not os.path.exists(path):
+        return rows
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                row = json.loads(line)
+                rows[row["id"]] = row
+    return rows
+
+
+class ResultCache:
+    """Answers of earlier runs keyed by everything that determines the request
+
+    The key covers the exact messages sent (system prompt, knowledge base
+    context and question), the model chain, the reasoning effort and the API
+    endpoint, so a prompt, data or model change is never answered from cache.
+    """
+
+    def __init__(self, path: str):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, row TEXT NOT NULL)")
+        self.conn.commit()
+
+    @staticmethod
+    def make_key(client: OpenRouterClient, question: str, reasoning: str) -> str:
+        request = {
+            "base_url": str(client.async_client.base_url),
+            "models": [model.spec.name for model in client.router.models],
+            "reasoning": reasoning,
+            "messages": client._build_messages(question, client.knowledge_base),
+        }
+        return hashlib.sha256(json.dumps(request, ensure_ascii=False, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict]:
+        found = self.conn.execute("SELECT row FROM results WHERE key = ?", (key,)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def set(self, key: str, row: Dict):
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO results (key, row) VALUES (?, ?)", (key, json.dumps(row, ensure_ascii=False))
+            )
+
+    def close(self):
+        self.conn.close()
+
+
+def build_config(args) -> BotConfig:
+    """Bot configuration from .env and config.json with command line overrides"""
+    config = BotConfig.from_env()
+    if args.data_file:
+        config.data_file = args.data_file
+    if args.model:
+        config.llm.model = args.model
+        config.routing.models = []
+    if args.context_mode:
+        config.retrieval.mode = args.context_mode
+    if args.reasoning:
+        config.reasoning.mode = args.reasoning
+    config.llm.max_concurrency = args.concurrency
+    config.llm.max_queue_size = max(config.llm.max_queue_size, args.concurrency)
+    return config
+
+
+def build_client(config: BotConfig, base_url: str, api_key: str) -> OpenRouterClient:
+    """Client configured like the bot's, without the answer cache, coalescing and memory"""
+    return OpenRouterClient(
+        api_key=api_key,
+        model=config.llm.model,
+        data_file=config.data_file,
+        max_concurrency=config.llm.max_concurrency,
+        max_queue_size=config.llm.max_queue_size,
+        context_mode=config.retrieval.mode,
+        top_k=config.retrieval.top_k,
+        context_token_budget=config.retrieval.token_budget,
+        max_section_chars=config.retrieval.max_section_chars,
+        kb_artifact=config.kb_artifact or None,
+        coalesce=False,
+        base_url=base_url,
+        router=create_model_router(config.routing, config.llm.model),
+        transport=create_http_transport(config.http),
+        reasoning=create_reasoning_classifier(config.reasoning),
+    )
+
+
+async def answer_question(client: OpenRouterClient, item: Dict, streaming: bool) -> Dict:
+    """Ask one question and measure it"""
+    info = AnswerInfo()
+    ttft = None
+    started = time.perf_counter()
+    if streaming:
+        parts = []
+        try:
+            async for delta in client.astream_answer(item["question"], info=info):
+                if ttft is None:
+                    ttft = time.perf_counter() - started
+                parts.append(delta)
+        except StreamInterrupted as e:
+            # info.source is "error": a cut-off answer counts as a failure
+            logger.warning(f"Answer to {item['id']} was cut off: {e}")
+        answer = "".join(parts)
+    else:
+        answer = await client.agenerate_answer(item["question"], info=info)
+    latency = time.perf_counter() - started
+
+    error = info.source == "error" or answer == ERROR_ANSWER
+    lowered = answer.lower()
+    return {
+        "id": item["id"],
+        "question": item["question"],
+        "answer": answer,
+        "error": error,
+        "model": info.model,
+        "kb_version": info.kb_version,
+        "latency_ms": round(latency * 1000, 1),
+        "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        "prompt_tokens": info.prompt_tokens,
+        "completion_tokens": info.completion_tokens,
+        "expected_total": len(item["expected"]),
+        "expected_hits": sum(1 for keyword in item["expected"] if keyword.lower() in lowered),
+        "cached": False,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+    }
+
+
+def write_meta(args, config: BotConfig, client: OpenRouterClient, base_url: str):
+    """Describe the run next to its results; kept from the first start when a run resumes"""
+    path = f"{args.output}.meta.json"
+    now = datetime.now().isoformat(timespec="seconds")
+    meta = {"started": now, "resumed": []}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["resumed"].append(now)
+    meta.update({
+        "commit": meta.get("commit") or git_commit(),
+        "python": platform.python_version(),
+        "questions": args.questions,
+        "base_url": base_url,
+        "models": [model.spec.name for model in client.router.models],
+        "context_mode": config.retrieval.mode,
+        "reasoning": config.reasoning.mode,
+        "data_file": config.data_file,
+        "kb_version": client.kb_version,
+        "streaming": args.streaming,
+    })
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+async def run(args) -> int:
+    questions = load_questions(args.questions, args.field, args.id_field)
+    if args.limit:
+        questions = questions[:args.limit]
+
+    done = load_run(args.output)
+    if args.retry_errors:
+        done = {key: row for key, row in done.items() if not row["error"]}
+    pending = [item for item in questions if item["id"] not in done]
+    logger.info(f"{len(questions)} questions, {len(questions) - len(pending)} already answered, {len(pending)} to run")
+
+    config = build_config(args)
+    stub_runner = None
+    if args.stub:
+        stub = StubLLMServer(latency_from_args(args), answer_tokens=args.answer_tokens)
+        stub_runner = await stub.start(port=args.stub_port)
+        base_url, api_key = f"http://127.0.0.1:{args.stub_port}/v1", "stub"
+    else:
+        if not config.openrouter_api_key:
+            logger.error("OPENROUTER_API_KEY is not set; use --stub to run against the local stub")
+            return 2
+        base_url, api_key = config.llm.base_url, config.openrouter_api_key
+
+    client = build_client(config, base_url, api_key)
+    cache = ResultCache(args.cache) if args.cache else None
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    write_meta(args, config, client, base_url)
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    completed = 0
+
+    async def evaluate(item: Dict, output):
+        nonlocal completed
+        async with semaphore:
+            key = None
+            row = None
+            if cache is not None:
+                key = ResultCache.make_key(client, item["question"], client.reasoning.decide(item["question"]).effort)
+                row = cache.get(key)
+                if row is not None:
+                    row.update(id=item["id"], cached=True)
+            if row is None:
+                row = await answer_question(client, item, args.streaming)
+                if cache is not None and not row["error"]:
+                    cache.set(key, row)
+
+        # Written as soon as it is ready, so an interrupted run resumes where it stopped
+        output.write(json.dumps(row, ensure_ascii=False) + "\n")
+        output.flush()
+        completed += 1
+        if completed % 10 == 0 or completed == len(pending):
+            logger.info(f"{completed}/{len(pending)} answered")
+
+    started = time.perf_counter()
+    try:
+        with open(args.output, "a", encoding="utf-8") as output:
+            await asyncio.gather(*(evaluate(item, output) for item in pending))
+    finally:
+        await client.transport.aclose()
+        if cache is not None:
+            cache.close()
+        if stub_runner is not None:
+            await stub_runner.cleanup()
+    elapsed = time.perf_counter() - started
+
+    rows = list(load_run(args.output).values())
+    latencies = [row["latency_ms"] / 1000 for row in rows if not row["error"] and not row["cached"]]
+    stats = summarize(latencies, sum(row["error"] for row in rows))
+    timing = f"p50 {stats['p50_ms']} ms, p95 {stats['p95_ms']} ms" if latencies else "no uncached answers to time"
+    print(
+        f"{len(rows)} answers in {args.output} ({len(pending)} new, {elapsed:.1f} s): errors {stats['errors']}, "
+        f"{timing}, tokens {sum(row['prompt_tokens'] for row in rows)} + {sum(row['completion_tokens'] for row in rows)}"
+    )
+    return 0
+
+
+def _recall(rows: List[Dict]) -> Optional[float]:
+    total = sum(row["expected_total"] for row in rows)
+    return sum(row["expected_hits"] for row in rows) / total if total else None
+
+
+def _mean(values: List[float]) -> Optional[float]:
+    return round(sum(values) / len(values), 1) if values else None
+
+
+def _change(old: Optional[float], new: Optional[float]) -> str:
+    if old is None or new is None or old == 0:
+        return "n/a"
+    return f"{(new - old) / old:+.1%}"
+
+
+def _short(text: str, limit: int = 300) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit] + "…"
+
+
+def diff(base_path: str, new_path: str, threshold: float, max_recall_drop: float, show: int) -> List[str]:
+    """
+    Compare two runs over the questions they share
+
+    Args:
+        base_path: Results of the reference run
+        new_path: Results of the run being checked
+        threshold: Allowed relative growth of p50/p95 latency and mean tokens
+        max_recall_drop: Allowed drop of the share of expected keywords found
+        show: Number of most changed answers to print
+
+    Returns:
+        Regressions found
+    """
+    base, new = load_run(base_path), load_run(new_path)
+    common = sorted(set(base) & set(new))
+    print(f"base: {base_path} ({len(base)} answers)")
+    print(f"new:  {new_path} ({len(new)} answers)")
+    print(f"shared questions: {len(common)}, only in base: {len(set(base) - set(new))}, only in new: {len(set(new) - set(base))}")
+    print()
+
+    base_rows = [base[key] for key in common]
+    new_rows = [new[key] for key in common]
+    # Latency is compared on questions both runs actually sent to the model
+    timed = [key for key in common if not (base[key]["error"] or new[key]["error"] or base[key]["cached"] or new[key]["cached"])]
+    base_latency = summarize([base[key]["latency_ms"] / 1000 for key in timed], 0)
+    new_latency = summarize([new[key]["latency_ms"] / 1000 for key in timed], 0)
+
+    regressions = []
+    print(f"{'metric':<22} {'base':>10} {'new':>10} {'change':>8}")
+
+    def line(name: str, old, value, higher_is_worse: bool = True, limit: Optional[float] = threshold):
+        print(f"{name:<22} {old!s:>10} {value!s:>10} {_change(old, value):>8}")
+        if limit is None or old is None or value is None or not old:
+            return
+        change = (value - old) / old
+        if (change if higher_is_worse else -change) > limit:
+            regressions.append(f"{name} {_change(old, value)}")
+
+    line("p50 latency, ms", base_latency["p50_ms"], new_latency["p50_ms"])
+    line("p95 latency, ms", base_latency["p95_ms"], new_latency["p95_ms"])
+    line("mean prompt tokens", _mean([row["prompt_tokens"] for row in base_rows]), _mean([row["prompt_tokens"] for row in new_rows]))
+    line("mean completion tokens", _mean([row["completion_tokens"] for row in base_rows]),
+         _mean([row["completion_tokens"] for row in new_rows]))
+
+    base_errors = sum(row["error"] for row in base_rows)
+    new_errors = sum(row["error"] for row in new_rows)
+    line("errors", base_errors, new_errors, limit=None)
+    if new_errors > base_errors:
+        regressions.append(f"errors {base_errors} -> {new_errors}")
+
+    base_recall, new_recall = _recall(base_rows), _recall(new_rows)
+    if base_recall is not None:
+        print(f"{'expected keywords':<22} {base_recall:>10.1%} {new_recall:>10.1%}")
+        if base_recall - new_recall > max_recall_drop:
+            regressions.append(f"expected keywords {base_recall:.1%} -> {new_recall:.1%}")
+
+    similarity = {key: difflib.SequenceMatcher(None, base[key]["answer"], new[key]["answer"]).ratio() for key in common}
+    changed = [key for key in common if similarity[key] < 1.0]
+    print(f"{'answers changed':<22} {len(changed):>10} of {len(common)}")
+
+    lost = [key for key in common if new[key]["expected_hits"] < base[key]["expected_hits"]]
+    if lost:
+        print()
+        print("Lost expected keywords:")
+        for key in lost:
+            print(f"  [{key}] {_short(new[key]['question'], 100)} ({base[key]['expected_hits']} -> {new[key]['expected_hits']})")
+
+    if show and changed:
+        print()
+        print("Most changed answers:")
+        for key in sorted(changed, key=lambda key: similarity[key])[:show]:
+            print(f"  [{key}] {_short(new[key]['question'], 100)} (similarity {similarity[key]:.0%})")
+            print(f"    - {_short(base[key]['answer'])}")
+            print(f"    + {_short(new[key]['answer'])}")
+
+    print()
+    if regressions:
+        print("Regressions:")
+        for regression in regressions:
+            print(f"  {regression}")
+    else:
+        print("No regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="answer questions and record the results")
+    run_parser.add_argument("questions", help="JSONL file with questions")
+    run_parser.add_argument("--output", required=True, help="JSONL results; existing answers are kept and skipped")
+    run_parser.add_argument("--field", help="question field (default: question, text, query or title)")
+    run_parser.add_argument("--id-field", default="id", help="question id field (default: hash of the question)")
+    run_parser.add_argument("--limit", type=int, default=0, help="only the first N questions")
+    run_parser.add_argument("--concurrency", type=int, default=4)
+    run_parser.add_argument("--streaming", action="store_true", help="stream answers and record time to first token")
+    run_parser.add_argument("--retry-errors", action="store_true", help="ask again questions that failed last time")
+    run_parser.add_argument("--cache", help="SQLite file reusing answers to identical requests across runs")
+    run_parser.add_argument("--data-file", help="knowledge base file instead of the configured one")
+    run_parser.add_argument("--model", help="single model instead of the configured chain")
+    run_parser.add_argument("--context-mode", choices=["full", "retrieval"])
+    run_parser.add_argument("--reasoning", choices=["auto", "always", "never"])
+    run_parser.add_argument("--stub", action="store_true", help="answer with the local stub server")
+    run_parser.add_argument("--stub-port", type=int, default=8900)
+    add_latency_arguments(run_parser)
+    # Reproducible timing by default when the stub answers
+    run_parser.set_defaults(latency="fixed")
+
+    diff_parser = commands.add_parser("diff", help="compare two runs")
+    diff_parser.add_argument("base")
+    diff_parser.add_argument("new")
+    diff_parser.add_argument("--threshold", type=float, default=0.1, help="allowed relative growth of latency and tokens")
+    diff_parser.add_argument("--max-recall-drop", type=float, default=0.05, help="allowed drop of expected keywords found")
+    diff_parser.add_argument("--show", type=int, default=5, help="most changed answers to print")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    if args.command == "run":
+        sys.exit(asyncio.run(run(args)))
+
+    regressions = diff(args.base, args.new, args.threshold, args.max_recall_drop, args.show)
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Local stub of the OpenAI-compatible /chat/completions endpoint
+
+Answers every request after a delay drawn from a configurable distribution,
+either as one JSON response or as an SSE stream of tokens with usage in the
+last chunk, like OpenRouter does. Requests with reasoning enabled first
+"think" for REASONING_TOKENS tokens at token_interval each.
+
+    python -m bench.stub_server --port 8900 --latency lognormal --mean 0.8 --answer-tokens 60
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import random
+import time
+import uuid
+from dataclasses import dataclass
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+WORDS = (
+    "ШАД", "поступление", "экзамен", "собеседование", "программа", "анализ", "данных",
+    "обучение", "курс", "семестр", "задачи", "математика", "алгоритмы", "онлайн", "этап",
+)
+
+# Hidden reasoning tokens by requested effort; "on" is reasoning enabled without an effort
+REASONING_TOKENS = {"low": 100, "medium": 300, "high": 800, "on": 300}
+
+
+def reasoning_effort(body: dict) -> str:
+    """Reasoning effort requested by an OpenRouter request body, "off" if none"""
+    reasoning = body.get("reasoning") or {}
+    if reasoning.get("effort"):
+        return reasoning["effort"]
+    return "on" if reasoning.get("enabled") else "off"
+
+
+@dataclass
+class LatencyModel:
+    """Delay before the first token and between streamed tokens, in seconds"""
+    distribution: str = "lognormal"  # "fixed", "uniform", "exponential" or "lognormal"
+    mean: float = 0.8
+    spread: float = 0.5  # uniform: half-width, lognormal: sigma; ignored otherwise
+    token_interval: float = 0.02
+    error_rate: float = 0.0  # share of requests answered with HTTP 500
+
+    def first_token_delay(self) -> float:
+        if self.distribution == "fixed":
+            return self.mean
+        if self.distribution == "uniform":
+            return max(0.0, random.uniform(self.mean - self.spread, self.mean + self.spread))
+        if self.distribution == "exponential":
+            return random.expovariate(1 / self.mean) if self.mean > 0 else 0.0
+        if self.distribution == "lognormal":
+            if self.mean <= 0:
+                return 0.0
+            # mu chosen so that the distribution mean equals self.mean
+            mu = math.log(self.mean) - self.spread ** 2 / 2
+            return random.lognormvariate(mu, self.spread)
+        raise ValueError(f"Unknown distribution: {self.distribution}")
+
+
+class StubLLMServer:
+    """aiohttp application imitating OpenRouter's chat completions API"""
+
+    def __init__(self, latency: LatencyModel = None, answer_tokens: int = 60, prompt_tokens: int = 0):
+        """
+        Args:
+            latency: Delay model
+            answer_tokens: Number of words in every answer
+            prompt_tokens: Reported prompt tokens, 0 to estimate from the request size
+        """
+        self.latency = latency or LatencyModel()
+        self.answer_tokens = answer_tokens
+        self.prompt_tokens = prompt_tokens
+        self.requests = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def _usage(self, body: dict) -> dict:
+        prompt = self.prompt_tokens
+        if not prompt:
+            prompt = sum(len(str(m.get("content", ""))) for m in body.get("messages", [])) // 3
+        reasoning = REASONING_TOKENS.get(reasoning_effort(body), 0)
+        completion = self.answer_tokens + reasoning
+        return {
+            "prompt_tokens": prompt,
+            "completion_tokens": completion,
+            "total_tokens": prompt + completion,
+            "completion_tokens_details": {"reasoning_tokens": reasoning},
+        }
+
+    def _words(self):
+        return [random.choice(WORDS) for _ in range(self.answer_tokens)]
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            thinking = REASONING_TOKENS.get(reasoning_effort(body), 0) * self.latency.token_interval
+            await asyncio.sleep(self.latency.first_token_delay() + thinking)
+            if random.random() < self.latency.error_rate:
+                return web.json_response({"error": {"message": "stub failure"}}, status=500)
+
+            completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+            model = body.get("model", "stub")
+            created = int(time.time())
+
+            if not body.get("stream"):
+                return web.json_response({
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": " ".join(self._words())},
+                        "finish_reason": "stop",
+                    }],
+                    "usage": self._usage(body),
+                })
+
+            response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+            await response.prepare(request)
+
+            def chunk(delta: dict, finish_reason=None, usage=None) -> bytes:
+                data = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                }
+                if usage is not None:
+                    data["choices"] = []
+                    data["usage"] = usage
+                return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+            for i, word in enumerate(self._words()):
+                if i:
+                    await asyncio.sleep(self.latency.token_interval)
+                await response.write(chunk({"content": ("" if i == 0 else " ") + word}))
+            await response.write(chunk({}, finish_reason="stop"))
+            if body.get("stream_options", {}).get("include_usage"):
+                await response.write(chunk({}, usage=self._usage(body)))
+            await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+            return response
+        finally:
+            self.in_flight -= 1
+
+    def build_app(self) -> web.Application:
+        app = web.Application(client_max_size=16 * 1024 * 1024)
+        app.router.add_post("/v1/chat/completions", self.handle)
+        app.router.add_post("/api/v1/chat/completions", self.handle)
+        return app
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8900) -> web.AppRunner:
+        """Serve in the current event loop; base URL is http://host:port/v1"""
+        runner = web.AppRunner(self.build_app(), access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, host, port).start()
+        logger.info(f"Stub LLM listening on http://{host}:{port}/v1")
+        return runner
+
+
+def add_latency_arguments(parser: argparse.ArgumentParser):
+    """Command line options of LatencyModel, shared with the driver"""
+    parser.add_argument("--latency", default="lognormal", choices=["fixed", "uniform", "exponential", "lognormal"])
+    parser.add_argument("--mean", type=float, default=0.8, help="mean delay before the first token, s")
+    parser.add_argument("--spread", type=float, default=0.5, help="uniform half-width or lognormal sigma")
+    parser.add_argument("--token-interval", type=float, default=0.02, help="delay between streamed tokens, s")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+
+
+def latency_from_args(args) -> LatencyModel:
+    return LatencyModel(
+        distribution=args.latency,
+        mean=args.mean,
+        spread=args.spread,
+        token_interval=args.token_interval,
+        error_rate=args.error_rate,
+    )
+
+
+async def _serve(args):
+    server = StubLLMServer(latency_from_args(args), answer_tokens=args.answer_tokens)
+    await server.start(args.host, args.port)
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_latency_arguments(parser)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
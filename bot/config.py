@@ -1,8 +1,8 @@
 import json
 import logging
 import os
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, asdict
+from typing import Dict, List
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -21,17 +21,277 @@ class AdminConfig:
             self.user_ids = []
 
 
+@dataclass
+class LLMConfig:
+    """LLM client configuration"""
+    model: str = "amazon/nova-2-lite-v1:free"
+    max_concurrency: int = 8
+    max_queue_size: int = 64
+    coalesce: bool = True  # share one upstream call between identical concurrent questions
+    base_url: str = "https://openrouter.ai/api/v1"
+
+
+@dataclass
+class HTTPConfig:
+    """Shared HTTP transport for LLM API calls"""
+    max_connections: int = 32
+    max_keepalive_connections: int = 16
+    keepalive_expiry: float = 60.0
+    http2: bool = True  # used only when the h2 package is installed
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0  # between response chunks, s
+    write_timeout: float = 10.0
+    pool_timeout: float = 10.0  # waiting for a free connection
+    max_retries: int = 2
+    retry_backoff: float = 0.5  # retry n waits a random time up to retry_backoff * 2**n
+    retry_backoff_max: float = 8.0
+    retry_budget_ratio: float = 0.1  # retries allowed per request within the window
+    retry_budget_min: int = 3  # retries allowed within the window regardless of traffic
+    retry_budget_window: float = 10.0
+
+
+@dataclass
+class RoutingConfig:
+    """Model routing configuration: fallback models, deadlines, hedging and circuit breaker"""
+    models: List[Dict] = None  # [{"name": ..., "timeout": ...}] in order of preference, empty to use llm.model
+    timeout: float = 60.0  # default per-model deadline, s
+    hedge: bool = True  # ask the next model when the current one is slower than its p95
+    hedge_delay: float = 10.0  # hedge delay until enough latencies are collected
+    hedge_min_delay: float = 1.0
+    hedge_min_samples: int = 20
+    failure_threshold: int = 5  # consecutive failures before a model is skipped
+    cooldown_seconds: float = 30.0
+
+    def __post_init__(self):
+        if self.models is None:
+            self.models = []
+
+
+@dataclass
+class ReasoningConfig:
+    """Per-question model reasoning configuration"""
+    mode: str = "auto"  # "auto" to classify questions, "always" or "never"
+    thresholds: Dict[str, float] = None  # minimum complexity score per effort; below all of them reasoning is off
+    overrides: List[Dict] = None  # [{"pattern": regex, "effort": "off"|"low"|"medium"|"high"}], first match wins
+    model_path: str = ""  # trained classifier weights (python -m llm.reasoning --train), "" for built-in ones
+
+    def __post_init__(self):
+        if self.thresholds is None:
+            self.thresholds = {"low": 0.5, "medium": 0.75, "high": 0.9}
+        if self.overrides is None:
+            self.overrides = []
+
+
+@dataclass
+class RetrievalConfig:
+    """Knowledge base context configuration"""
+    mode: str = "full"  # "full" or "retrieval"
+    top_k: int = 5
+    token_budget: int = 3000
+    max_section_chars: int = 1500
+
+
+@dataclass
+class CacheConfig:
+    """Answer cache configuration"""
+    enabled: bool = True
+    max_size: int = 1000
+    ttl_seconds: int = 86400
+    db_path: str = "answer_cache.db"
+    lemmatize: bool = False
+
+
+@dataclass
+class MemoryConfig:
+    """Per-user conversation memory configuration"""
+    enabled: bool = True
+    max_users: int = 10000  # least recently active conversations are dropped first
+    ttl_seconds: int = 3600  # conversation is forgotten after this long without questions
+    token_budget: int = 1000  # estimated tokens of history added to the prompt
+    summarize: bool = False  # fold trimmed turns into a summary with an extra LLM call
+    summary_tokens: int = 200
+    follow_ups_only: bool = True  # stand-alone questions skip history and stay cacheable
+
+
+@dataclass
+class StreamingConfig:
+    """Streaming answers configuration"""
+    enabled: bool = True
+    edit_interval: float = 1.5  # minimum seconds between edits of the answer message
+
+
+@dataclass
+class DebounceConfig:
+    """Merging of quick consecutive messages of a user into one question"""
+    enabled: bool = False  # every question waits for the window before the LLM call
+    window: float = 0.4  # seconds to wait for the next message of the same user
+    max_wait: float = 2.0  # longest delay from the first message of a burst to the answer
+
+
+@dataclass
+class RateLimitConfig:
+    """Per-user rate limit and fair LLM queue configuration"""
+    enabled: bool = True
+    per_user_rate: float = 0.2  # questions per second refilled into each user's bucket
+    per_user_burst: int = 3
+    max_queue_size: int = 64
+
+
+@dataclass
+class UsageConfig:
+    """Daily token accounting and budgets"""
+    enabled: bool = True
+    path: str = "usage.db"
+    flush_interval: float = 5.0  # seconds between writes; other processes' usage is seen this late
+    user_daily_tokens: int = 300000  # per user per day, 0 for no limit; admins are not limited
+    global_daily_tokens: int = 0  # all users together per day, 0 for no limit
+    cache_fallback: bool = True  # answer from cache when a budget is used up, if the answer is there
+
+
+@dataclass
+class LoggingConfig:
+    """Logging configuration"""
+    level: str = "INFO"
+    file: str = "bot.log"
+    format: str = "text"  # "text" or "json" (JSON lines in the log file)
+    max_bytes: int = 10 * 1024 * 1024
+    rotate_when: str = "midnight"
+    backup_count: int = 7
+    levels: Dict[str, str] = None  # per-module levels, e.g. {"llm": "WARNING"}
+    sampling: Dict[str, float] = None  # share of records below WARNING kept per module
+
+    def __post_init__(self):
+        if self.levels is None:
+            self.levels = {}
+        if self.sampling is None:
+            self.sampling = {}
+
+
+@dataclass
+class InteractionLogConfig:
+    """Log of questions and answers"""
+    enabled: bool = True
+    backend: str = "sqlite"  # "sqlite" or "jsonl"
+    path: str = "interactions.db"
+    flush_interval: float = 1.0  # seconds between batched writes
+    batch_size: int = 200  # pending interactions that trigger an early write
+    max_pending: int = 10000  # oldest unwritten interactions are dropped beyond this
+
+
+@dataclass
+class MetricsConfig:
+    """Prometheus metrics endpoint configuration"""
+    enabled: bool = False
+    host: str = "127.0.0.1"
+    port: int = 9100
+
+
+@dataclass
+class WebhookConfig:
+    """Webhook run mode configuration; polling is used when disabled"""
+    enabled: bool = False
+    url: str = ""  # public HTTPS URL Telegram posts updates to, including path
+    path: str = "/webhook"
+    host: str = "0.0.0.0"
+    port: int = 8080
+    workers: int = 16
+    max_queue_size: int = 1000
+    drop_pending_updates: bool = False
+
+
+@dataclass
+class FSMStorageConfig:
+    """Storage of dialog states (feedback flow) shared between bot processes"""
+    backend: str = "memory"  # "memory", "sqlite" or "redis"
+    db_path: str = "fsm.db"
+    url: str = "redis://127.0.0.1:6379/0"
+    ttl_seconds: int = 3600  # abandoned states expire after this time
+    cache_ttl: float = 1.0  # in-process read cache lifetime, 0 disables it
+
+
+@dataclass
+class SupervisorConfig:
+    """Multi-process mode (supervisor.py) configuration"""
+    workers: int = 0  # 0 means one worker per CPU core
+    max_queue_size: int = 1000  # updates waiting for each worker
+    heartbeat_interval: float = 2.0
+    heartbeat_timeout: float = 30.0  # worker without heartbeats for this long is restarted
+    shutdown_timeout: float = 30.0
+    restart_backoff: float = 1.0  # delay before the second restart within restart_window, doubled after each next one
+    restart_backoff_max: float = 60.0
+    max_restarts: int = 10  # restarts of one worker within restart_window before the supervisor gives up, 0 - no limit
+    restart_window: float = 600.0
+
+    def resolved_workers(self) -> int:
+        """Number of worker processes to start"""
+        return self.workers if self.workers > 0 else (os.cpu_count() or 1)
+
+
 @dataclass
 class BotConfig:
     """Bot configuration from environment variables and config.json"""
     telegram_token: str
     openrouter_api_key: str
+    webhook_secret: str = None
     data_file: str = "data/data.txt"
+    data_watch_interval: float = 0  # seconds between data file checks, 0 disables the watcher
+    kb_artifact: str = "data/data.kb"  # compiled index for retrieval mode, "" to index data.txt in memory
     admin: AdminConfig = None
+    llm: LLMConfig = None
+    routing: RoutingConfig = None
+    reasoning: ReasoningConfig = None
+    http: HTTPConfig = None
+    retrieval: RetrievalConfig = None
+    cache: CacheConfig = None
+    memory: MemoryConfig = None
+    streaming: StreamingConfig = None
+    debounce: DebounceConfig = None
+    rate_limit: RateLimitConfig = None
+    usage: UsageConfig = None
+    logging: LoggingConfig = None
+    interactions: InteractionLogConfig = None
+    metrics: MetricsConfig = None
+    webhook: WebhookConfig = None
+    fsm_storage: FSMStorageConfig = None
+    supervisor: SupervisorConfig = None
 
     def __post_init__(self):
         if self.admin is None:
             self.admin = AdminConfig()
+        if self.llm is None:
+            self.llm = LLMConfig()
+        if self.routing is None:
+            self.routing = RoutingConfig()
+        if self.reasoning is None:
+            self.reasoning = ReasoningConfig()
+        if self.http is None:
+            self.http = HTTPConfig()
+        if self.retrieval is None:
+            self.retrieval = RetrievalConfig()
+        if self.cache is None:
+            self.cache = CacheConfig()
+        if self.memory is None:
+            self.memory = MemoryConfig()
+        if self.streaming is None:
+            self.streaming = StreamingConfig()
+        if self.debounce is None:
+            self.debounce = DebounceConfig()
+        if self.rate_limit is None:
+            self.rate_limit = RateLimitConfig()
+        if self.usage is None:
+            self.usage = UsageConfig()
+        if self.logging is None:
+            self.logging = LoggingConfig()
+        if self.interactions is None:
+            self.interactions = InteractionLogConfig()
+        if self.metrics is None:
+            self.metrics = MetricsConfig()
+        if self.webhook is None:
+            self.webhook = WebhookConfig()
+        if self.fsm_storage is None:
+            self.fsm_storage = FSMStorageConfig()
+        if self.supervisor is None:
+            self.supervisor = SupervisorConfig()
 
     @classmethod
     def from_env(cls):
@@ -40,6 +300,7 @@ class BotConfig:
         bot_config = cls(
             telegram_token=os.getenv("TELEGRAM_BOT_TOKEN"),
             openrouter_api_key=os.getenv("OPENROUTER_API_KEY"),
+            webhook_secret=os.getenv("WEBHOOK_SECRET"),
         )
 
         # Load from config.json
@@ -56,10 +317,84 @@ class BotConfig:
                 if 'admin' in data:
                     self.admin = AdminConfig(**data['admin'])
 
+                # Load LLM config
+                if 'llm' in data:
+                    self.llm = LLMConfig(**data['llm'])
+
+                # Load model routing config
+                if 'routing' in data:
+                    self.routing = RoutingConfig(**data['routing'])
+
+                # Load reasoning config
+                if 'reasoning' in data:
+                    self.reasoning = ReasoningConfig(**data['reasoning'])
+
+                # Load LLM HTTP transport config
+                if 'http' in data:
+                    self.http = HTTPConfig(**data['http'])
+
+                # Load knowledge base context config
+                if 'retrieval' in data:
+                    self.retrieval = RetrievalConfig(**data['retrieval'])
+
+                # Load answer cache config
+                if 'cache' in data:
+                    self.cache = CacheConfig(**data['cache'])
+
+                # Load conversation memory config
+                if 'memory' in data:
+                    self.memory = MemoryConfig(**data['memory'])
+
+                # Load streaming config
+                if 'streaming' in data:
+                    self.streaming = StreamingConfig(**data['streaming'])
+
+                # Load debounce config
+                if 'debounce' in data:
+                    self.debounce = DebounceConfig(**data['debounce'])
+
+                # Load rate limit config
+                if 'rate_limit' in data:
+                    self.rate_limit = RateLimitConfig(**data['rate_limit'])
+
+                # Load usage budgets config
+                if 'usage' in data:
+                    self.usage = UsageConfig(**data['usage'])
+
+                # Load logging config
+                if 'logging' in data:
+                    self.logging = LoggingConfig(**data['logging'])
+
+                # Load interaction log config
+                if 'interactions' in data:
+                    self.interactions = InteractionLogConfig(**data['interactions'])
+
+                # Load metrics endpoint config
+                if 'metrics' in data:
+                    self.metrics = MetricsConfig(**data['metrics'])
+
+                # Load webhook config
+                if 'webhook' in data:
+                    self.webhook = WebhookConfig(**data['webhook'])
+
+                # Load FSM storage config
+                if 'fsm_storage' in data:
+                    self.fsm_storage = FSMStorageConfig(**data['fsm_storage'])
+
+                # Load multi-process mode config
+                if 'supervisor' in data:
+                    self.supervisor = SupervisorConfig(**data['supervisor'])
+
                 # Override data file if provided
                 if 'data_file' in data:
                     self.data_file = data['data_file']
 
+                if 'data_watch_interval' in data:
+                    self.data_watch_interval = data['data_watch_interval']
+
+                if 'kb_artifact' in data:
+                    self.kb_artifact = data['kb_artifact']
+
                 # Ignore legacy RAG config silently
                 if 'rag' in data:
                     logger.info("Legacy RAG config found in config.json and ignored.")
@@ -70,7 +405,26 @@ class BotConfig:
             "admin": {
                 "user_ids": self.admin.user_ids
             },
-            "data_file": self.data_file
+            "data_file": self.data_file,
+            "data_watch_interval": self.data_watch_interval,
+            "kb_artifact": self.kb_artifact,
+            "llm": asdict(self.llm),
+            "routing": asdict(self.routing),
+            "reasoning": asdict(self.reasoning),
+            "http": asdict(self.http),
+            "retrieval": asdict(self.retrieval),
+            "cache": asdict(self.cache),
+            "memory": asdict(self.memory),
+            "streaming": asdict(self.streaming),
+            "debounce": asdict(self.debounce),
+            "rate_limit": asdict(self.rate_limit),
+            "usage": asdict(self.usage),
+            "logging": asdict(self.logging),
+            "interactions": asdict(self.interactions),
+            "metrics": asdict(self.metrics),
+            "webhook": asdict(self.webhook),
+            "fsm_storage": asdict(self.fsm_storage),
+            "supervisor": asdict(self.supervisor)
         }
 
         with open(CONFIG_FILE, 'w', encoding='utf-8') as f:
@@ -82,3 +436,8 @@ class BotConfig:
             raise ValueError("TELEGRAM_BOT_TOKEN not set in .env")
         if not self.openrouter_api_key:
             raise ValueError("OPENROUTER_API_KEY not set in .env")
+        if self.webhook.enabled:
+            if not self.webhook.url:
+                raise ValueError("webhook.url not set in config.json")
+            if not self.webhook_secret:
+                raise ValueError("WEBHOOK_SECRET not set in .env")
@@ -1,107 +1,328 @@
 import sqlite3
 import logging
-from datetime import datetime
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+from storage import PRAGMAS as WRITER_PRAGMAS, BackgroundWriter, connect
 
 logger = logging.getLogger(__name__)
 
 DB_PATH = "feedback.db"
 
-
-def init_db():
+# Statements are kept as constants so sqlite3 reuses its compiled (prepared) version
+CREATE_FEEDBACK_TABLE = """
+    CREATE TABLE IF NOT EXISTS feedback (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL,
+        username TEXT,
+        first_name TEXT,
+        last_name TEXT,
+        rating TEXT NOT NULL,
+        comment TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        interaction_id TEXT
+    )
+"""
+
+# Columns added after the first release, with their definitions, for existing databases
+FEEDBACK_MIGRATIONS = (
+    ("interaction_id", "ALTER TABLE feedback ADD COLUMN interaction_id TEXT"),
+)
+
+INSERT_FEEDBACK = """
+    INSERT INTO feedback (user_id, username, first_name, last_name, rating, comment, interaction_id)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+"""
+
+CREATE_FEEDBACK_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_feedback_created_at ON feedback (created_at, id)",
+    "CREATE INDEX IF NOT EXISTS idx_feedback_rating ON feedback (rating, created_at, id)",
+)
+
+# Counters maintained by triggers, so stats never scan the feedback table
+CREATE_SUMMARY_TABLE = """
+    CREATE TABLE IF NOT EXISTS feedback_summary (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        total INTEGER NOT NULL,
+        positive INTEGER NOT NULL,
+        negative INTEGER NOT NULL
+    )
+"""
+
+BACKFILL_SUMMARY = """
+    INSERT OR IGNORE INTO feedback_summary (id, total, positive, negative)
+    SELECT
+        1,
+        COUNT(*),
+        COALESCE(SUM(CASE WHEN rating = 'positive' THEN 1 ELSE 0 END), 0),
+        COALESCE(SUM(CASE WHEN rating = 'negative' THEN 1 ELSE 0 END), 0)
+    FROM feedback
+"""
+
+CREATE_SUMMARY_TRIGGERS = (
+    """
+    CREATE TRIGGER IF NOT EXISTS feedback_summary_insert AFTER INSERT ON feedback
+    BEGIN
+        UPDATE feedback_summary SET
+            total = total + 1,
+            positive = positive + (NEW.rating = 'positive'),
+            negative = negative + (NEW.rating = 'negative')
+        WHERE id = 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS feedback_summary_delete AFTER DELETE ON feedback
+    BEGIN
+        UPDATE feedback_summary SET
+            total = total - 1,
+            positive = positive - (OLD.rating = 'positive'),
+            negative = negative - (OLD.rating = 'negative')
+        WHERE id = 1;
+    END
+    """,
+)
+
+SELECT_FEEDBACK_STATS = "SELECT total, positive, negative FROM feedback_summary WHERE id = 1"
+
+
+def _page_query(direction: Optional[str], with_rating: bool) -> str:
+    """Build keyset pagination query; pages are anchored on (created_at, id) of a boundary row"""
+    conditions = []
+    if with_rating:
+        conditions.append("rating = :rating")
+    if direction == "older":
+        conditions.append("(created_at, id) < (SELECT created_at, id FROM feedback WHERE id = :cursor)")
+    elif direction == "newer":
+        conditions.append("(created_at, id) > (SELECT created_at, id FROM feedback WHERE id = :cursor)")
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order = "ASC" if direction == "newer" else "DESC"
+    return f"SELECT * FROM feedback {where} ORDER BY created_at {order}, id {order} LIMIT :limit"
+
+
+# Separate statements per filter so the planner can always walk an index
+PAGE_QUERIES = {
+    (direction, with_rating): _page_query(direction, with_rating)
+    for direction in (None, "older", "newer")
+    for with_rating in (False, True)
+}
+
+PAGE_SIZE = 10
+
+PRAGMAS = WRITER_PRAGMAS + (
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-8000",
+)
+
+
+class FeedbackStorage:
+    """SQLite feedback storage with one long-lived connection on a dedicated thread
+
+    All database work runs on a single worker thread, so the event loop never
+    blocks on disk I/O. Inserts are buffered and written in one transaction
+    every flush_interval seconds (or as soon as batch_size rows are pending).
+    """
+
+    def __init__(self, db_path: str = DB_PATH, flush_interval: float = 0.5, batch_size: int = 100):
+        """
+        Args:
+            db_path: SQLite database file
+            flush_interval: Seconds between flushes of buffered inserts
+            batch_size: Number of pending inserts that triggers an immediate flush
+        """
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pending: List[Tuple] = []
+        self._writer = BackgroundWriter("feedback-db", self.flush, flush_interval, open=self._open, close=self._close)
+
+    def _open(self):
+        """Open connection, tune it and create schema (database thread)"""
+        self._conn = connect(self.db_path, PRAGMAS, cached_statements=64)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute(CREATE_FEEDBACK_TABLE)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(feedback)")}
+        for column, statement in FEEDBACK_MIGRATIONS:
+            if column not in columns:
+                logger.info(f"Migrating feedback table: adding column {column}")
+                self._conn.execute(statement)
+        for statement in CREATE_FEEDBACK_INDEXES:
+            self._conn.execute(statement)
+        self._conn.execute(CREATE_SUMMARY_TABLE)
+        self._conn.execute(BACKFILL_SUMMARY)
+        for statement in CREATE_SUMMARY_TRIGGERS:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _close(self):
+        self._conn.close()
+        self._conn = None
+
+    async def start(self):
+        """Open database and start the background flusher"""
+        if self._writer.started:
+            return
+        await self._writer.start()
+        logger.info("Feedback database initialized")
+
+    async def close(self):
+        """Flush pending inserts and close the database"""
+        if not self._writer.started:
+            return
+        await self._writer.stop()
+        logger.info("Feedback database closed")
+
+    def _insert_batch(self, rows: List[Tuple]) -> List[int]:
+        """Insert rows in a single transaction (database thread)"""
+        ids = []
+        with self._conn:
+            cursor = self._conn.cursor()
+            for row in rows:
+                cursor.execute(INSERT_FEEDBACK, row)
+                ids.append(cursor.lastrowid)
+        return ids
+
+    async def flush(self):
+        """Write all buffered inserts now"""
+        async with self._writer.lock:
+            if not self._pending:
+                return
+
+            rows, self._pending = self._pending, []
+            try:
+                ids = await self._writer.run(self._insert_batch, rows)
+            except Exception:
+                # Keep rows for the next attempt
+                self._pending[:0] = rows
+                raise
+
+        for row, feedback_id in zip(rows, ids):
+            logger.info(f"Saved feedback #{feedback_id} from user {row[0]}: {row[4]}")
+
+    async def save_feedback(
+        self,
+        user_id: int,
+        username: Optional[str],
+        first_name: Optional[str],
+        last_name: Optional[str],
+        rating: str,
+        comment: Optional[str] = None,
+        interaction_id: Optional[str] = None
+    ):
+        """Buffer user feedback; it is written to disk by the background flusher"""
+        self._pending.append((user_id, username, first_name, last_name, rating, comment, interaction_id))
+        if len(self._pending) >= self.batch_size:
+            await self.flush()
+
+    def _fetch_page(self, cursor: Optional[int], direction: str, rating: Optional[str], limit: int) -> Dict:
+        """Fetch one page plus one extra row to learn whether more pages exist"""
+        params = {'cursor': cursor, 'rating': rating, 'limit': limit + 1}
+
+        query = PAGE_QUERIES[(direction if cursor is not None else None, rating is not None)]
+        rows = self._conn.execute(query, params).fetchall()
+
+        has_more = len(rows) > limit
+        items = [dict(row) for row in rows[:limit]]
+
+        if cursor is not None and direction == "newer":
+            items.reverse()
+            has_newer, has_older = has_more, True
+        else:
+            has_newer, has_older = cursor is not None, has_more
+
+        return {
+            'items': items,
+            'has_newer': has_newer and bool(items),
+            'has_older': has_older and bool(items)
+        }
+
+    async def get_feedback_page(
+        self,
+        cursor: Optional[int] = None,
+        direction: str = "older",
+        rating: Optional[str] = None,
+        limit: int = PAGE_SIZE
+    ) -> Dict:
+        """
+        Get a page of feedback, newest first
+
+        Args:
+            cursor: Id of the boundary row of the current page, None for the first page
+            direction: "older" for rows after the cursor, "newer" for rows before it
+            rating: Only show "positive" or "negative" feedback
+            limit: Page size
+
+        Returns:
+            Dict with 'items', 'has_newer' and 'has_older'
+        """
+        await self.flush()
+        return await self._writer.run(self._fetch_page, cursor, direction, rating, limit)
+
+    def _fetch_stats(self) -> Dict:
+        row = self._conn.execute(SELECT_FEEDBACK_STATS).fetchone()
+        return {
+            'total': row[0],
+            'positive': row[1],
+            'negative': row[2]
+        }
+
+    async def get_feedback_stats(self) -> Dict:
+        """Get feedback statistics"""
+        await self.flush()
+        return await self._writer.run(self._fetch_stats)
+
+
+storage = FeedbackStorage()
+
+
+async def init_db():
     """Initialize feedback database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS feedback (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER NOT NULL,
-            username TEXT,
-            first_name TEXT,
-            last_name TEXT,
-            rating TEXT NOT NULL,
-            comment TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    """)
-
-    conn.commit()
-    conn.close()
-    logger.info("Feedback database initialized")
-
-
-def save_feedback(
+    await storage.start()
+
+
+async def close_db():
+    """Flush pending feedback and close database"""
+    await storage.close()
+
+
+async def save_feedback(
     user_id: int,
     username: Optional[str],
     first_name: Optional[str],
     last_name: Optional[str],
     rating: str,
-    comment: Optional[str] = None
+    comment: Optional[str] = None,
+    interaction_id: Optional[str] = None
 ):
-    """Save user feedback to database"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """Save user feedback to database, optionally linked to the answer it rates"""
+    await storage.save_feedback(user_id, username, first_name, last_name, rating, comment, interaction_id)
 
-    cursor.execute("""
-        INSERT INTO feedback (user_id, username, first_name, last_name, rating, comment)
-        VALUES (?, ?, ?, ?, ?, ?)
-    """, (user_id, username, first_name, last_name, rating, comment))
 
-    conn.commit()
-    feedback_id = cursor.lastrowid
-    conn.close()
+async def get_feedback_page(
+    cursor: Optional[int] = None,
+    direction: str = "older",
+    rating: Optional[str] = None,
+    limit: int = PAGE_SIZE
+) -> Dict:
+    """Get a page of feedback, newest first"""
+    return await storage.get_feedback_page(cursor, direction, rating, limit)
 
-    logger.info(f"Saved feedback #{feedback_id} from user {user_id}: {rating}")
-    return feedback_id
 
-
-def get_all_feedback() -> List[Dict]:
-    """Get all feedback from database"""
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT * FROM feedback
-        ORDER BY created_at DESC
-    """)
-
-    rows = cursor.fetchall()
-    conn.close()
-
-    return [dict(row) for row in rows]
+async def get_feedback_stats() -> Dict:
+    """Get feedback statistics"""
+    return await storage.get_feedback_stats()
 
 
-def get_feedback_stats() -> Dict:
-    """Get feedback statistics"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-
-    cursor.execute("""
-        SELECT
-            COUNT(*) as total,
-            SUM(CASE WHEN rating = 'positive' THEN 1 ELSE 0 END) as positive,
-            SUM(CASE WHEN rating = 'negative' THEN 1 ELSE 0 END) as negative
-        FROM feedback
-    """)
-
-    row = cursor.fetchone()
-    conn.close()
-
-    return {
-        'total': row[0],
-        'positive': row[1],
-        'negative': row[2]
-    }
-
-
-def format_feedback_list(feedback_list: List[Dict]) -> str:
-    """Format feedback list for display"""
-    if not feedback_list:
+def format_feedback_page(items: List[Dict], stats: Dict, rating: Optional[str] = None) -> str:
+    """Format a page of feedback for display"""
+    if not items:
         return "📭 Пока нет отзывов"
 
-    stats = get_feedback_stats()
+    title = "📝 Отзывы:"
+    if rating == "positive":
+        title = "📝 Положительные отзывы:"
+    elif rating == "negative":
+        title = "📝 Отрицательные отзывы:"
 
     lines = [
         "📊 Статистика отзывов:",
@@ -109,11 +330,11 @@ def format_feedback_list(feedback_list: List[Dict]) -> str:
         f"👍 Положительных: {stats['positive']}",
         f"👎 Отрицательных: {stats['negative']}",
         "",
-        "📝 Последние отзывы:",
+        title,
         ""
     ]
 
-    for fb in feedback_list[:20]:  # Показываем последние 20
+    for fb in items:
         # Format user info
         user_display = fb['username'] or f"User {fb['user_id']}"
         if fb['first_name']:
@@ -128,6 +349,8 @@ def format_feedback_list(feedback_list: List[Dict]) -> str:
         date = fb['created_at'][:16]  # YYYY-MM-DD HH:MM
 
         lines.append(f"#{fb['id']} | {rating_emoji} | {user_display} | {date}")
+        if fb['interaction_id']:
+            lines.append(f"   ↪ ответ {fb['interaction_id']}")
 
         if fb['comment']:
             # Truncate long comments
@@ -0,0 +1,338 @@
+import html
+import logging
+import re
+from typing import List, Optional, Tuple
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import Message
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+PLAIN_FALLBACKS = REGISTRY.counter("bot_answer_plain_fallbacks_total", "Answer parts resent as plain text after Telegram rejected the markup")
+ANSWER_PARTS = REGISTRY.counter("bot_answer_parts_total", "Messages the answers were split into")
+
+# Telegram limit on message text after entity parsing, in UTF-16 code units
+MESSAGE_LIMIT = 4096
+
+# Sent instead of an answer that has no visible text, which Telegram refuses to send
+EMPTY_ANSWER_TEXT = "Извините, не удалось получить ответ. Попробуйте позже."
+
+# Token: ("text", str), ("open", tag, attribute) or ("close", tag)
+Token = Tuple
+
+FENCE_RE = re.compile(r"^\s*```")
+HEADER_RE = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+BULLET_RE = re.compile(r"^(\s*)[-*+]\s+")
+SPECIAL_RE = re.compile(r"[`\[*_~]")
+LINK_RE = re.compile(r"\[([^\]\n]+)\]\((https?://[^\s)]+|tg://[^\s)]+)\)")
+
+# Longest markers first, so "**" is not read as two "*"
+EMPHASIS = (("**", "b"), ("__", "b"), ("~~", "s"), ("*", "b"), ("_", "i"))
+
+# Where to cut an over-long text, best first
+BREAKS = ("\n\n", "\n", ". ", " ")
+
+
+def _utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _can_open(text: str, i: int, marker: str) -> bool:
+    after = i + len(marker)
+    if after >= len(text) or text[after].isspace():
+        return False
+    # snake_case and 2*3*4 are not emphasis
+    return len(marker) > 1 or i == 0 or not text[i - 1].isalnum()
+
+
+def _find_closer(text: str, start: int, marker: str) -> int:
+    """Position of the marker closing emphasis opened before start, -1 if there is none"""
+    j = text.find(marker, start + 1)
+    while j != -1:
+        after = j + len(marker)
+        closes = not text[j - 1].isspace()
+        if len(marker) == 1:
+            closes = closes and (after >= len(text) or not text[after].isalnum()) and text[j - 1] != marker
+            closes = closes and (after >= len(text) or text[after] != marker)
+        if closes:
+            return j
+        j = text.find(marker, j + 1)
+    return -1
+
+
+def parse_inline(text: str) -> List[Token]:
+    """Tokens of one line: emphasis, strikethrough, inline code and links; unmatched markers stay text"""
+    tokens: List[Token] = []
+    plain: List[str] = []
+
+    def flush():
+        if plain:
+            tokens.append(("text", "".join(plain)))
+            plain.clear()
+
+    i = 0
+    while i < len(text):
+        # Copy plain text up to the next character that may start markup in one step
+        special = SPECIAL_RE.search(text, i)
+        if special is None:
+            plain.append(text[i:])
+            break
+        if special.start() > i:
+            plain.append(text[i:special.start()])
+            i = special.start()
+        char = text[i]
+
+        if char == "`":
+            end = text.find("`", i + 1)
+            if end > i + 1:
+                flush()
+                tokens += [("open", "code", None), ("text", text[i + 1:end]), ("close", "code")]
+                i = end + 1
+                continue
+
+        if char == "[":
+            match = LINK_RE.match(text, i)
+            if match:
+                flush()
+                tokens.append(("open", "a", match.group(2)))
+                tokens += parse_inline(match.group(1))
+                tokens.append(("close", "a"))
+                i = match.end()
+                continue
+
+        for marker, tag in EMPHASIS:
+            if text.startswith(marker, i) and _can_open(text, i, marker):
+                end = _find_closer(text, i + len(marker), marker)
+                if end != -1:
+                    flush()
+                    tokens.append(("open", tag, None))
+                    tokens += parse_inline(text[i + len(marker):end])
+                    tokens.append(("close", tag))
+                    i = end + len(marker)
+                    break
+        else:
+            plain.append(char)
+            i += 1
+
+    flush()
+    return tokens
+
+
+def parse_markdown(text: str) -> List[Token]:
+    """
+    Parse the Markdown dialect LLMs write into formatting tokens
+
+    Understands *bold*, **bold**, __bold__, _italic_, ~~strike~~, `code`,
+    fenced code blocks, [links](https://...), # headers (shown bold) and
+    "-"/"*" bullets (shown as "•"). Anything unbalanced is kept as text.
+
+    Args:
+        text: Answer text
+
+    Returns:
+        Tokens for render_html, render_plain and split_tokens
+    """
+    tokens: List[Token] = []
+    lines = text.split("\n")
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if i:
+            tokens.append(("text", "\n"))
+
+        if FENCE_RE.match(line):
+            # An unclosed fence runs to the end: the answer was cut off inside the block
+            end = next((j for j in range(i + 1, len(lines)) if FENCE_RE.match(lines[j])), len(lines))
+            tokens += [("open", "pre", None), ("text", "\n".join(lines[i + 1:end])), ("close", "pre")]
+            i = end + 1
+            continue
+
+        header = HEADER_RE.match(line)
+        if header:
+            tokens += [("open", "b", None), *parse_inline(header.group(1)), ("close", "b")]
+        else:
+            bullet = BULLET_RE.match(line)
+            if bullet:
+                tokens.append(("text", f"{bullet.group(1)}• "))
+                line = line[bullet.end():]
+            tokens += parse_inline(line)
+        i += 1
+
+    # Adjacent text tokens in one, so that splitting sees whole paragraphs
+    merged: List[Token] = []
+    for token in tokens:
+        if token[0] == "text" and merged and merged[-1][0] == "text":
+            merged[-1] = ("text", merged[-1][1] + token[1])
+        else:
+            merged.append(token)
+    return merged
+
+
+def _open_tag(tag: str, attribute: Optional[str]) -> str:
+    if tag == "a":
+        return f'<a href="{html.escape(attribute)}">'
+    return f"<{tag}>"
+
+
+def render_html(tokens: List[Token]) -> str:
+    """Telegram HTML with all text escaped"""
+    parts = []
+    for token in tokens:
+        if token[0] == "text":
+            parts.append(html.escape(token[1], quote=False))
+        elif token[0] == "open":
+            parts.append(_open_tag(token[1], token[2]))
+        else:
+            parts.append(f"</{token[1]}>")
+    return "".join(parts)
+
+
+def render_plain(tokens: List[Token]) -> str:
+    """Text without markup"""
+    return "".join(token[1] for token in tokens if token[0] == "text")
+
+
+def _fit(text: str, room: int) -> int:
+    """Number of leading characters of text that fit in room UTF-16 units"""
+    units = 0
+    for i, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > room:
+            return i
+    return len(text)
+
+
+def _break(text: str, end: int, minimum: int) -> int:
+    """Best natural break in text[:end] at or after minimum, 0 if there is none"""
+    for separator in BREAKS:
+        position = text.rfind(separator, minimum, end)
+        if position != -1:
+            return position + len(separator)
+    return 0
+
+
+def split_tokens(tokens: List[Token], limit: int = MESSAGE_LIMIT) -> List[List[Token]]:
+    """
+    Split tokens into messages of at most limit characters of text
+
+    Cuts at paragraph, line, sentence or word boundaries in the second half
+    of a message, or between tokens; a word is cut only when it does not fit
+    in a message at all. Formatting open at a cut is closed at the end of one
+    message and opened again at the start of the next one.
+
+    Args:
+        tokens: Parsed answer
+        limit: Maximum text length of a message
+
+    Returns:
+        Tokens of each message
+    """
+    messages: List[List[Token]] = []
+    current: List[Token] = []
+    length = 0
+    stack: List[Token] = []
+
+    def finish():
+        nonlocal current, length
+        messages.append(current + [("close", token[1]) for token in reversed(stack)])
+        current = list(stack)
+        length = 0
+
+    for token in tokens:
+        if token[0] == "open":
+            stack.append(token)
+            current.append(token)
+            continue
+        if token[0] == "close":
+            stack.pop()
+            current.append(token)
+            continue
+
+        text = token[1]
+        while text:
+            if not length:
+                text = text.lstrip()
+                if not text:
+                    break
+            room = limit - length
+            size = _utf16_len(text)
+            if size <= room:
+                current.append(("text", text))
+                length += size
+                break
+
+            end = _fit(text, room)
+            # Breaks that would leave this message less than half full don't count
+            cut = _break(text, end, max(0, limit // 2 - length))
+            if not cut:
+                if length >= limit // 2:
+                    finish()
+                    continue
+                cut = end
+            current.append(("text", text[:cut].rstrip()))
+            text = text[cut:]
+            finish()
+
+    if any(token[0] == "text" and token[1].strip() for token in current):
+        messages.append(current)
+    return messages
+
+
+def preview(text: str, limit: int = MESSAGE_LIMIT) -> str:
+    """Start of a partial answer that fits in one message, for streamed edits"""
+    if _utf16_len(text) <= limit:
+        return text
+    return text[:_fit(text, limit - 1)] + "…"
+
+
+def format_answer(text: str, limit: int = MESSAGE_LIMIT) -> List[Tuple[str, str]]:
+    """
+    Render an LLM answer for Telegram
+
+    Args:
+        text: Answer in Markdown
+        limit: Maximum text length of a message
+
+    Returns:
+        (HTML, plain text) of each message to send
+    """
+    return [(render_html(part), render_plain(part)) for part in split_tokens(parse_markdown(text), limit)]
+
+
+async def send_answer(message: Message, text: str, placeholder: Optional[Message] = None):
+    """
+    Send an answer as HTML, split into several messages if it is too long
+
+    A part that Telegram rejects is sent once more as plain text, so an
+    answer that was already generated is never lost to a markup error.
+
+    Args:
+        message: Message being answered
+        text: Answer in Markdown
+        placeholder: Message to put the first part into instead of sending a new one
+    """
+    parts = format_answer(text)
+    if not parts:
+        logger.warning("Answer has no visible text")
+        await _deliver(message, placeholder, EMPTY_ANSWER_TEXT, None)
+        return
+    ANSWER_PARTS.inc(len(parts))
+    for i, (html_text, plain_text) in enumerate(parts):
+        target = placeholder if i == 0 else None
+        try:
+            await _deliver(message, target, html_text, "HTML")
+        except TelegramBadRequest as e:
+            if "message is not modified" in str(e):
+                continue
+            PLAIN_FALLBACKS.inc()
+            logger.warning(f"Telegram rejected formatted answer, sending plain text: {e}")
+            await _deliver(message, target, plain_text, None)
+
+
+async def _deliver(message: Message, placeholder: Optional[Message], text: str, parse_mode: Optional[str]):
+    if placeholder is not None:
+        await placeholder.edit_text(text, parse_mode=parse_mode)
+    else:
+        await message.answer(text, parse_mode=parse_mode)
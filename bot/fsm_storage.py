@@ -0,0 +1,335 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from abc import abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import unquote, urlparse
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from storage import connect
+
+logger = logging.getLogger(__name__)
+
+
+class KeyValueStorage(BaseStorage):
+    """FSM storage on top of a shared key-value store with expiring records
+
+    State and data are kept under separate keys and expire after ttl_seconds,
+    so a user who abandoned the feedback flow does not stay stuck in it.
+    Reads go through a small in-process cache that lives for cache_ttl
+    seconds: handlers read the state several times per update, and the
+    short lifetime keeps processes from serving each other stale values for
+    longer than that. Writes update the cache immediately.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: Optional[float] = 3600,
+        cache_ttl: float = 1.0,
+        key_builder: Optional[KeyBuilder] = None,
+    ):
+        """
+        Args:
+            ttl_seconds: Lifetime of state and data records, None to keep them forever
+            cache_ttl: Lifetime of cached reads in seconds, 0 disables the cache
+            key_builder: Converts aiogram storage keys to strings
+        """
+        self.ttl_seconds = ttl_seconds
+        self.cache_ttl = cache_ttl
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._cache: Dict[str, Tuple[Optional[str], float]] = {}
+
+    @abstractmethod
+    async def _get(self, key: str) -> Optional[str]:
+        """Read a record, None if it is missing or expired"""
+
+    @abstractmethod
+    async def _set(self, key: str, value: str):
+        """Write a record that expires after ttl_seconds"""
+
+    @abstractmethod
+    async def _delete(self, key: str):
+        """Remove a record"""
+
+    async def _read(self, key: str) -> Optional[str]:
+        if self.cache_ttl > 0:
+            entry = self._cache.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                return entry[0]
+
+        value = await self._get(key)
+        self._remember(key, value)
+        return value
+
+    async def _write(self, key: str, value: Optional[str]):
+        if value is None:
+            await self._delete(key)
+        else:
+            await self._set(key, value)
+        self._remember(key, value)
+
+    def _remember(self, key: str, value: Optional[str]):
+        if self.cache_ttl <= 0:
+            return
+        now = time.monotonic()
+        self._cache[key] = (value, now + self.cache_ttl)
+
+        # Drop expired entries once the cache grows, so idle users don't pile up
+        if len(self._cache) > 10000:
+            self._cache = {k: v for k, v in self._cache.items() if v[1] > now}
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        value = state.state if isinstance(state, State) else state
+        await self._write(self.key_builder.build(key, "state"), value)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        return await self._read(self.key_builder.build(key, "state"))
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        value = json.dumps(data, ensure_ascii=False) if data else None
+        await self._write(self.key_builder.build(key, "data"), value)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        value = await self._read(self.key_builder.build(key, "data"))
+        return json.loads(value) if value else {}
+
+
+class SQLiteStorage(KeyValueStorage):
+    """FSM storage in a SQLite file shared by all bot processes on one host"""
+
+    def __init__(self, db_path: str = "fsm.db", **kwargs):
+        """
+        Args:
+            db_path: SQLite database file
+            **kwargs: See KeyValueStorage
+        """
+        super().__init__(**kwargs)
+        self.db_path = db_path
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-db")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._last_purge = 0.0
+
+    async def _run(self, fn, *args):
+        """Run fn on the database thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    def _connection(self) -> sqlite3.Connection:
+        """Open the connection on first use (database thread)"""
+        if self._conn is None:
+            self._conn = connect(self.db_path)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS fsm (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def _get_sync(self, key: str) -> Optional[str]:
+        row = self._connection().execute(
+            "SELECT value FROM fsm WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def _set_sync(self, key: str, value: str):
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO fsm (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, value, expires_at)
+            )
+            # Expired rows are only filtered on read; sweep them now and then
+            if now - self._last_purge > 600:
+                conn.execute("DELETE FROM fsm WHERE expires_at <= ?", (now,))
+                self._last_purge = now
+
+    def _delete_sync(self, key: str):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM fsm WHERE key = ?", (key,))
+
+    async def _get(self, key: str) -> Optional[str]:
+        return await self._run(self._get_sync, key)
+
+    async def _set(self, key: str, value: str):
+        await self._run(self._set_sync, key, value)
+
+    async def _delete(self, key: str):
+        await self._run(self._delete_sync, key)
+
+    def _close_sync(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def close(self) -> None:
+        await self._run(self._close_sync)
+        self._executor.shutdown(wait=True)
+
+
+class RespError(Exception):
+    """Error reply from a Redis-protocol server"""
+
+
+class RespClient:
+    """Minimal client for servers speaking the Redis protocol (RESP2)
+
+    Supports what FSM storage needs: one connection, commands sent one at a
+    time, reconnect after a failure. Works with Redis, Valkey, KeyDB and
+    other compatible servers.
+    """
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", timeout: float = 5.0):
+        """
+        Args:
+            url: redis://[:password@]host[:port][/db]
+            timeout: Seconds to wait for connect and for each reply
+        """
+        parsed = urlparse(url)
+        self.host = parsed.hostname or "127.0.0.1"
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip("/") or 0)
+        self.timeout = timeout
+        self._reader: Optional[asyncio.StreamReader] = None
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _encode(args: Tuple) -> bytes:
+        parts = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode("utf-8")
+            parts.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        return b"".join(parts)
+
+    async def _read_reply(self) -> Any:
+        line = await self._reader.readline()
+        if not line:
+            raise ConnectionError("Connection closed by server")
+
+        prefix, payload = line[:1], line[1:-2]
+        if prefix == b"+":
+            return payload.decode("utf-8")
+        if prefix == b"-":
+            raise RespError(payload.decode("utf-8"))
+        if prefix == b":":
+            return int(payload)
+        if prefix == b"$":
+            length = int(payload)
+            if length < 0:
+                return None
+            data = await self._reader.readexactly(length + 2)
+            return data[:-2].decode("utf-8")
+        if prefix == b"*":
+            length = int(payload)
+            if length < 0:
+                return None
+            return [await self._read_reply() for _ in range(length)]
+        raise ConnectionError(f"Unexpected reply: {line!r}")
+
+    async def _connect(self):
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(self.host, self.port), self.timeout
+        )
+        if self.password:
+            auth = ("AUTH", self.username, self.password) if self.username else ("AUTH", self.password)
+            await self._send(auth)
+        if self.db:
+            await self._send(("SELECT", self.db))
+
+    async def _send(self, args: Tuple) -> Any:
+        self._writer.write(self._encode(args))
+        await self._writer.drain()
+        return await asyncio.wait_for(self._read_reply(), self.timeout)
+
+    async def execute(self, *args) -> Any:
+        """Send one command and return its reply"""
+        async with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._writer is None:
+                        await self._connect()
+                    return await self._send(args)
+                except (ConnectionError, OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                    await self._disconnect()
+                    if attempt:
+                        raise
+                    logger.warning(f"Redis connection lost, reconnecting: {e}")
+
+    async def _disconnect(self):
+        if self._writer is not None:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except Exception:
+                pass
+        self._reader = self._writer = None
+
+    async def close(self):
+        """Close the connection"""
+        async with self._lock:
+            await self._disconnect()
+
+
+class RespStorage(KeyValueStorage):
+    """FSM storage in a Redis-compatible server shared by all bot processes"""
+
+    def __init__(self, url: str = "redis://127.0.0.1:6379/0", **kwargs):
+        """
+        Args:
+            url: Server address, redis://[:password@]host[:port][/db]
+            **kwargs: See KeyValueStorage
+        """
+        super().__init__(**kwargs)
+        self.client = RespClient(url)
+
+    async def _get(self, key: str) -> Optional[str]:
+        return await self.client.execute("GET", key)
+
+    async def _set(self, key: str, value: str):
+        args: List[Any] = ["SET", key, value]
+        if self.ttl_seconds:
+            args += ["PX", int(self.ttl_seconds * 1000)]
+        await self.client.execute(*args)
+
+    async def _delete(self, key: str):
+        await self.client.execute("DEL", key)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+def create_fsm_storage(config) -> BaseStorage:
+    """
+    Build FSM storage from config
+
+    Args:
+        config: FSMStorageConfig from config.json
+
+    Returns:
+        Storage for the dispatcher
+    """
+    if config.backend == "sqlite":
+        logger.info(f"FSM storage: SQLite ({config.db_path})")
+        return SQLiteStorage(config.db_path, ttl_seconds=config.ttl_seconds, cache_ttl=config.cache_ttl)
+    if config.backend == "redis":
+        storage = RespStorage(config.url, ttl_seconds=config.ttl_seconds, cache_ttl=config.cache_ttl)
+        logger.info(f"FSM storage: Redis protocol ({storage.client.host}:{storage.client.port}/{storage.client.db})")
+        return storage
+    if config.backend != "memory":
+        logger.warning(f"Unknown FSM storage backend '{config.backend}', using memory")
+    return MemoryStorage()
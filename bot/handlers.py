@@ -1,13 +1,27 @@
+import asyncio
 import logging
 import os
+import time
+from contextlib import suppress
+from typing import Optional
 from aiogram import Router, F
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
 from aiogram.filters import Command
 from aiogram.types import Message, FSInputFile, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from llm import OpenRouterClient
+from aiogram.utils.chat_action import ChatActionSender
+from llm import AnswerInfo, OpenRouterClient, QueueFullError, StreamInterrupted
 from bot.config import BotConfig
-from bot.feedback import save_feedback, get_all_feedback, format_feedback_list
+from bot.feedback import save_feedback, get_feedback_page, get_feedback_stats, format_feedback_page
+from bot.formatting import EMPTY_ANSWER_TEXT, preview, send_answer
+from bot.interactions import Interaction, last_interaction_id, record_interaction
+from bot.middlewares import (
+    BUSY_TEXT, DebounceMiddleware, HandlerMetricsMiddleware, LLMAdmissionMiddleware, RequestContextMiddleware
+)
+from bot.scheduler import FairScheduler, TokenBucket
+from bot.stats import format_models, format_stats
+from bot import usage
 
 logger = logging.getLogger(__name__)
 
@@ -17,6 +31,9 @@ router = Router()
 # Global variables (will be set in main.py)
 llm_client: OpenRouterClient = None
 bot_config: BotConfig = None
+admission: LLMAdmissionMiddleware = None
+handler_metrics: HandlerMetricsMiddleware = None
+debounce: DebounceMiddleware = None
 
 
 # FSM States for feedback
@@ -24,6 +41,9 @@ class FeedbackStates(StatesGroup):
     waiting_for_comment = State()
 
 
+CUT_OFF_TEXT = "⚠️ Ответ оборвался из-за ошибки. Попробуй задать вопрос еще раз."
+
+
 def set_dependencies(client: OpenRouterClient, config: BotConfig):
     """Set LLM client and config"""
     global llm_client, bot_config
@@ -42,7 +62,23 @@ async def cmd_start(message: Message):
 async def cmd_help(message: Message):
     """Handle /help command"""
     logger.info(f"User {message.from_user.id} requested help")
-    await message.answer("Просто напиши мне свой вопрос о поступлении в ШАД.")
+    text = "Просто напиши мне свой вопрос о поступлении в ШАД."
+    if llm_client.memory is not None:
+        text += " Я помню предыдущие вопросы, поэтому можно уточнять. /reset — начать разговор заново."
+    await message.answer(text)
+
+
+@router.message(Command("reset"))
+async def cmd_reset(message: Message):
+    """Forget the user's conversation history"""
+    user_id = message.from_user.id
+    logger.info(f"User {user_id} reset the conversation")
+    if llm_client.memory is None:
+        await message.answer("Я не запоминаю историю разговора: каждый вопрос обрабатывается отдельно, сбрасывать нечего.")
+    elif llm_client.reset_conversation(user_id):
+        await message.answer("Начнем заново: предыдущие вопросы я больше не учитываю.")
+    else:
+        await message.answer("Сбрасывать нечего: я пока не помню ни одного твоего вопроса.")
 
 
 @router.message(Command("myid"))
@@ -70,20 +106,153 @@ async def cmd_config(message: Message):
     logger.info(f"Admin {user_id} requested config")
 
     admins = ", ".join(str(uid) for uid in bot_config.admin.user_ids) or "не заданы"
-    model = getattr(llm_client, "model", "не задана")
+    models = " → ".join(model['model'] for model in llm_client.router.stats())
+    llm = bot_config.llm
+    retrieval = bot_config.retrieval
+
+    if retrieval.mode == "retrieval":
+        context_text = (
+            f"Бот подкладывает в промпт до {retrieval.top_k} релевантных разделов data.txt "
+            f"(не больше ~{retrieval.token_budget} токенов)."
+        )
+    else:
+        context_text = "Бот использует весь файл data.txt как контекст в системном промпте."
+
+    if llm_client.cache is not None:
+        cache_stats = llm_client.cache.stats()
+        cache_text = (
+            f"{cache_stats['size']} ответов, попаданий {cache_stats['hits']}, "
+            f"промахов {cache_stats['misses']} ({cache_stats['hit_rate']:.0%})"
+        )
+    else:
+        cache_text = "выключен"
+
+    if llm_client.inflight is not None:
+        flight_stats = llm_client.inflight.stats()
+        coalesce_text = (
+            f"{flight_stats['coalesced']} запросов присоединились к уже идущим, "
+            f"вызовов LLM: {flight_stats['upstream_calls']}"
+        )
+    else:
+        coalesce_text = "выключено"
+
+    if llm_client.memory is not None:
+        memory_text = (
+            f"{llm_client.memory.stats()['users']} разговоров, "
+            f"до ~{llm_client.memory.token_budget} токенов истории в промпте"
+        )
+    else:
+        memory_text = "выключена"
+
+    reasoning = bot_config.reasoning
+    if reasoning.mode == "auto":
+        reasoning_text = "по сложности вопроса, пороги " + ", ".join(
+            f"{effort} от {score:g}" for effort, score in reasoning.thresholds.items()
+        )
+        if reasoning.model_path:
+            reasoning_text += f", обученная модель {reasoning.model_path}"
+    else:
+        reasoning_text = {"always": "всегда", "never": "выключены"}.get(reasoning.mode, reasoning.mode)
+
+    if usage.tracker is not None:
+        budgets = usage.tracker
+        usage_text = (
+            f"на пользователя {budgets.user_daily_tokens or 'без лимита'}, "
+            f"всего {budgets.global_daily_tokens or 'без лимита'}; сегодня израсходовано {budgets.global_used()} "
+            f"(подробнее: /usage)"
+        )
+    else:
+        usage_text = "учет выключен"
+
+    if admission is not None:
+        scheduler = admission.scheduler
+        admission_text = (
+            f"занято {scheduler.active}/{scheduler.max_active}, ждут {scheduler.queue_depth}, "
+            f"ограничено по частоте {admission.rate_limited}, отклонено {admission.rejected}"
+        )
+    else:
+        admission_text = "выключено"
 
     config_text = f"""⚙️ Текущие настройки:
 
 • Файл базы знаний: {bot_config.data_file}
-• Модель OpenRouter: {model}
+• Модели OpenRouter: {models} (подробнее: /models)
+• Рассуждения модели: {reasoning_text}
 • Администраторы: {admins}
-
-Бот использует весь файл data.txt как контекст в системном промпте.
-Чтобы обновить знания, загрузите новый файл и перезапустите бота."""
+• Параллельных запросов к LLM: {llm_client.in_flight}/{llm.max_concurrency}
+• В очереди: {llm_client.queue_depth}/{llm.max_queue_size}
+• Очередь вопросов: {admission_text}
+• Дневные лимиты токенов: {usage_text}
+• Кэш ответов: {cache_text}
+• Объединение одинаковых вопросов: {coalesce_text}
+• Память разговоров: {memory_text}
+• Версия базы знаний: {llm_client.kb_version}
+
+{context_text}
+Чтобы обновить знания, загрузите новый файл: он применится сразу. /reload_data перечитывает файл с диска."""
 
     await message.answer(config_text)
 
 
+@router.message(Command("stats"))
+async def cmd_stats(message: Message):
+    """Show latency, token and queue metrics (admin only)"""
+    user_id = message.from_user.id
+
+    if not is_admin(user_id):
+        await message.answer("Эта команда доступна только администраторам.")
+        return
+
+    logger.info(f"Admin {user_id} requested stats")
+    await message.answer(format_stats(), parse_mode=None)
+
+
+@router.message(Command("models"))
+async def cmd_models(message: Message):
+    """Show model routing state and latencies (admin only)"""
+    user_id = message.from_user.id
+
+    if not is_admin(user_id):
+        await message.answer("Эта команда доступна только администраторам.")
+        return
+
+    logger.info(f"Admin {user_id} requested model stats")
+    await message.answer(format_models(llm_client.router.stats()), parse_mode=None)
+
+
+@router.message(Command("usage"))
+async def cmd_usage(message: Message):
+    """Show token usage of all users or of one user (admin only)"""
+    user_id = message.from_user.id
+
+    if not is_admin(user_id):
+        await message.answer("Эта команда доступна только администраторам.")
+        return
+
+    if usage.tracker is None:
+        await message.answer("Учет расхода токенов выключен (usage.enabled в config.json).")
+        return
+
+    parts = message.text.split()
+    if len(parts) > 2 or (len(parts) == 2 and not parts[1].isdigit()):
+        await message.answer("Использование: /usage [user_id]")
+        return
+
+    logger.info(f"Admin {user_id} requested usage")
+    try:
+        if len(parts) == 2:
+            report = await usage.tracker.user_report(int(parts[1]))
+            text = usage.format_user_usage(report, usage.tracker)
+        else:
+            report = await usage.tracker.report()
+            text = usage.format_usage(report, usage.tracker)
+        await message.answer(text, parse_mode=None)
+
+    except Exception as e:
+        logger.error(f"Error getting usage: {e}", exc_info=True)
+        await message.answer("❌ Произошла ошибка при получении расхода токенов")
+
+
 @router.message(Command("add_admin"))
 async def cmd_add_admin(message: Message):
     """Add admin user (admin only)"""
@@ -138,7 +307,7 @@ async def cmd_get_data(message: Message):
         file = FSInputFile(data_file_path)
         await message.answer_document(
             document=file,
-            caption="📄 Текущий файл базы знаний\n\nДля обновления: отправь отредактированный файл и используй /reload_data"
+            caption=f"📄 Текущий файл базы знаний (версия {llm_client.kb_version})\n\nДля обновления: отправь отредактированный файл"
         )
 
     except Exception as e:
@@ -157,14 +326,22 @@ async def cmd_reload_data(message: Message):
 
     try:
         logger.info(f"Admin {user_id} requested data reload")
-        await message.answer(
-            "⚠️ Для обновления базы знаний нужно перезапустить бота.\n\n"
-            "Отправь отредактированный data.txt, я его сохраню, а затем перезапусти бота командой в консоли."
-        )
+        old_version = llm_client.kb_version
+        new_version = await llm_client.areload_data()
 
+        if new_version == old_version:
+            await message.answer(f"ℹ️ База знаний не изменилась (версия {new_version})")
+        else:
+            await message.answer(
+                f"✅ База знаний перезагружена без перезапуска\n\n"
+                f"Версия: {old_version} → {new_version}"
+            )
+
+    except FileNotFoundError:
+        await message.answer("❌ Файл data.txt не найден, оставлена текущая версия базы знаний")
     except Exception as e:
-        logger.error(f"Error in reload_data: {e}")
-        await message.answer("Произошла ошибка")
+        logger.error(f"Error in reload_data: {e}", exc_info=True)
+        await message.answer("Произошла ошибка при перезагрузке базы знаний")
 
 
 @router.message(F.document)
@@ -206,11 +383,10 @@ async def handle_document(message: Message):
         os.replace(temp_file, target_path)
 
         logger.info(f"Admin {user_id} updated data.txt")
+        new_version = await llm_client.areload_data()
         await message.answer(
-            "✅ Файл data.txt обновлен!\n\n"
-            "⚠️ Чтобы изменения вступили в силу, перезапусти бота:\n"
-            "1. Останови бота (Ctrl+C)\n"
-            "2. Запусти снова: python main.py"
+            "✅ Файл data.txt обновлен и применен без перезапуска!\n\n"
+            f"Версия базы знаний: {new_version}"
         )
 
     except Exception as e:
@@ -243,8 +419,8 @@ async def handle_feedback_rating(callback: CallbackQuery, state: FSMContext):
     user_id = callback.from_user.id
     rating = "positive" if callback.data == "feedback_positive" else "negative"
 
-    # Save rating to state
-    await state.update_data(rating=rating)
+    # Save rating and the answer it most likely refers to
+    await state.update_data(rating=rating, interaction_id=last_interaction_id(user_id))
     await state.set_state(FeedbackStates.waiting_for_comment)
 
     rating_emoji = "👍" if rating == "positive" else "👎"
@@ -267,13 +443,14 @@ async def skip_feedback_comment(message: Message, state: FSMContext):
     rating = data.get('rating')
 
     # Save feedback without comment
-    save_feedback(
+    await save_feedback(
         user_id=user_id,
         username=message.from_user.username,
         first_name=message.from_user.first_name,
         last_name=message.from_user.last_name,
         rating=rating,
-        comment=None
+        comment=None,
+        interaction_id=data.get('interaction_id')
     )
 
     await state.clear()
@@ -290,13 +467,14 @@ async def receive_feedback_comment(message: Message, state: FSMContext):
     rating = data.get('rating')
 
     # Save feedback with comment
-    save_feedback(
+    await save_feedback(
         user_id=user_id,
         username=message.from_user.username,
         first_name=message.from_user.first_name,
         last_name=message.from_user.last_name,
         rating=rating,
-        comment=comment
+        comment=comment,
+        interaction_id=data.get('interaction_id')
     )
 
     await state.clear()
@@ -304,9 +482,31 @@ async def receive_feedback_comment(message: Message, state: FSMContext):
     logger.info(f"User {user_id} submitted feedback with comment")
 
 
+def _feedback_page_keyboard(page: dict, rating: str = None):
+    """Build newer/older navigation buttons for a feedback page"""
+    items = page['items']
+    rating_code = rating or ""
+    buttons = []
+
+    if page['has_newer']:
+        buttons.append(InlineKeyboardButton(
+            text="⬅️ Новее",
+            callback_data=f"feedback_page:newer:{items[0]['id']}:{rating_code}"
+        ))
+    if page['has_older']:
+        buttons.append(InlineKeyboardButton(
+            text="Старее ➡️",
+            callback_data=f"feedback_page:older:{items[-1]['id']}:{rating_code}"
+        ))
+
+    if not buttons:
+        return None
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
 @router.message(Command("feedback_list"))
 async def cmd_feedback_list(message: Message):
-    """Show all feedback (admin only)"""
+    """Show feedback page by page (admin only)"""
     user_id = message.from_user.id
 
     if not is_admin(user_id):
@@ -315,45 +515,222 @@ async def cmd_feedback_list(message: Message):
 
     logger.info(f"Admin {user_id} requested feedback list")
 
+    parts = message.text.split()
+    rating = parts[1] if len(parts) > 1 else None
+    if rating not in (None, "positive", "negative"):
+        await message.answer("Использование: /feedback_list [positive|negative]")
+        return
+
     try:
-        feedback_list = get_all_feedback()
-        formatted = format_feedback_list(feedback_list)
-
-        # Split long messages
-        if len(formatted) > 4000:
-            # Send in chunks
-            chunks = [formatted[i:i+4000] for i in range(0, len(formatted), 4000)]
-            for chunk in chunks:
-                await message.answer(chunk)
-        else:
-            await message.answer(formatted)
+        page = await get_feedback_page(rating=rating)
+        stats = await get_feedback_stats()
+        await message.answer(
+            format_feedback_page(page['items'], stats, rating),
+            parse_mode=None,
+            reply_markup=_feedback_page_keyboard(page, rating)
+        )
 
     except Exception as e:
         logger.error(f"Error getting feedback list: {e}", exc_info=True)
         await message.answer("❌ Произошла ошибка при получении отзывов")
 
 
-@router.message(F.text)
+@router.callback_query(F.data.startswith("feedback_page:"))
+async def handle_feedback_page(callback: CallbackQuery):
+    """Switch feedback list page (admin only)"""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("Эта команда доступна только администраторам.")
+        return
+
+    try:
+        _, direction, cursor, rating = callback.data.split(":")
+        page = await get_feedback_page(cursor=int(cursor), direction=direction, rating=rating or None)
+        stats = await get_feedback_stats()
+        await callback.message.edit_text(
+            format_feedback_page(page['items'], stats, rating or None),
+            parse_mode=None,
+            reply_markup=_feedback_page_keyboard(page, rating or None)
+        )
+        await callback.answer()
+
+    except Exception as e:
+        logger.error(f"Error switching feedback page: {e}", exc_info=True)
+        await callback.answer("❌ Произошла ошибка при получении отзывов")
+
+
+async def _edit_answer(message: Message, text: str, parse_mode=None) -> bool:
+    """Edit streamed answer message, returning False if Telegram rejected the edit"""
+    try:
+        await message.edit_text(text, parse_mode=parse_mode)
+        return True
+    except TelegramBadRequest as e:
+        if "message is not modified" in str(e):
+            return True
+        logger.warning(f"Failed to edit answer message: {e}")
+        return False
+
+
+async def stream_answer(message: Message, query: str, info: AnswerInfo) -> Optional[str]:
+    """Send answer progressively, editing a placeholder message as text arrives; returns the answer"""
+    interval = bot_config.streaming.edit_interval
+    loop = asyncio.get_running_loop()
+
+    async with ChatActionSender.typing(bot=message.bot, chat_id=message.chat.id):
+        placeholder = await message.answer("⏳ Думаю...", parse_mode=None)
+        text = ""
+        shown = ""
+        next_edit_at = 0.0
+
+        try:
+            async for chunk in llm_client.astream_answer(query, user_id=message.from_user.id, info=info):
+                text += chunk
+                now = loop.time()
+                if now < next_edit_at or text == shown:
+                    continue
+
+                # Intermediate edits are plain text: partial Markdown is often unbalanced
+                try:
+                    if await _edit_answer(placeholder, preview(text)):
+                        shown = text
+                    next_edit_at = now + interval
+                except TelegramRetryAfter as e:
+                    next_edit_at = now + e.retry_after
+
+        except QueueFullError as e:
+            logger.warning(f"Rejected question from user {message.from_user.id}: {e}")
+            await _edit_answer(placeholder, BUSY_TEXT)
+            return None
+
+        except asyncio.CancelledError:
+            # The user added to the question; the answer to the merged one replaces this
+            with suppress(TelegramBadRequest):
+                await placeholder.delete()
+            raise
+
+        except StreamInterrupted as e:
+            logger.warning(f"Answer for user {message.from_user.id} was cut off: {e}")
+            if not text.strip():
+                await _edit_answer(placeholder, EMPTY_ANSWER_TEXT)
+                return None
+            await send_answer(message, text, placeholder=placeholder)
+            await message.answer(CUT_OFF_TEXT, parse_mode=None)
+            return text
+
+        if not text.strip():
+            await _edit_answer(placeholder, EMPTY_ANSWER_TEXT)
+            return None
+
+        await send_answer(message, text, placeholder=placeholder)
+        return text
+
+
+def log_interaction(user_id: int, query: str, answer: str, info: AnswerInfo, started: float):
+    """Queue the question and answer for the interaction log"""
+    record_interaction(Interaction(
+        user_id=user_id,
+        question=query,
+        answer=answer,
+        source=info.source,
+        model=info.model,
+        kb_version=info.kb_version,
+        latency_ms=round((time.perf_counter() - started) * 1000, 1),
+        prompt_tokens=info.prompt_tokens,
+        completion_tokens=info.completion_tokens
+    ))
+
+
+async def answer_over_budget(message: Message, query: str, scope: str, started: float):
+    """Answer from cache if possible once a daily budget is used up, otherwise refuse politely"""
+    user_id = message.from_user.id
+    cached = llm_client.cached_answer(query) if bot_config.usage.cache_fallback else None
+    if cached is None:
+        logger.info(f"Refused question from user {user_id}: {scope} daily budget used up")
+        await message.answer(usage.BUDGET_TEXTS[scope], parse_mode=None)
+        return
+
+    logger.info(f"Answered user {user_id} from cache: {scope} daily budget used up")
+    await send_answer(message, cached)
+    log_interaction(user_id, query, cached, AnswerInfo(source="cache", kb_version=llm_client.kb_version), started)
+
+
+@router.message(F.text, flags={"llm": True, "debounce": True})
 async def handle_question(message: Message):
     """Handle user questions"""
     user_id = message.from_user.id
     query = message.text
 
     logger.info(f"User {user_id} asked: {query}")
+    started = time.perf_counter()
+    info = AnswerInfo()
+
+    scope = usage.check_budget(user_id, exempt=is_admin(user_id))
+    if scope is not None:
+        await answer_over_budget(message, query, scope, started)
+        return
 
     try:
-        answer = llm_client.generate_answer(query)
+        if bot_config.streaming.enabled:
+            answer = await stream_answer(message, query, info)
+            if answer is not None:
+                log_interaction(user_id, query, answer, info, started)
+            logger.info(f"Streamed answer for user {user_id}")
+            return
+
+        answer = await llm_client.agenerate_answer(query, user_id=user_id, info=info)
         logger.info(f"Generated answer for user {user_id}")
+        if not answer.strip():
+            await message.answer(EMPTY_ANSWER_TEXT, parse_mode=None)
+            return
 
         # Send answer
-        await message.answer(answer)
+        await send_answer(message, answer)
+        log_interaction(user_id, query, answer, info, started)
+
+    except QueueFullError as e:
+        logger.warning(f"Rejected question from user {user_id}: {e}")
+        await message.answer(BUSY_TEXT)
 
     except Exception as e:
         logger.error(f"Error handling question from user {user_id}: {e}", exc_info=True)
         await message.answer("Извините, произошла ошибка. Попробуйте позже.")
 
+    finally:
+        # Tokens count even if the answer was not delivered
+        usage.record_usage(user_id, info.prompt_tokens, info.completion_tokens)
+
+
+async def close_debounce():
+    """Answer messages still waiting for the debounce timer, on shutdown"""
+    if debounce is not None:
+        await debounce.close()
+
 
 def register_handlers(dp):
     """Register all handlers"""
+    global admission, handler_metrics, debounce
+
+    # Merges fragments before metrics and admission see them
+    if bot_config.debounce.enabled and debounce is None:
+        debounce = DebounceMiddleware(window=bot_config.debounce.window, max_wait=bot_config.debounce.max_wait)
+        router.message.middleware(debounce)
+
+    if handler_metrics is None:
+        handler_metrics = HandlerMetricsMiddleware()
+        router.message.middleware(handler_metrics)
+        router.callback_query.middleware(handler_metrics)
+
+    rate_limit = bot_config.rate_limit
+    if rate_limit.enabled and admission is None:
+        admission = LLMAdmissionMiddleware(
+            scheduler=FairScheduler(
+                max_active=bot_config.llm.max_concurrency,
+                max_queue_size=rate_limit.max_queue_size
+            ),
+            buckets=TokenBucket(rate=rate_limit.per_user_rate, burst=rate_limit.per_user_burst),
+            is_admin=is_admin
+        )
+        router.message.middleware(admission)
+
+    dp.update.outer_middleware(RequestContextMiddleware())
     dp.include_router(router)
     logger.info("Handlers registered")
@@ -0,0 +1,249 @@
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field
+from typing import Deque, List, Optional
+
+from metrics import REGISTRY
+from storage import BackgroundWriter, connect
+
+logger = logging.getLogger(__name__)
+
+INTERACTIONS_WRITTEN = REGISTRY.counter("bot_interactions_written_total", "Interactions written to the log")
+INTERACTIONS_DROPPED = REGISTRY.counter("bot_interactions_dropped_total", "Interactions dropped because the log fell behind")
+INTERACTIONS_PENDING = REGISTRY.gauge("bot_interactions_pending", "Interactions waiting to be written")
+
+CREATE_INTERACTIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS interactions (
+        id TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        question TEXT NOT NULL,
+        answer TEXT NOT NULL,
+        source TEXT NOT NULL,
+        model TEXT,
+        kb_version TEXT,
+        latency_ms REAL NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        created_at REAL NOT NULL
+    )
+"""
+
+CREATE_INTERACTIONS_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_interactions_created_at ON interactions (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_interactions_user ON interactions (user_id, created_at)",
+)
+
+INSERT_INTERACTION = """
+    INSERT OR IGNORE INTO interactions (
+        id, user_id, question, answer, source, model, kb_version,
+        latency_ms, prompt_tokens, completion_tokens, created_at
+    ) VALUES (
+        :id, :user_id, :question, :answer, :source, :model, :kb_version,
+        :latency_ms, :prompt_tokens, :completion_tokens, :created_at
+    )
+"""
+
+
+def new_interaction_id() -> str:
+    """Unique id known before the row is written, so feedback can refer to it right away"""
+    return uuid.uuid4().hex
+
+
+@dataclass
+class Interaction:
+    """One question and the answer the bot sent"""
+    user_id: int
+    question: str
+    answer: str
+    source: str  # "llm", "cache", "coalesced" or "error"
+    model: Optional[str] = None
+    kb_version: Optional[str] = None
+    latency_ms: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    id: str = field(default_factory=new_interaction_id)
+    created_at: float = field(default_factory=time.time)
+
+
+class InteractionLog:
+    """Append-only log of interactions written in batches by a background task
+
+    record() only appends to an in-memory buffer, so handlers never wait for
+    disk. The buffer is written every flush_interval seconds, or sooner once
+    batch_size interactions are pending, as one SQLite transaction or one
+    JSONL write. If the disk can't keep up, the oldest unwritten interactions
+    are dropped once max_pending is reached.
+    """
+
+    def __init__(
+        self,
+        backend: str = "sqlite",
+        path: str = "interactions.db",
+        flush_interval: float = 1.0,
+        batch_size: int = 200,
+        max_pending: int = 10000,
+        remember_users: int = 10000,
+    ):
+        """
+        Args:
+            backend: "sqlite" or "jsonl"
+            path: Database or JSONL file
+            flush_interval: Seconds between writes
+            batch_size: Pending interactions that trigger an early write
+            max_pending: Buffer limit; older interactions are dropped beyond it
+            remember_users: Users whose last interaction id is kept for feedback
+        """
+        if backend not in ("sqlite", "jsonl"):
+            raise ValueError(f"Unknown interaction log backend: {backend}")
+
+        self.backend = backend
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.remember_users = remember_users
+        self._pending: Deque[Interaction] = deque()
+        self._last_ids: "OrderedDict[int, str]" = OrderedDict()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._file = None
+        self._writer = BackgroundWriter("interactions", self.flush, flush_interval, open=self._open, close=self._close)
+        REGISTRY.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        INTERACTIONS_PENDING.set(len(self._pending))
+
+    def _open(self):
+        """Open the database or file (writer thread)"""
+        if self.backend == "jsonl":
+            self._file = open(self.path, "a", encoding="utf-8")
+            return
+
+        self._conn = connect(self.path)
+        self._conn.execute(CREATE_INTERACTIONS_TABLE)
+        for statement in CREATE_INTERACTIONS_INDEXES:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def start(self):
+        """Open storage and start the background writer"""
+        if self._writer.started:
+            return
+        await self._writer.start()
+        logger.info(f"Interaction log: {self.backend} ({self.path})")
+
+    async def close(self):
+        """Write pending interactions and close storage"""
+        if not self._writer.started:
+            return
+        await self._writer.stop()
+        logger.info("Interaction log closed")
+
+    def record(self, interaction: Interaction) -> str:
+        """
+        Queue an interaction for writing without waiting
+
+        Args:
+            interaction: Question and answer to log
+
+        Returns:
+            Interaction id
+        """
+        self._pending.append(interaction)
+        if len(self._pending) > self.max_pending:
+            self._pending.popleft()
+            INTERACTIONS_DROPPED.inc()
+
+        self._last_ids[interaction.user_id] = interaction.id
+        self._last_ids.move_to_end(interaction.user_id)
+        if len(self._last_ids) > self.remember_users:
+            self._last_ids.popitem(last=False)
+
+        if len(self._pending) >= self.batch_size:
+            self._writer.wake()
+        return interaction.id
+
+    def last_id(self, user_id: int) -> Optional[str]:
+        """Id of the user's latest interaction in this process, if still remembered"""
+        return self._last_ids.get(user_id)
+
+    def _write_batch(self, rows: List[dict]):
+        """Write rows in one transaction or one file write (writer thread)"""
+        if self.backend == "jsonl":
+            self._file.write("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows))
+            self._file.flush()
+            return
+
+        with self._conn:
+            self._conn.executemany(INSERT_INTERACTION, rows)
+
+    async def flush(self):
+        """Write all buffered interactions now"""
+        async with self._writer.lock:
+            if not self._pending:
+                return
+
+            batch = list(self._pending)
+            self._pending.clear()
+            try:
+                await self._writer.run(self._write_batch, [asdict(interaction) for interaction in batch])
+            except Exception:
+                # Keep rows for the next attempt, within the buffer limit
+                self._pending.extendleft(reversed(batch[-self.max_pending:]))
+                while len(self._pending) > self.max_pending:
+                    self._pending.popleft()
+                    INTERACTIONS_DROPPED.inc()
+                raise
+
+        INTERACTIONS_WRITTEN.inc(len(batch))
+
+
+log: Optional[InteractionLog] = None
+
+
+async def init_interaction_log(config):
+    """Start the interaction log described by InteractionLogConfig, if enabled"""
+    global log
+    if not config.enabled:
+        return
+    log = InteractionLog(
+        backend=config.backend,
+        path=config.path,
+        flush_interval=config.flush_interval,
+        batch_size=config.batch_size,
+        max_pending=config.max_pending
+    )
+    await log.start()
+
+
+async def close_interaction_log():
+    """Write pending interactions and stop the log"""
+    global log
+    if log is not None:
+        await log.close()
+        log = None
+
+
+def record_interaction(interaction: Interaction) -> Optional[str]:
+    """Queue an interaction; returns its id, None if logging is disabled"""
+    if log is None:
+        return None
+    return log.record(interaction)
+
+
+def last_interaction_id(user_id: int) -> Optional[str]:
+    """Id of the user's latest logged interaction, None if unknown"""
+    if log is None:
+        return None
+    return log.last_id(user_id)
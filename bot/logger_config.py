@@ -1,37 +1,193 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+import random
 import sys
+import time
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+from typing import Dict, Optional
 
+# Id of the Telegram update being processed, attached to every log record
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
 
-def setup_logging(level=logging.INFO):
+# Record attributes that are part of logging itself and not user-supplied extras
+STANDARD_RECORD_ATTRS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime", "request_id"}
+
+_listener: Optional[QueueListener] = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Add current request id to log records"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a share of records below WARNING for configured loggers"""
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+
+        name = record.name
+        while name:
+            if name in self.rates:
+                return random.random() < self.rates[name]
+            name = name.rpartition(".")[0]
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as JSON lines, including request id and extra fields"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(record.created)) + f".{int(record.msecs):03d}",
+            "level": record.levelname,
+            "logger": record.name,
+            "request_id": getattr(record, "request_id", "-"),
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in STANDARD_RECORD_ATTRS:
+                data[key] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        if record.stack_info:
+            data["stack_info"] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SizedTimedRotatingFileHandler(TimedRotatingFileHandler):
+    """Rotate log file on schedule and also when it grows over max_bytes"""
+
+    def __init__(self, filename: str, max_bytes: int = 0, **kwargs):
+        super().__init__(filename, **kwargs)
+        self.max_bytes = max_bytes
+
+    def shouldRollover(self, record: logging.LogRecord) -> int:
+        if super().shouldRollover(record):
+            return 1
+        # Checked against the current size only, so records are not formatted twice
+        if self.max_bytes > 0 and self.stream is not None and self.stream.tell() >= self.max_bytes:
+            return 1
+        return 0
+
+    def rotation_filename(self, default_name: str) -> str:
+        # Several size rollovers can happen within one time interval: number them
+        name = super().rotation_filename(default_name)
+        counter = 1
+        candidate = name
+        while os.path.exists(candidate):
+            candidate = f"{name}.{counter}"
+            counter += 1
+        return candidate
+
+
+class TracebackQueueHandler(QueueHandler):
+    """Queue handler that keeps the traceback apart from the message for the listener's formatters"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() merges the traceback into msg and drops exc_info,
+        # which leaves JsonFormatter nothing to put into its exc_info field
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def setup_logging(level=logging.INFO, config=None):
     """
     Configure logging for the entire application
 
+    Records are put into an in-memory queue by the calling thread and written
+    to console and file by a background listener thread, so disk I/O never
+    happens on the event loop.
+
     Args:
-        level: Logging level (default: INFO)
+        level: Logging level (default: INFO), overridden by config.level
+        config: Optional LoggingConfig from config.json
     """
-    # Create formatter
-    formatter = logging.Formatter(
-        fmt='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    global _listener
+
+    if config is not None:
+        level = logging.getLevelName(config.level.upper())
+
+    text_formatter = logging.Formatter(
+        fmt='%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] %(message)s',
         datefmt='%Y-%m-%d %H:%M:%S'
     )
+    file_formatter = text_formatter
+    if config is not None and config.format == "json":
+        file_formatter = JsonFormatter()
 
     # Console handler
     console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
+    console_handler.setFormatter(text_formatter)
+
+    # File handler with size- and time-based rotation
+    file_handler = SizedTimedRotatingFileHandler(
+        config.file if config is not None else 'bot.log',
+        max_bytes=config.max_bytes if config is not None else 10 * 1024 * 1024,
+        when=config.rotate_when if config is not None else 'midnight',
+        backupCount=config.backup_count if config is not None else 7,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(file_formatter)
+
+    # Queue handler on the root logger, real handlers on the listener thread
+    log_queue = queue.SimpleQueue()
+    queue_handler = TracebackQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter())
+    if config is not None and config.sampling:
+        queue_handler.addFilter(SamplingFilter(config.sampling))
 
-    # File handler
-    file_handler = logging.FileHandler('bot.log', encoding='utf-8')
-    file_handler.setFormatter(formatter)
+    if _listener is not None:
+        _listener.stop()
+    _listener = QueueListener(log_queue, console_handler, file_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
 
     # Root logger
     root_logger = logging.getLogger()
     root_logger.setLevel(level)
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
+    for handler in list(root_logger.handlers):
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(queue_handler)
 
     # Suppress noisy loggers
     logging.getLogger('httpx').setLevel(logging.WARNING)
     logging.getLogger('httpcore').setLevel(logging.WARNING)
     logging.getLogger('aiogram').setLevel(logging.INFO)
 
+    # Per-module levels from config
+    if config is not None:
+        for name, module_level in config.levels.items():
+            logging.getLogger(name).setLevel(module_level.upper())
+
     logging.info("Logging configured successfully")
+
+
+def stop_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
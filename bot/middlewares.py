@@ -0,0 +1,247 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.dispatcher.flags import get_flag
+from aiogram.types import Message, Update
+
+from bot.logger_config import request_id_var
+from bot.scheduler import FairScheduler, SchedulerFullError, TokenBucket
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HANDLER_DURATION = REGISTRY.histogram("bot_handler_duration_seconds", "Time spent in update handlers")
+HANDLER_ERRORS = REGISTRY.counter("bot_handler_errors_total", "Exceptions raised by update handlers")
+ADMISSION_REJECTS = REGISTRY.counter("bot_admission_rejects_total", "Questions refused by admission control")
+SCHEDULER_ACTIVE = REGISTRY.gauge("bot_scheduler_active", "Questions holding an LLM scheduler slot")
+SCHEDULER_QUEUE_DEPTH = REGISTRY.gauge("bot_scheduler_queue_depth", "Questions waiting for an LLM scheduler slot")
+DEBOUNCE_MERGED = REGISTRY.counter("bot_debounce_merged_messages_total", "Messages merged into a later message of the same user")
+DEBOUNCE_CANCELLED = REGISTRY.counter("bot_debounce_cancelled_answers_total", "Answers cancelled because the user sent another message")
+
+RATE_LIMITED_TEXT = "Ты пишешь слишком часто 🙂 Подожди немного и спроси еще раз."
+BUSY_TEXT = "Сейчас слишком много вопросов 🙏 Попробуй еще раз через минуту."
+
+
+class RequestContextMiddleware(BaseMiddleware):
+    """Tag all log records of an update with its id and log how long it took"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Update, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        token = request_id_var.set(str(event.update_id))
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            logger.debug(
+                f"Update {event.update_id} ({event.event_type}) handled in {latency_ms:.0f} ms",
+                extra={"latency_ms": round(latency_ms, 1), "event_type": event.event_type}
+            )
+            request_id_var.reset(token)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Record latency and errors of every handler, labelled by handler name"""
+
+    async def __call__(
+        self,
+        handler: Callable[[Any, Dict[str, Any]], Awaitable[Any]],
+        event: Any,
+        data: Dict[str, Any],
+    ) -> Any:
+        handler_object = data.get("handler")
+        name = handler_object.callback.__name__ if handler_object is not None else "unknown"
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(time.perf_counter() - started, handler=name)
+
+
+class LLMAdmissionMiddleware(BaseMiddleware):
+    """Admission control for handlers flagged with {"llm": True}
+
+    Applies per-user token buckets and runs the handler inside a fair scheduler
+    slot. Admins skip the rate limit and are scheduled first.
+    """
+
+    def __init__(
+        self,
+        scheduler: FairScheduler,
+        buckets: TokenBucket,
+        is_admin: Callable[[int], bool],
+    ):
+        self.scheduler = scheduler
+        self.buckets = buckets
+        self.is_admin = is_admin
+        self.rate_limited = 0
+        self.rejected = 0
+        REGISTRY.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        """Refresh scheduler gauges before metrics are read"""
+        SCHEDULER_ACTIVE.set(self.scheduler.active)
+        SCHEDULER_QUEUE_DEPTH.set(self.scheduler.queue_depth)
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not get_flag(data, "llm"):
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        admin = self.is_admin(user_id)
+
+        if not admin and not self.buckets.consume(user_id):
+            self.rate_limited += 1
+            ADMISSION_REJECTS.inc(reason="rate_limited")
+            logger.info(f"Rate limited user {user_id}")
+            await event.answer(RATE_LIMITED_TEXT)
+            return None
+
+        try:
+            await self.scheduler.acquire(user_id, priority=admin)
+        except SchedulerFullError as e:
+            self.rejected += 1
+            ADMISSION_REJECTS.inc(reason="queue_full")
+            logger.warning(f"Rejected message from user {user_id}: {e}")
+            await event.answer(BUSY_TEXT)
+            return None
+
+        try:
+            return await handler(event, data)
+        finally:
+            self.scheduler.release()
+
+
+@dataclass
+class _Burst:
+    """Messages of one user that are answered together"""
+    started: float  # loop time of the first message not answered yet
+    messages: List[Message] = field(default_factory=list)
+    timer: Optional[asyncio.TimerHandle] = None  # starts the handler once the user stops typing
+    task: Optional[asyncio.Task] = None  # handler answering the burst
+    handler: Optional[Callable[[Message, Dict[str, Any]], Awaitable[Any]]] = None  # of the last message
+    data: Dict[str, Any] = field(default_factory=dict)  # handler data of the last message
+    finished: asyncio.Event = field(default_factory=asyncio.Event)  # set when every message is answered
+
+
+class DebounceMiddleware(BaseMiddleware):
+    """Merge quick consecutive messages of a user for handlers flagged with {"debounce": True}
+
+    A message does not reach the handler right away: it starts a `window`
+    seconds timer and the middleware returns, so webhook workers are not held
+    while the user types. If the same user sends another message meanwhile,
+    the timer starts over, and when it fires the handler runs in a background
+    task with the last message carrying the text of the whole burst. A message
+    that arrives while the answer to a burst is still being generated cancels
+    that answer, and the next one covers the earlier messages too. A burst
+    waits at most max_wait seconds in total.
+
+    Register it before the other message middlewares, so that rate limits and
+    scheduler slots apply to merged questions rather than to each fragment.
+    """
+
+    def __init__(self, window: float = 1.0, max_wait: float = 4.0):
+        """
+        Args:
+            window: Seconds to wait for the next message of the same user
+            max_wait: Longest delay from the first message of a burst to the handler
+        """
+        self.window = window
+        self.max_wait = max_wait
+        self._bursts: Dict[int, _Burst] = {}
+
+    @staticmethod
+    def merge(messages: List[Message]) -> Message:
+        """Copy of the last message with the texts of all of them, one per line"""
+        if len(messages) == 1:
+            return messages[0]
+        text = "\n".join(message.text for message in messages)
+        return messages[-1].model_copy(update={"text": text, "entities": None})
+
+    async def __call__(
+        self,
+        handler: Callable[[Message, Dict[str, Any]], Awaitable[Any]],
+        event: Message,
+        data: Dict[str, Any],
+    ) -> Any:
+        if not get_flag(data, "debounce") or self.window <= 0 or not event.text:
+            return await handler(event, data)
+
+        user_id = event.from_user.id
+        loop = asyncio.get_running_loop()
+        burst = self._bursts.get(user_id)
+        if burst is None:
+            burst = self._bursts[user_id] = _Burst(started=loop.time())
+        elif not burst.messages:
+            burst.started = loop.time()
+        burst.messages.append(event)
+        burst.handler = handler
+        burst.data = data
+
+        if burst.timer is not None:
+            # The message waiting for this timer is answered together with this one
+            burst.timer.cancel()
+            DEBOUNCE_MERGED.inc()
+        if burst.task is not None and not burst.task.done():
+            burst.task.cancel()
+            DEBOUNCE_CANCELLED.inc()
+            logger.info(f"User {user_id} added to the question, cancelling the answer in progress")
+
+        delay = min(self.window, max(0.0, burst.started + self.max_wait - loop.time()))
+        burst.timer = loop.call_later(delay, self._start, user_id, burst)
+        return None
+
+    def _start(self, user_id: int, burst: _Burst):
+        """Run the handler for everything the user has sent so far"""
+        burst.timer = None
+        messages = list(burst.messages)
+        if len(messages) > 1:
+            logger.info(f"Merged {len(messages)} messages of user {user_id} into one question")
+        task = asyncio.create_task(burst.handler(self.merge(messages), burst.data))
+        burst.task = task
+        task.add_done_callback(lambda done: self._answered(user_id, burst, done, len(messages)))
+
+    def _answered(self, user_id: int, burst: _Burst, task: asyncio.Task, count: int):
+        """Forget answered messages and the burst itself once nothing is pending"""
+        if not task.cancelled():
+            del burst.messages[:count]
+            if task.exception() is not None:
+                logger.error(f"Debounced handler for user {user_id} failed", exc_info=task.exception())
+        if burst.task is task:
+            burst.task = None
+        if burst.timer is None and burst.task is None:
+            # Left over only if the answer was cancelled from outside, e.g. on shutdown
+            burst.messages.clear()
+            burst.finished.set()
+            if self._bursts.get(user_id) is burst:
+                del self._bursts[user_id]
+
+    async def wait(self, user_id: int):
+        """Wait until every message the user has sent so far is answered"""
+        burst = self._bursts.get(user_id)
+        if burst is not None:
+            await burst.finished.wait()
+
+    async def close(self):
+        """Answer bursts still waiting for their timer right away and wait for all answers"""
+        for user_id, burst in list(self._bursts.items()):
+            if burst.timer is not None:
+                burst.timer.cancel()
+                self._start(user_id, burst)
+        await asyncio.gather(*(burst.finished.wait() for burst in list(self._bursts.values())))
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SchedulerFullError(Exception):
+    """Raised when the LLM waiting queue is full"""
+
+
+class TokenBucket:
+    """Per-user token buckets: each user gets `burst` requests, refilled at `rate` per second"""
+
+    def __init__(self, rate: float, burst: int, max_users: int = 10000):
+        """
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity
+            max_users: Number of tracked users after which idle full buckets are dropped
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_users = max_users
+        self._buckets: Dict[int, Tuple[float, float]] = {}
+
+    def _refill(self, tokens: float, updated_at: float, now: float) -> float:
+        return min(self.burst, tokens + (now - updated_at) * self.rate)
+
+    def consume(self, user_id: int) -> bool:
+        """Take one token for the user, returning False if the bucket is empty"""
+        now = time.monotonic()
+        tokens, updated_at = self._buckets.get(user_id, (self.burst, now))
+        tokens = self._refill(tokens, updated_at, now)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[user_id] = (tokens, now)
+
+        if len(self._buckets) > self.max_users:
+            self._prune(now)
+        return allowed
+
+    def _prune(self, now: float):
+        """Forget users whose buckets are already full again"""
+        for user_id, (tokens, updated_at) in list(self._buckets.items()):
+            if self._refill(tokens, updated_at, now) >= self.burst:
+                del self._buckets[user_id]
+
+
+class FairScheduler:
+    """Limits simultaneous LLM work and hands out free slots round-robin across users
+
+    Every user has their own FIFO queue; when a slot frees up, the next user in
+    turn gets it, so one user sending many messages can not starve others.
+    Priority users (admins) are always served before everyone else.
+    """
+
+    def __init__(self, max_active: int = 8, max_queue_size: int = 64):
+        """
+        Args:
+            max_active: Number of requests allowed to run at the same time
+            max_queue_size: Number of requests allowed to wait for a slot
+        """
+        self.max_active = max_active
+        self.max_queue_size = max_queue_size
+        self._active = 0
+        self._waiting = 0
+        self._priority_queues: "OrderedDict[int, deque]" = OrderedDict()
+        self._queues: "OrderedDict[int, deque]" = OrderedDict()
+
+    @property
+    def active(self) -> int:
+        """Number of requests holding a slot"""
+        return self._active
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of requests waiting for a slot"""
+        return self._waiting
+
+    async def acquire(self, user_id: int, priority: bool = False):
+        """
+        Take an LLM slot, waiting for the user's turn if all slots are busy
+
+        Args:
+            user_id: Telegram user id
+            priority: Serve before regular users
+
+        Raises:
+            SchedulerFullError: If the waiting queue is full
+        """
+        if self._active < self.max_active and self._waiting == 0:
+            self._active += 1
+        else:
+            await self._wait_for_slot(user_id, priority)
+
+    def release(self):
+        """Return a slot taken by acquire()"""
+        self._active -= 1
+        self._grant_next()
+
+    @asynccontextmanager
+    async def slot(self, user_id: int, priority: bool = False):
+        """Hold an LLM slot for the duration of the block"""
+        await self.acquire(user_id, priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def _wait_for_slot(self, user_id: int, priority: bool):
+        """Queue the caller and wait until _grant_next hands it a slot"""
+        if self._waiting >= self.max_queue_size:
+            raise SchedulerFullError(f"LLM queue is full ({self._waiting} waiting)")
+
+        queues = self._priority_queues if priority else self._queues
+        future = asyncio.get_running_loop().create_future()
+        queues.setdefault(user_id, deque()).append(future)
+        self._waiting += 1
+
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was granted right before cancellation, pass it on
+                self.release()
+            else:
+                self._remove(queues, user_id, future)
+            raise
+
+    def _remove(self, queues: "OrderedDict[int, deque]", user_id: int, future: asyncio.Future):
+        """Drop a cancelled waiter from its queue"""
+        user_queue = queues.get(user_id)
+        if user_queue is None or future not in user_queue:
+            return
+        user_queue.remove(future)
+        self._waiting -= 1
+        if not user_queue:
+            del queues[user_id]
+
+    def _pop_next(self):
+        """Take the next waiter: priority users first, then round-robin over users"""
+        for queues in (self._priority_queues, self._queues):
+            if not queues:
+                continue
+            user_id, user_queue = next(iter(queues.items()))
+            future = user_queue.popleft()
+            if user_queue:
+                queues.move_to_end(user_id)
+            else:
+                del queues[user_id]
+            self._waiting -= 1
+            return future
+        return None
+
+    def _grant_next(self):
+        """Hand free slots to waiting requests"""
+        while self._active < self.max_active:
+            future = self._pop_next()
+            if future is None:
+                return
+            if future.done():
+                continue
+            self._active += 1
+            future.set_result(None)
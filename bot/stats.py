@@ -0,0 +1,140 @@
+from typing import Dict, List, Optional
+
+from metrics import REGISTRY, Registry
+from metrics.registry import quantile_from_buckets
+
+
+def _ms(value: Optional[float]) -> str:
+    """Format seconds as milliseconds"""
+    return "—" if value is None else f"{value * 1000:.0f} мс"
+
+
+def _histogram_groups(registry: Registry, name: str, label: str, title: str) -> Dict[str, Dict]:
+    """Histogram series merged by the value of one label (all into `title` if label is empty)"""
+    histogram = registry.get(name)
+    if histogram is None:
+        return {}
+
+    groups: Dict[str, Dict] = {}
+    for key, series in histogram.samples().items():
+        value = dict(key).get(label, title) if label else title
+        group = groups.setdefault(value, {"counts": [0] * len(series["counts"]), "sum": 0.0, "count": 0})
+        group["counts"] = [a + b for a, b in zip(group["counts"], series["counts"])]
+        group["sum"] += series["sum"]
+        group["count"] += series["count"]
+    return groups
+
+
+def _histogram_line(registry: Registry, name: str, caption: str, series: Dict) -> str:
+    """Count, p50 and p95 of a histogram series"""
+    buckets = registry.get(name).buckets
+    p50 = quantile_from_buckets(buckets, series, 0.5)
+    p95 = quantile_from_buckets(buckets, series, 0.95)
+    return f"• {caption}: {series['count']} шт., p50 {_ms(p50)}, p95 {_ms(p95)}"
+
+
+def _histogram_lines(registry: Registry, name: str, label: str, title: str):
+    """One line per label value, other labels merged: count, p50 and p95"""
+    groups = _histogram_groups(registry, name, label, title)
+    return [_histogram_line(registry, name, value, series) for value, series in sorted(groups.items())]
+
+
+def _counter_total(registry: Registry, name: str, **match) -> float:
+    """Sum counter values over label sets that contain all `match` labels"""
+    counter = registry.get(name)
+    if counter is None:
+        return 0
+
+    total = 0
+    for key, value in counter.samples().items():
+        labels = dict(key)
+        if all(labels.get(k) == v for k, v in match.items()):
+            total += value
+    return total
+
+
+REASONING_CAPTIONS = {
+    "off": "без рассуждения",
+    "low": "рассуждение low",
+    "medium": "рассуждение medium",
+    "high": "рассуждение high",
+    "on": "рассуждение всегда",
+}
+
+
+def format_stats(registry: Registry = REGISTRY) -> str:
+    """Format metrics summary for the /stats command"""
+    registry.collect()
+
+    lines = ["📈 Статистика с момента запуска", "", "Обработчики:"]
+    lines.extend(_histogram_lines(registry, "bot_handler_duration_seconds", "handler", "") or ["• нет данных"])
+
+    lines += ["", "LLM:"]
+    lines.extend(_histogram_lines(registry, "llm_request_duration_seconds", "mode", "") or ["• запросов не было"])
+    lines.extend(_histogram_lines(registry, "llm_time_to_first_token_seconds", "", "первый токен"))
+    lines.extend(_histogram_lines(registry, "llm_queue_wait_seconds", "", "ожидание слота"))
+
+    prompt_tokens = _counter_total(registry, "llm_tokens_total", kind="prompt")
+    completion_tokens = _counter_total(registry, "llm_tokens_total", kind="completion")
+    reasoning_tokens = _counter_total(registry, "llm_tokens_total", kind="reasoning")
+    lines.append(
+        f"• токены: промпт {prompt_tokens:.0f}, ответ {completion_tokens:.0f} (рассуждения {reasoning_tokens:.0f})"
+    )
+    lines.append(f"• ошибки LLM: {_counter_total(registry, 'llm_errors_total'):.0f}")
+    lines.append(f"• ошибки обработчиков: {_counter_total(registry, 'bot_handler_errors_total'):.0f}")
+
+    # Latency and tokens of answers with and without model reasoning
+    reasoning = _histogram_groups(registry, "llm_request_duration_seconds", "reasoning", "")
+    if reasoning:
+        lines += ["", "Рассуждения модели:"]
+    for effort, caption in REASONING_CAPTIONS.items():
+        series = reasoning.get(effort)
+        if series is None:
+            continue
+        line = _histogram_line(registry, "llm_request_duration_seconds", caption, series)
+        prompt = _counter_total(registry, "llm_tokens_total", kind="prompt", reasoning=effort)
+        completion = _counter_total(registry, "llm_tokens_total", kind="completion", reasoning=effort)
+        lines.append(f"{line}, токенов на запрос {prompt / series['count']:.0f} + {completion / series['count']:.0f}")
+
+    hits = _counter_total(registry, "answer_cache_lookups_total", result="hit")
+    misses = _counter_total(registry, "answer_cache_lookups_total", result="miss")
+    hit_rate = hits / (hits + misses) if hits + misses else 0.0
+
+    lines += [
+        "",
+        "Очереди и кэш:",
+        f"• в работе у LLM: {_counter_total(registry, 'llm_in_flight'):.0f}, "
+        f"ждут слота: {_counter_total(registry, 'bot_scheduler_queue_depth') + _counter_total(registry, 'llm_queue_depth'):.0f}",
+        f"• кэш: попаданий {hits:.0f}, промахов {misses:.0f} ({hit_rate:.0%})",
+        f"• объединено одинаковых вопросов: {_counter_total(registry, 'llm_coalesced_requests_total'):.0f}",
+        f"• отклонено (частота / очередь): "
+        f"{_counter_total(registry, 'bot_admission_rejects_total', reason='rate_limited'):.0f} / "
+        f"{_counter_total(registry, 'bot_admission_rejects_total', reason='queue_full'):.0f}",
+    ]
+    return "\n".join(lines)
+
+
+STATE_NAMES = {
+    "closed": "работает",
+    "open": "отключена после ошибок",
+    "half-open": "пробный запрос",
+}
+
+
+def format_models(models: List[Dict]) -> str:
+    """Format model router statistics for the /models command"""
+    lines = ["🧭 Модели в порядке приоритета"]
+    for i, model in enumerate(models, 1):
+        timeout = f"{model['timeout']:g} с" if model['timeout'] else "нет"
+        lines += [
+            "",
+            f"{i}. {model['model']} — {STATE_NAMES.get(model['state'], model['state'])}",
+            f"• дедлайн: {timeout}",
+            f"• ответов: {model['successes']}, ошибок: {model['errors']}, таймаутов: {model['timeouts']}",
+            f"• страхующих запросов: {model['hedges']}, из них быстрее основного: {model['hedge_wins']}",
+        ]
+        for kind, latency in model['latency'].items():
+            lines.append(
+                f"• {kind}: p50 {_ms(latency['p50'])}, p95 {_ms(latency['p95'])} ({latency['samples']} шт.)"
+            )
+    return "\n".join(lines)
@@ -0,0 +1,360 @@
+import logging
+import sqlite3
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+from storage import BackgroundWriter, connect
+
+logger = logging.getLogger(__name__)
+
+BUDGET_EXCEEDED = REGISTRY.counter("bot_usage_budget_exceeded_total", "Questions refused a model call by a daily token budget")
+TOKENS_TODAY = REGISTRY.gauge("bot_usage_tokens_today", "Tokens used today by all users, as known to this process")
+
+SCOPE_USER = "user"
+SCOPE_GLOBAL = "global"
+
+BUDGET_TEXTS = {
+    SCOPE_USER: "На сегодня лимит вопросов исчерпан 🙏 Возвращайся завтра — с радостью отвечу!",
+    SCOPE_GLOBAL: "Сегодня бот ответил на очень много вопросов и исчерпал дневной лимит. Попробуй, пожалуйста, завтра 🙏",
+}
+
+CREATE_USAGE_TABLE = """
+    CREATE TABLE IF NOT EXISTS usage (
+        day TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        requests INTEGER NOT NULL,
+        prompt_tokens INTEGER NOT NULL,
+        completion_tokens INTEGER NOT NULL,
+        PRIMARY KEY (day, user_id)
+    )
+"""
+
+UPSERT_USAGE = """
+    INSERT INTO usage (day, user_id, requests, prompt_tokens, completion_tokens)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (day, user_id) DO UPDATE SET
+        requests = requests + excluded.requests,
+        prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = completion_tokens + excluded.completion_tokens
+"""
+
+
+def today() -> str:
+    """Current day in server local time; budgets reset when it changes"""
+    return time.strftime("%Y-%m-%d")
+
+
+@dataclass
+class Usage:
+    """Model calls and tokens of one user on one day"""
+    requests: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+
+class UsageTracker:
+    """Daily token usage per user with budgets checked before model calls
+
+    record() and check() only touch in-memory counters, so handlers never
+    wait for disk. A background task adds the counters to SQLite every
+    flush_interval seconds and reads back today's totals, which also brings
+    in usage recorded by other worker processes sharing the database.
+    """
+
+    def __init__(
+        self,
+        path: str = "usage.db",
+        flush_interval: float = 5.0,
+        user_daily_tokens: int = 0,
+        global_daily_tokens: int = 0,
+    ):
+        """
+        Args:
+            path: SQLite database
+            flush_interval: Seconds between writes
+            user_daily_tokens: Tokens a user may spend per day, 0 for no limit
+            global_daily_tokens: Tokens all users together may spend per day, 0 for no limit
+        """
+        self.path = path
+        self.flush_interval = flush_interval
+        self.user_daily_tokens = user_daily_tokens
+        self.global_daily_tokens = global_daily_tokens
+        # Usage not yet written, by (day, user_id); swapped out whole by flush()
+        self._pending: Dict[Tuple[str, int], Usage] = {}
+        self._writing: Dict[Tuple[str, int], Usage] = {}
+        self._unflushed_tokens: Dict[str, int] = {}
+        # Today's tokens stored in the database as of the last flush
+        self._day = today()
+        self._stored: Dict[int, int] = {}
+        self._stored_total = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._writer = BackgroundWriter("usage", self.flush, flush_interval, open=self._open, close=self._close)
+        REGISTRY.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        TOKENS_TODAY.set(self.global_used())
+
+    def _open(self):
+        """Open the database (writer thread)"""
+        self._conn = connect(self.path)
+        self._conn.execute(CREATE_USAGE_TABLE)
+        self._conn.commit()
+
+    def _close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    async def start(self):
+        """Open the database, load today's usage and start the background writer"""
+        if self._writer.started:
+            return
+
+        await self._writer.start()
+        await self.flush()
+        logger.info(
+            f"Usage accounting: {self.path}, daily budgets {self.user_daily_tokens or 'unlimited'} per user, "
+            f"{self.global_daily_tokens or 'unlimited'} in total"
+        )
+
+    async def close(self):
+        """Write pending usage and close the database"""
+        if not self._writer.started:
+            return
+        await self._writer.stop()
+        logger.info("Usage accounting closed")
+
+    def _roll_day(self) -> str:
+        """Forget stored totals once the day changes"""
+        day = today()
+        if day != self._day:
+            self._day = day
+            self._stored = {}
+            self._stored_total = 0
+        return day
+
+    def record(self, user_id: int, prompt_tokens: int, completion_tokens: int):
+        """
+        Count tokens of one model call without waiting
+
+        Args:
+            user_id: Telegram user ID
+            prompt_tokens: Prompt tokens reported by the API
+            completion_tokens: Completion tokens reported by the API
+        """
+        day = self._roll_day()
+        usage = self._pending.get((day, user_id))
+        if usage is None:
+            usage = self._pending[(day, user_id)] = Usage()
+        usage.requests += 1
+        usage.prompt_tokens += prompt_tokens
+        usage.completion_tokens += completion_tokens
+        self._unflushed_tokens[day] = self._unflushed_tokens.get(day, 0) + prompt_tokens + completion_tokens
+
+    def _unflushed(self, day: str, user_id: int) -> int:
+        tokens = 0
+        for usage in (self._pending.get((day, user_id)), self._writing.get((day, user_id))):
+            if usage is not None:
+                tokens += usage.tokens
+        return tokens
+
+    def used(self, user_id: int) -> int:
+        """Tokens the user has spent today"""
+        day = self._roll_day()
+        return self._stored.get(user_id, 0) + self._unflushed(day, user_id)
+
+    def global_used(self) -> int:
+        """Tokens all users have spent today"""
+        day = self._roll_day()
+        return self._stored_total + self._unflushed_tokens.get(day, 0)
+
+    def check(self, user_id: int, exempt: bool = False) -> Optional[str]:
+        """
+        Check daily budgets before a model call
+
+        Args:
+            user_id: Telegram user ID
+            exempt: Skip the per-user budget (admins)
+
+        Returns:
+            "global" or "user" if that budget is used up, None if the call may go ahead
+        """
+        scope = None
+        if self.global_daily_tokens and self.global_used() >= self.global_daily_tokens:
+            scope = SCOPE_GLOBAL
+        elif self.user_daily_tokens and not exempt and self.used(user_id) >= self.user_daily_tokens:
+            scope = SCOPE_USER
+
+        if scope is not None:
+            BUDGET_EXCEEDED.inc(scope=scope)
+        return scope
+
+    def _write_and_load(self, rows: List[tuple], day: str) -> List[Tuple[int, int]]:
+        """Add usage in one transaction and read today's totals (writer thread)"""
+        with self._conn:
+            self._conn.executemany(UPSERT_USAGE, rows)
+        return self._conn.execute(
+            "SELECT user_id, prompt_tokens + completion_tokens FROM usage WHERE day = ?", (day,)
+        ).fetchall()
+
+    async def flush(self):
+        """Write counted usage now and reload today's totals from the database"""
+        async with self._writer.lock:
+            batch, self._pending = self._pending, {}
+            self._writing = batch
+            rows = [
+                (day, user_id, usage.requests, usage.prompt_tokens, usage.completion_tokens)
+                for (day, user_id), usage in batch.items()
+            ]
+            day = self._roll_day()
+            try:
+                totals = await self._writer.run(self._write_and_load, rows, day)
+            except Exception:
+                # Counted again on the next attempt
+                for key, usage in batch.items():
+                    pending = self._pending.setdefault(key, Usage())
+                    pending.requests += usage.requests
+                    pending.prompt_tokens += usage.prompt_tokens
+                    pending.completion_tokens += usage.completion_tokens
+                raise
+            finally:
+                self._writing = {}
+
+            # The batch is in the database totals now
+            for (written_day, _), usage in batch.items():
+                self._unflushed_tokens[written_day] -= usage.tokens
+                if not self._unflushed_tokens[written_day]:
+                    del self._unflushed_tokens[written_day]
+            if day == self._day:
+                self._stored = dict(totals)
+                self._stored_total = sum(self._stored.values())
+
+    def _daily(self, days: int, user_id: Optional[int]) -> List[Tuple[str, int, int]]:
+        """(day, requests, tokens) for the last days, newest first (writer thread)"""
+        since = time.strftime("%Y-%m-%d", time.localtime(time.time() - (days - 1) * 86400))
+        query = (
+            "SELECT day, SUM(requests), SUM(prompt_tokens + completion_tokens) FROM usage "
+            "WHERE day >= ?{} GROUP BY day ORDER BY day DESC"
+        )
+        if user_id is None:
+            return self._conn.execute(query.format(""), (since,)).fetchall()
+        return self._conn.execute(query.format(" AND user_id = ?"), (since, user_id)).fetchall()
+
+    def _top_users(self, day: str, limit: int) -> List[Tuple[int, int, int]]:
+        """(user_id, requests, tokens) of the heaviest users of a day (writer thread)"""
+        return self._conn.execute(
+            "SELECT user_id, requests, prompt_tokens + completion_tokens AS tokens FROM usage "
+            "WHERE day = ? ORDER BY tokens DESC LIMIT ?",
+            (day, limit)
+        ).fetchall()
+
+    async def report(self, days: int = 7, top: int = 10) -> Dict:
+        """Usage of all users: today's heaviest users and daily totals"""
+        await self.flush()
+        day = self._roll_day()
+        return {
+            "day": day,
+            "used": self.global_used(),
+            "top": await self._writer.run(self._top_users, day, top),
+            "daily": await self._writer.run(self._daily, days, None),
+        }
+
+    async def user_report(self, user_id: int, days: int = 7) -> Dict:
+        """Usage of one user: today's tokens and daily totals"""
+        await self.flush()
+        return {
+            "day": self._roll_day(),
+            "user_id": user_id,
+            "used": self.used(user_id),
+            "daily": await self._writer.run(self._daily, days, user_id),
+        }
+
+
+def _tokens(value: int) -> str:
+    return f"{value:,}".replace(",", " ")
+
+
+def _budget(used: int, budget: int) -> str:
+    if not budget:
+        return f"{_tokens(used)} (без лимита)"
+    return f"{_tokens(used)} из {_tokens(budget)} ({used / budget:.0%})"
+
+
+def format_usage(report: Dict, tracker: "UsageTracker") -> str:
+    """Text of /usage for all users"""
+    lines = [
+        f"📊 Расход токенов за {report['day']}",
+        "",
+        f"Всего: {_budget(report['used'], tracker.global_daily_tokens)}",
+        f"Лимит на пользователя: {_tokens(tracker.user_daily_tokens) if tracker.user_daily_tokens else 'нет'}",
+    ]
+    if report["top"]:
+        lines += ["", "Больше всех сегодня:"]
+        lines += [
+            f"• {user_id}: {_tokens(tokens)} (запросов {requests})"
+            for user_id, requests, tokens in report["top"]
+        ]
+    if report["daily"]:
+        lines += ["", "По дням:"]
+        lines += [f"• {day}: {_tokens(tokens)} (запросов {requests})" for day, requests, tokens in report["daily"]]
+    lines += ["", "Расход одного пользователя: /usage <user_id>"]
+    return "\n".join(lines)
+
+
+def format_user_usage(report: Dict, tracker: "UsageTracker") -> str:
+    """Text of /usage for one user"""
+    lines = [
+        f"📊 Пользователь {report['user_id']}",
+        "",
+        f"Сегодня ({report['day']}): {_budget(report['used'], tracker.user_daily_tokens)}",
+    ]
+    if report["daily"]:
+        lines += ["", "По дням:"]
+        lines += [f"• {day}: {_tokens(tokens)} (запросов {requests})" for day, requests, tokens in report["daily"]]
+    else:
+        lines += ["", "Запросов к модели не было."]
+    return "\n".join(lines)
+
+
+tracker: Optional[UsageTracker] = None
+
+
+async def init_usage(config):
+    """Start usage accounting described by UsageConfig, if enabled"""
+    global tracker
+    if not config.enabled:
+        return
+    tracker = UsageTracker(
+        path=config.path,
+        flush_interval=config.flush_interval,
+        user_daily_tokens=config.user_daily_tokens,
+        global_daily_tokens=config.global_daily_tokens
+    )
+    await tracker.start()
+
+
+async def close_usage():
+    """Write pending usage and stop accounting"""
+    global tracker
+    if tracker is not None:
+        await tracker.close()
+        tracker = None
+
+
+def record_usage(user_id: int, prompt_tokens: int, completion_tokens: int):
+    """Count tokens of a model call; nothing is counted without usage from the API"""
+    if tracker is not None and (prompt_tokens or completion_tokens):
+        tracker.record(user_id, prompt_tokens, completion_tokens)
+
+
+def check_budget(user_id: int, exempt: bool = False) -> Optional[str]:
+    """Budget scope used up for the user ("user" or "global"), None if the call may go ahead"""
+    if tracker is None:
+        return None
+    return tracker.check(user_id, exempt)
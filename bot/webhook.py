@@ -0,0 +1,146 @@
+import asyncio
+import hmac
+import logging
+from typing import List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import web
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+WEBHOOK_UPDATES = REGISTRY.counter("bot_webhook_updates_total", "Webhook updates by result")
+WEBHOOK_QUEUE_DEPTH = REGISTRY.gauge("bot_webhook_queue_depth", "Webhook updates waiting for a worker")
+
+
+class WebhookServer:
+    """Receive Telegram updates over HTTPS and process them in the background
+
+    The HTTP handler only validates the request and puts the update into a
+    bounded queue, so Telegram gets its 200 OK right away. A fixed number of
+    workers feed queued updates to the dispatcher. When the queue is full the
+    handler answers 503 and Telegram redelivers the update later.
+    """
+
+    def __init__(
+        self,
+        dp: Dispatcher,
+        bot: Bot,
+        path: str = "/webhook",
+        secret_token: Optional[str] = None,
+        workers: int = 16,
+        max_queue_size: int = 1000,
+    ):
+        """
+        Args:
+            dp: Dispatcher with registered handlers
+            bot: Bot the updates belong to
+            path: URL path Telegram posts updates to
+            secret_token: Expected value of the secret token header, None to skip the check
+            workers: Number of updates processed concurrently
+            max_queue_size: Updates accepted but not yet processed before answering 503
+        """
+        self.dp = dp
+        self.bot = bot
+        self.path = path
+        self.secret_token = secret_token
+        self.workers = workers
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self._worker_tasks: List[asyncio.Task] = []
+        self._runner: Optional[web.AppRunner] = None
+        REGISTRY.register_collector(self._collect_metrics)
+
+    @property
+    def queue_depth(self) -> int:
+        """Updates waiting for a worker"""
+        return self._queue.qsize()
+
+    def _collect_metrics(self):
+        WEBHOOK_QUEUE_DEPTH.set(self._queue.qsize())
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """Validate and enqueue one update"""
+        if self.secret_token is not None:
+            received = request.headers.get(SECRET_HEADER, "")
+            if not hmac.compare_digest(received, self.secret_token):
+                WEBHOOK_UPDATES.inc(result="unauthorized")
+                return web.Response(status=401)
+
+        try:
+            update = Update.model_validate(await request.json(), context={"bot": self.bot})
+        except Exception as e:
+            logger.warning(f"Malformed webhook update: {e}")
+            WEBHOOK_UPDATES.inc(result="malformed")
+            return web.Response(status=400)
+
+        try:
+            self._queue.put_nowait(update)
+        except asyncio.QueueFull:
+            logger.warning(f"Webhook queue full, update {update.update_id} will be redelivered")
+            WEBHOOK_UPDATES.inc(result="rejected")
+            return web.Response(status=503)
+
+        WEBHOOK_UPDATES.inc(result="accepted")
+        return web.Response()
+
+    async def _worker(self):
+        """Feed queued updates to the dispatcher one by one"""
+        while True:
+            update = await self._queue.get()
+            try:
+                await self.dp.feed_update(self.bot, update)
+            except Exception as e:
+                logger.error(f"Failed to process update {update.update_id}: {e}", exc_info=True)
+            finally:
+                self._queue.task_done()
+
+    def build_app(self) -> web.Application:
+        """aiohttp application with the webhook route"""
+        app = web.Application()
+        app.router.add_post(self.path, self.handle)
+        return app
+
+    async def start(self, host: str, port: int, url: str, drop_pending_updates: bool = False):
+        """
+        Start workers and HTTP server, then register the webhook with Telegram
+
+        Args:
+            host: Interface to bind
+            port: TCP port
+            url: Public HTTPS URL that points to this server's path
+            drop_pending_updates: Discard updates queued by Telegram before the start
+        """
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        logger.info(f"Webhook server listening on http://{host}:{port}{self.path}")
+
+        await self.bot.set_webhook(
+            url=url,
+            secret_token=self.secret_token,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            drop_pending_updates=drop_pending_updates,
+        )
+        logger.info(f"Webhook registered at {url}")
+
+    async def stop(self, timeout: float = 10.0):
+        """Stop accepting updates and let workers finish the queued ones"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Dropping {self._queue.qsize()} unprocessed webhook updates on shutdown")
+
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
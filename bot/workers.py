@@ -0,0 +1,426 @@
+import asyncio
+import hmac
+import json
+import logging
+import multiprocessing
+import queue
+import time
+from collections import deque
+from multiprocessing.connection import Connection
+from typing import Callable, Deque, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiohttp import ClientError, ClientSession, ClientTimeout, web
+
+from bot.config import BotConfig
+from bot.webhook import SECRET_HEADER
+from metrics import REGISTRY, Registry, start_metrics_server
+
+logger = logging.getLogger(__name__)
+
+TELEGRAM_API = "https://api.telegram.org"
+POLL_TIMEOUT = 30
+
+ROUTED_UPDATES = REGISTRY.counter("supervisor_routed_updates_total", "Updates routed to workers")
+REJECTED_UPDATES = REGISTRY.counter("supervisor_rejected_updates_total", "Webhook updates refused because a worker queue was full")
+WORKER_RESTARTS = REGISTRY.counter("supervisor_worker_restarts_total", "Worker processes restarted after a crash or hang")
+WORKERS_ALIVE = REGISTRY.gauge("supervisor_workers_alive", "Worker processes currently running")
+
+
+class WorkerCrashLoop(RuntimeError):
+    """A worker was restarted too many times in a short period"""
+
+
+def update_user_id(data: Dict) -> Optional[int]:
+    """Id of the user who caused the update, falling back to the chat id"""
+    for value in data.values():
+        if not isinstance(value, dict):
+            continue
+        user = value.get("from") or value.get("user")
+        if isinstance(user, dict) and "id" in user:
+            return user["id"]
+        chat = value.get("chat")
+        if isinstance(chat, dict) and "id" in chat:
+            return chat["id"]
+    return None
+
+
+def shard_for(data: Dict, workers: int) -> int:
+    """Worker index for an update; all updates of one user go to the same worker"""
+    user_id = update_user_id(data)
+    if user_id is None:
+        user_id = data.get("update_id", 0)
+    return user_id % workers
+
+
+async def consume_updates(
+    dp: Dispatcher,
+    bot: Bot,
+    worker_id: int,
+    updates: multiprocessing.Queue,
+    status: Connection,
+    heartbeat_interval: float,
+):
+    """
+    Worker side: feed updates from the supervisor to the dispatcher
+
+    Updates are processed as tasks in arrival order, like long polling does.
+    A heartbeat with a metrics snapshot is sent every heartbeat_interval
+    seconds; it stops when the event loop is stuck, which lets the
+    supervisor detect hung workers. Returns after the supervisor sends None.
+
+    Args:
+        dp: Dispatcher with registered handlers
+        bot: Bot the updates belong to
+        worker_id: Index of this worker
+        updates: Queue of raw update dicts from the supervisor
+        status: Pipe end for heartbeats to the supervisor
+        heartbeat_interval: Seconds between heartbeats
+    """
+    loop = asyncio.get_running_loop()
+    tasks = set()
+
+    async def heartbeat():
+        while True:
+            status.send(("heartbeat", REGISTRY.snapshot()))
+            await asyncio.sleep(heartbeat_interval)
+
+    async def process(update: Update):
+        try:
+            await dp.feed_update(bot, update)
+        except Exception as e:
+            logger.error(f"Failed to process update {update.update_id}: {e}", exc_info=True)
+
+    heartbeat_task = asyncio.create_task(heartbeat())
+    logger.info(f"Worker {worker_id} is receiving updates")
+    try:
+        while True:
+            data = await loop.run_in_executor(None, updates.get)
+            if data is None:
+                break
+
+            try:
+                update = Update.model_validate(data, context={"bot": bot})
+            except Exception as e:
+                logger.warning(f"Malformed update from supervisor: {e}")
+                continue
+
+            task = asyncio.create_task(process(update))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+    finally:
+        heartbeat_task.cancel()
+        logger.info(f"Worker {worker_id} stopped receiving updates")
+
+
+class WorkerProcess:
+    """One bot worker process and its update queue
+
+    Heartbeats come over a one-way pipe read by the supervisor's event loop.
+    A replacement process gets a new queue: a killed process may still hold
+    the old queue's read lock. Updates that can be taken from the old queue
+    without blocking are moved over.
+    """
+
+    def __init__(self, worker_id: int, target: Callable, context, max_queue_size: int):
+        self.worker_id = worker_id
+        self.target = target
+        self.context = context
+        self.max_queue_size = max_queue_size
+        self.updates = context.Queue(maxsize=max_queue_size)
+        self.process: Optional[multiprocessing.Process] = None
+        self.status: Optional[Connection] = None
+        self.last_heartbeat = 0.0
+        self.snapshot: Optional[Dict] = None
+        self.restarts: Deque[float] = deque()  # monotonic times of recent restarts
+        self.restart_at: Optional[float] = None  # pending restart after a crash
+
+    def _replace_queue(self):
+        old, self.updates = self.updates, self.context.Queue(maxsize=self.max_queue_size)
+        moved = 0
+        while True:
+            try:
+                self.updates.put_nowait(old.get_nowait())
+            except (queue.Empty, queue.Full):
+                break
+            moved += 1
+        if moved:
+            logger.info(f"Moved {moved} pending updates to the new worker {self.worker_id}")
+
+    def _on_status(self):
+        """Read heartbeats available on the pipe (event loop callback)"""
+        try:
+            while self.status.poll():
+                kind, snapshot = self.status.recv()
+                if kind == "heartbeat":
+                    self.last_heartbeat = time.monotonic()
+                    self.snapshot = snapshot
+        except (EOFError, OSError):
+            # Process is gone; the monitor notices and restarts it
+            self.close_status()
+
+    def close_status(self):
+        """Stop reading heartbeats of the current process"""
+        if self.status is not None:
+            asyncio.get_running_loop().remove_reader(self.status.fileno())
+            self.status.close()
+            self.status = None
+
+    def start(self, heartbeat_interval: float):
+        """Start a fresh process"""
+        if self.process is not None:
+            self._replace_queue()
+        self.close_status()
+
+        self.status, child_status = self.context.Pipe(duplex=False)
+        self.process = self.context.Process(
+            target=self.target,
+            args=(self.worker_id, self.updates, child_status, heartbeat_interval),
+            name=f"bot-worker-{self.worker_id}",
+        )
+        self.process.start()
+        # Only the child writes to the pipe; closing our copy lets us see EOF when it exits
+        child_status.close()
+        asyncio.get_running_loop().add_reader(self.status.fileno(), self._on_status)
+
+        # Startup counts as alive until the first heartbeat is due
+        self.last_heartbeat = time.monotonic()
+        logger.info(f"Started worker {self.worker_id} (pid {self.process.pid})")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.is_alive()
+
+    def kill(self):
+        """Stop a hung process right away"""
+        if self.alive:
+            self.process.kill()
+        if self.process is not None:
+            self.process.join(5)
+
+    def stop(self, timeout: float):
+        """Ask the process to finish queued updates and exit"""
+        if not self.alive:
+            return
+        self.updates.put(None)
+        self.process.join(timeout)
+        if self.process.is_alive():
+            logger.warning(f"Worker {self.worker_id} did not stop in {timeout}s, terminating")
+            self.process.terminate()
+            self.process.join(5)
+
+
+class Supervisor:
+    """Receive updates from Telegram and spread them over worker processes
+
+    Each update is routed by user id, so one user's updates always reach the
+    same worker in order and their dialog state stays local to it. Workers are
+    restarted with backoff when they exit or stop sending heartbeats. Metrics
+    of all workers are summed and served on the supervisor's metrics endpoint.
+    """
+
+    def __init__(self, config: BotConfig, target: Callable):
+        """
+        Args:
+            config: Bot configuration; the supervisor section sets the pool size
+            target: Worker entry point, called as target(worker_id, updates, status, heartbeat_interval)
+                in a new process; must be importable (defined at module level) and
+                usually ends up in consume_updates()
+        """
+        self.config = config
+        self.settings = config.supervisor
+        context = multiprocessing.get_context("spawn")
+        self.workers: List[WorkerProcess] = [
+            WorkerProcess(i, target, context, self.settings.max_queue_size)
+            for i in range(self.settings.resolved_workers())
+        ]
+        REGISTRY.register_collector(self._collect_metrics)
+
+    def _collect_metrics(self):
+        WORKERS_ALIVE.set(sum(worker.alive for worker in self.workers))
+
+    def render(self) -> str:
+        """Metrics of the supervisor and all workers in Prometheus text format"""
+        registry = Registry()
+        registry.merge(REGISTRY.snapshot())
+        for worker in self.workers:
+            if worker.snapshot is not None:
+                registry.merge(worker.snapshot)
+        return registry.render()
+
+    def dispatch(self, data: Dict) -> bool:
+        """Put update into its worker's queue; False if the queue is full"""
+        worker = self.workers[shard_for(data, len(self.workers))]
+        try:
+            worker.updates.put_nowait(data)
+        except queue.Full:
+            return False
+        ROUTED_UPDATES.inc(worker=worker.worker_id)
+        return True
+
+    def _restart_delay(self, worker: WorkerProcess, now: float) -> float:
+        """Seconds to wait before restarting a worker that went down
+
+        The first restart within restart_window is immediate, each next one
+        waits twice as long as the previous, up to restart_backoff_max.
+
+        Raises:
+            WorkerCrashLoop: Worker already restarted max_restarts times within restart_window
+        """
+        while worker.restarts and worker.restarts[0] <= now - self.settings.restart_window:
+            worker.restarts.popleft()
+        recent = len(worker.restarts)
+        if self.settings.max_restarts and recent >= self.settings.max_restarts:
+            raise WorkerCrashLoop(
+                f"Worker {worker.worker_id} restarted {recent} times "
+                f"in {self.settings.restart_window:.0f}s, giving up"
+            )
+        if recent == 0:
+            return 0.0
+        return min(self.settings.restart_backoff * 2 ** (recent - 1), self.settings.restart_backoff_max)
+
+    async def _monitor(self):
+        """Restart workers that exited or stopped sending heartbeats
+
+        Raises:
+            WorkerCrashLoop: A worker keeps crashing; run() stops the supervisor
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.settings.heartbeat_interval)
+            now = time.monotonic()
+            for worker in self.workers:
+                if worker.restart_at is None:
+                    if not worker.alive:
+                        logger.error(f"Worker {worker.worker_id} exited with code {worker.process.exitcode}")
+                    elif now - worker.last_heartbeat > self.settings.heartbeat_timeout:
+                        logger.error(f"Worker {worker.worker_id} missed heartbeats, killing")
+                        await loop.run_in_executor(None, worker.kill)
+                    else:
+                        continue
+                    delay = self._restart_delay(worker, now)
+                    worker.restart_at = now + delay
+                    if delay:
+                        logger.warning(f"Restarting worker {worker.worker_id} in {delay:.1f}s")
+                if now < worker.restart_at:
+                    continue
+                worker.restart_at = None
+                worker.restarts.append(now)
+                WORKER_RESTARTS.inc(worker=worker.worker_id)
+                worker.start(self.settings.heartbeat_interval)
+
+    async def _poll(self):
+        """Long-poll Telegram with raw HTTP; updates are parsed by the workers"""
+        url = f"{TELEGRAM_API}/bot{self.config.telegram_token}"
+        offset = None
+        async with ClientSession(timeout=ClientTimeout(total=POLL_TIMEOUT + 10)) as session:
+            # Polling fails while a webhook from a previous webhook run is still set
+            async with session.post(f"{url}/deleteWebhook") as response:
+                await response.read()
+
+            while True:
+                params = {"timeout": POLL_TIMEOUT}
+                if offset is not None:
+                    params["offset"] = offset
+                try:
+                    async with session.get(f"{url}/getUpdates", params=params) as response:
+                        payload = await response.json()
+                except (ClientError, asyncio.TimeoutError, json.JSONDecodeError) as e:
+                    logger.warning(f"getUpdates failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+
+                if not payload.get("ok"):
+                    retry_after = payload.get("parameters", {}).get("retry_after", 1)
+                    logger.error(f"getUpdates error: {payload.get('description')}")
+                    await asyncio.sleep(retry_after)
+                    continue
+
+                for data in payload["result"]:
+                    while not self.dispatch(data):
+                        await asyncio.sleep(0.1)
+                    offset = data["update_id"] + 1
+
+    async def _handle_webhook(self, request: web.Request) -> web.Response:
+        """Check the secret and route the update without parsing it into objects"""
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received, self.config.webhook_secret or ""):
+            return web.Response(status=401)
+
+        try:
+            data = await request.json()
+        except json.JSONDecodeError:
+            return web.Response(status=400)
+
+        if not self.dispatch(data):
+            REJECTED_UPDATES.inc()
+            return web.Response(status=503)
+        return web.Response()
+
+    async def _serve_webhook(self) -> web.AppRunner:
+        """Start the webhook server and register it with Telegram"""
+        webhook = self.config.webhook
+        app = web.Application()
+        app.router.add_post(webhook.path, self._handle_webhook)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, webhook.host, webhook.port).start()
+        logger.info(f"Supervisor webhook listening on http://{webhook.host}:{webhook.port}{webhook.path}")
+
+        async with ClientSession() as session:
+            async with session.post(
+                f"{TELEGRAM_API}/bot{self.config.telegram_token}/setWebhook",
+                json={
+                    "url": webhook.url,
+                    "secret_token": self.config.webhook_secret,
+                    "drop_pending_updates": webhook.drop_pending_updates,
+                },
+            ) as response:
+                result = await response.json()
+        if not result.get("ok"):
+            raise RuntimeError(f"setWebhook failed: {result.get('description')}")
+        logger.info(f"Webhook registered at {webhook.url}")
+        return runner
+
+    async def run(self):
+        """Start workers and route updates until cancelled
+
+        Raises:
+            WorkerCrashLoop: A worker was restarted too often; workers are stopped first
+        """
+        loop = asyncio.get_running_loop()
+        for worker in self.workers:
+            worker.start(self.settings.heartbeat_interval)
+
+        monitor = asyncio.create_task(self._monitor())
+        serving = None
+        runners = []
+        try:
+            if self.config.metrics.enabled:
+                runners.append(await start_metrics_server(self.config.metrics.host, self.config.metrics.port, self))
+            if self.config.webhook.enabled:
+                runners.append(await self._serve_webhook())
+                serving = asyncio.create_task(asyncio.Event().wait())
+            else:
+                serving = asyncio.create_task(self._poll())
+            # The monitor only finishes on its own when a worker keeps crashing
+            done, _ = await asyncio.wait((monitor, serving), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                task.result()
+        finally:
+            for runner in runners:
+                await runner.cleanup()
+            for task in (serving, monitor):
+                if task is not None:
+                    task.cancel()
+            logger.info("Stopping workers...")
+            await asyncio.gather(*(
+                loop.run_in_executor(None, worker.stop, self.settings.shutdown_timeout)
+                for worker in self.workers
+            ))
+            for worker in self.workers:
+                worker.close_status()
@@ -1,3 +1,9 @@
-from .openrouter_client import OpenRouterClient
+from .openrouter_client import AnswerInfo, OpenRouterClient, QueueFullError, StreamInterrupted
+from .cache import AnswerCache
+from .memory import ConversationMemory
+from .reasoning import ReasoningClassifier, create_reasoning_classifier
+from .routing import ModelRouter, ModelSpec, create_model_router
+from .transport import HTTPTransport, create_http_transport
 
-__all__ = ['OpenRouterClient']
+__all__ = ['AnswerInfo', 'OpenRouterClient', 'QueueFullError', 'StreamInterrupted', 'AnswerCache', 'ConversationMemory', 'ModelRouter', 'ModelSpec', 'create_model_router',
+           'HTTPTransport', 'create_http_transport', 'ReasoningClassifier', 'create_reasoning_classifier']
@@ -0,0 +1,204 @@
+import hashlib
+import logging
+import re
+import time
+from collections import OrderedDict
+from typing import List, Optional, Dict, Tuple
+
+from metrics import REGISTRY
+from storage import BackgroundWriter, connect
+
+from .retrieval import normalize_word, tokenize
+
+logger = logging.getLogger(__name__)
+
+PUNCTUATION_RE = re.compile(r"[^\w\s]+", re.UNICODE)
+WHITESPACE_RE = re.compile(r"\s+")
+
+CACHE_LOOKUPS = REGISTRY.counter("answer_cache_lookups_total", "Answer cache lookups by result")
+
+UPSERT_ANSWER = "INSERT OR REPLACE INTO answer_cache (key, answer, created_at) VALUES (?, ?, ?)"
+DELETE_ANSWER = "DELETE FROM answer_cache WHERE key = ?"
+
+
+def normalize_query(query: str, lemmatize: bool = False) -> str:
+    """
+    Normalize a question so that trivially different spellings share a cache entry
+
+    Args:
+        query: User question
+        lemmatize: Also drop stop words and strip Russian inflections
+
+    Returns:
+        Normalized query
+    """
+    if lemmatize:
+        return " ".join(tokenize(query))
+
+    text = normalize_word(query)
+    text = PUNCTUATION_RE.sub(" ", text)
+    return WHITESPACE_RE.sub(" ", text).strip()
+
+
+def content_hash(text: str) -> str:
+    """Short hash identifying a version of the knowledge base"""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+
+
+class AnswerCache:
+    """LRU cache of generated answers with TTL, persisted to SQLite
+
+    Lookups and updates only touch memory. After start(), stores and
+    deletions are queued and written to SQLite in one transaction every
+    flush_interval seconds on a writer thread, so the event loop never waits
+    for disk; before it they are written right away.
+    """
+
+    def __init__(
+        self,
+        max_size: int = 1000,
+        ttl_seconds: int = 86400,
+        db_path: Optional[str] = "answer_cache.db",
+        lemmatize: bool = False,
+        flush_interval: float = 1.0,
+    ):
+        """
+        Initialize cache and load non-expired entries from disk
+
+        Args:
+            max_size: Maximum number of answers kept
+            ttl_seconds: How long an answer stays valid
+            db_path: SQLite file for persistence, None to keep the cache in memory only
+            lemmatize: Normalize queries with stemming and stop word removal
+            flush_interval: Seconds between batched writes once started
+        """
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.lemmatize = lemmatize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._conn = None
+        # (statement, parameters) waiting for the writer, in order
+        self._pending: List[Tuple[str, tuple]] = []
+        self._writer = BackgroundWriter("answer-cache", self.flush, flush_interval)
+
+        if db_path:
+            self._conn = connect(db_path)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS answer_cache (
+                    key TEXT PRIMARY KEY,
+                    answer TEXT NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+            self._load()
+
+    def _load(self):
+        """Load the freshest non-expired entries from SQLite"""
+        cutoff = time.time() - self.ttl_seconds
+        self._conn.execute("DELETE FROM answer_cache WHERE created_at < ?", (cutoff,))
+        self._conn.commit()
+
+        rows = self._conn.execute(
+            "SELECT key, answer, created_at FROM answer_cache ORDER BY created_at DESC LIMIT ?",
+            (self.max_size,)
+        ).fetchall()
+
+        for key, answer, created_at in reversed(rows):
+            self._entries[key] = (answer, created_at)
+
+        logger.info(f"Loaded {len(self._entries)} cached answers")
+
+    def make_key(self, query: str, kb_version: str) -> str:
+        """Build cache key from normalized query and knowledge base version"""
+        normalized = normalize_query(query, lemmatize=self.lemmatize)
+        return hashlib.sha256(f"{kb_version}\n{normalized}".encode("utf-8")).hexdigest()
+
+    def get(self, query: str, kb_version: str) -> Optional[str]:
+        """Return cached answer or None"""
+        key = self.make_key(query, kb_version)
+        entry = self._entries.get(key)
+
+        if entry is not None and time.time() - entry[1] > self.ttl_seconds:
+            self._delete(key)
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(result="miss")
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        CACHE_LOOKUPS.inc(result="hit")
+        return entry[0]
+
+    def set(self, query: str, kb_version: str, answer: str):
+        """Store answer, evicting the least recently used entries if needed"""
+        key = self.make_key(query, kb_version)
+        created_at = time.time()
+        self._entries[key] = (answer, created_at)
+        self._entries.move_to_end(key)
+
+        self._write(UPSERT_ANSWER, (key, answer, created_at))
+
+        while len(self._entries) > self.max_size:
+            oldest_key = next(iter(self._entries))
+            self._delete(oldest_key)
+
+    def _delete(self, key: str):
+        """Remove entry from memory and disk"""
+        self._entries.pop(key, None)
+        self._write(DELETE_ANSWER, (key,))
+
+    def _write(self, statement: str, params: tuple):
+        """Queue a change for the writer, or apply it now if the writer is not running"""
+        if self._conn is None:
+            return
+        if self._writer.started:
+            self._pending.append((statement, params))
+        else:
+            self._write_batch([(statement, params)])
+
+    def _write_batch(self, changes: List[Tuple[str, tuple]]):
+        """Apply changes in one transaction (writer thread once started)"""
+        with self._conn:
+            for statement, params in changes:
+                self._conn.execute(statement, params)
+
+    async def start(self):
+        """Move SQLite writes off the event loop to a background writer"""
+        if self._conn is not None:
+            await self._writer.start()
+
+    async def flush(self):
+        """Write queued changes now"""
+        async with self._writer.lock:
+            if not self._pending:
+                return
+            changes, self._pending = self._pending, []
+            try:
+                await self._writer.run(self._write_batch, changes)
+            except Exception:
+                # Keep changes for the next attempt
+                self._pending[:0] = changes
+                raise
+
+    def stats(self) -> Dict:
+        """Get cache statistics"""
+        total = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    async def close(self):
+        """Write queued changes and close SQLite connection"""
+        await self._writer.stop()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
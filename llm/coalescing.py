@@ -0,0 +1,96 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+COALESCED_CALLS = REGISTRY.counter("llm_coalesced_requests_total", "Requests that joined an identical in-flight call")
+
+
+class CallAborted(Exception):
+    """Raised to waiters when the leading call was cancelled before producing a result"""
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers with the same key
+
+    The first caller (leader) performs the call, later callers with the same key
+    wait for its result instead of starting their own upstream request.
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def in_flight(self, key: str) -> Optional[asyncio.Future]:
+        """Future of the call currently running for key, if any"""
+        return self._calls.get(key)
+
+    def begin(self, key: str) -> asyncio.Future:
+        """Register the caller as leader for key; must be paired with finish()"""
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        self.leaders += 1
+        return future
+
+    def finish(self, key: str, future: asyncio.Future, result: Any = None, error: Optional[BaseException] = None):
+        """Publish the leader's result (or error) to all waiters"""
+        if self._calls.get(key) is future:
+            del self._calls[key]
+        if future.done():
+            return
+
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+            # Nobody may be waiting; mark the exception as retrieved to keep logs clean
+            future.exception()
+
+    async def join(self, future: asyncio.Future) -> Any:
+        """Wait for a call started by another caller"""
+        self.coalesced += 1
+        COALESCED_CALLS.inc()
+        return await asyncio.shield(future)
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run fn once for all concurrent callers with the same key
+
+        Args:
+            key: Identity of the call
+            fn: Coroutine factory performing the actual call
+
+        Returns:
+            Result of fn, shared between callers
+
+        Raises:
+            CallAborted: If this caller was waiting and the leader got cancelled
+        """
+        future = self.in_flight(key)
+        if future is not None:
+            return await self.join(future)
+
+        future = self.begin(key)
+        try:
+            result = await fn()
+        except Exception as e:
+            self.finish(key, future, error=e)
+            raise
+        except BaseException:
+            self.finish(key, future, error=CallAborted())
+            raise
+
+        self.finish(key, future, result=result)
+        return result
+
+    def stats(self) -> Dict:
+        """Get coalescing statistics"""
+        return {
+            'in_flight': len(self._calls),
+            'upstream_calls': self.leaders,
+            'coalesced': self.coalesced
+        }
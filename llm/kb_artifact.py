@@ -0,0 +1,320 @@
+"""Compiled knowledge base: sections and BM25 index in one memory-mapped file
+
+The file is built from data.txt once and reused while the text's content hash
+stays the same, so restarts skip sectioning and indexing. Every process maps
+the same file read-only, and the OS shares its pages between worker processes.
+
+    python -m llm.kb_artifact --data data/data.txt --output data/data.kb
+
+Layout (little-endian):
+    header     HEADER: magic, format version, max_section_chars, content hash,
+               counts, average section length and offsets of the blocks below
+    sections   SECTION per section: title and text location, tokens, BM25 length
+    terms      TERM per term, sorted by UTF-8 bytes: term location, idf, postings
+    postings   POSTING per (term, section): section number and term frequency
+    strings    UTF-8 titles, section texts and terms referenced by offset
+"""
+import argparse
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Dict, List, Optional, Tuple
+
+from .cache import content_hash
+from .retrieval import KnowledgeBaseIndex, Section, SectionSearch, split_sections, tokenize
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SHADKB\0\0"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<8sII16sIIdIIII")
+SECTION = struct.Struct("<IIIIII")
+TERM = struct.Struct("<IIdII")
+POSTING = struct.Struct("<II")
+
+
+class ArtifactError(Exception):
+    """Raised when a compiled knowledge base file is damaged or of another format"""
+
+
+def compile_knowledge_base(text: str, max_section_chars: int = 1500) -> bytes:
+    """
+    Split and index knowledge base text into the binary artifact format
+
+    Args:
+        text: Full knowledge base text
+        max_section_chars: Maximum size of a section
+
+    Returns:
+        Artifact contents
+    """
+    index = KnowledgeBaseIndex(split_sections(text, max_chars=max_section_chars))
+    sections = index.sections
+
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    for i, freqs in enumerate(index._term_freqs):
+        for term, tf in freqs.items():
+            postings.setdefault(term, []).append((i, tf))
+    terms = sorted(postings, key=lambda term: term.encode("utf-8"))
+
+    sections_offset = HEADER.size
+    terms_offset = sections_offset + SECTION.size * len(sections)
+    postings_offset = terms_offset + TERM.size * len(terms)
+    strings_offset = postings_offset + POSTING.size * sum(len(p) for p in postings.values())
+
+    strings = bytearray()
+
+    def add_string(value: str) -> Tuple[int, int]:
+        data = value.encode("utf-8")
+        offset = strings_offset + len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    section_table = bytearray()
+    for i, section in enumerate(sections):
+        title_offset, title_len = add_string(section.title)
+        text_offset, text_len = add_string(section.text)
+        section_table += SECTION.pack(
+            title_offset, title_len, text_offset, text_len, section.tokens, index._lengths[i]
+        )
+
+    term_table = bytearray()
+    posting_table = bytearray()
+    posting_count = 0
+    for term in terms:
+        term_offset, term_len = add_string(term)
+        term_postings = postings[term]
+        term_table += TERM.pack(term_offset, term_len, index._idf[term], posting_count, len(term_postings))
+        for section_number, tf in term_postings:
+            posting_table += POSTING.pack(section_number, tf)
+        posting_count += len(term_postings)
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, max_section_chars, content_hash(text).encode("ascii"),
+        len(sections), len(terms), index._avg_length,
+        sections_offset, terms_offset, postings_offset, strings_offset,
+    )
+    return b"".join([header, section_table, term_table, posting_table, strings])
+
+
+def read_header(path: str) -> Optional[Tuple]:
+    """Header fields of an artifact file, None if it is missing or not an artifact"""
+    try:
+        with open(path, "rb") as f:
+            data = f.read(HEADER.size)
+    except OSError:
+        return None
+    if len(data) < HEADER.size:
+        return None
+    fields = HEADER.unpack(data)
+    if fields[0] != MAGIC or fields[1] != FORMAT_VERSION:
+        return None
+    return fields
+
+
+def is_fresh(path: str, version: str, max_section_chars: int) -> bool:
+    """Whether the artifact was compiled from text with this hash and section size"""
+    header = read_header(path)
+    return header is not None and header[2] == max_section_chars and header[3].decode("ascii") == version
+
+
+def write_artifact(path: str, text: str, max_section_chars: int = 1500) -> str:
+    """
+    Compile text and atomically replace the artifact file
+
+    Processes that mapped the previous file keep reading it until they reload.
+
+    Returns:
+        Content hash of the compiled text
+    """
+    data = compile_knowledge_base(text, max_section_chars)
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    version = content_hash(text)
+    logger.info(f"Compiled knowledge base {version} to {path} ({len(data)} bytes)")
+    return version
+
+
+class CompiledIndex(SectionSearch):
+    """BM25 search reading sections and postings straight from a mapped artifact
+
+    Only the postings of query terms are touched, and sections are decoded
+    when they are returned, so the index costs almost no private memory.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        """
+        Map artifact file
+
+        Args:
+            path: Artifact file
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+
+        Raises:
+            ArtifactError: If the file is not a compiled knowledge base
+        """
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        with open(path, "rb") as f:
+            self._buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._buf) < HEADER.size:
+            raise ArtifactError(f"{path} is too short")
+        (magic, version, self.max_section_chars, content_version, self.section_count, self.term_count,
+         self._avg_length, self._sections_offset, self._terms_offset, self._postings_offset,
+         self._strings_offset) = HEADER.unpack_from(self._buf, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ArtifactError(f"{path} is not a compiled knowledge base of format {FORMAT_VERSION}")
+        self.version = content_version.decode("ascii")
+        self._sections: Dict[int, Section] = {}
+
+    def __len__(self) -> int:
+        return self.section_count
+
+    def _string(self, offset: int, length: int) -> str:
+        return self._buf[offset:offset + length].decode("utf-8")
+
+    def section(self, number: int) -> Section:
+        """Decode a section, caching it for later requests"""
+        section = self._sections.get(number)
+        if section is None:
+            title_offset, title_len, text_offset, text_len, _, _ = SECTION.unpack_from(
+                self._buf, self._sections_offset + number * SECTION.size
+            )
+            section = Section(
+                title=self._string(title_offset, title_len),
+                text=self._string(text_offset, text_len),
+                position=number,
+            )
+            self._sections[number] = section
+        return section
+
+    @property
+    def sections(self) -> List[Section]:
+        return [self.section(i) for i in range(self.section_count)]
+
+    def _find_term(self, term: str) -> Optional[Tuple[float, int, int]]:
+        """Binary search of the term table, returns (idf, first posting, posting count)"""
+        key = term.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            offset, length, idf, first, count = TERM.unpack_from(self._buf, self._terms_offset + middle * TERM.size)
+            value = self._buf[offset:offset + length]
+            if value == key:
+                return idf, first, count
+            if value < key:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def _length(self, number: int) -> int:
+        return SECTION.unpack_from(self._buf, self._sections_offset + number * SECTION.size)[5]
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Section, float]]:
+        query_terms = set(tokenize(query))
+        if not query_terms or not self.section_count:
+            return []
+
+        scores: Dict[int, float] = {}
+        for term in query_terms:
+            found = self._find_term(term)
+            if found is None:
+                continue
+            idf, first, count = found
+            for i in range(first, first + count):
+                number, tf = POSTING.unpack_from(self._buf, self._postings_offset + i * POSTING.size)
+                length_norm = 1 - self.b + self.b * self._length(number) / (self._avg_length or 1)
+                scores[number] = scores.get(number, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        ranked = sorted((number for number, score in scores.items() if score > 0), key=lambda n: (-scores[n], n))
+        return [(self.section(number), scores[number]) for number in ranked[:top_k]]
+
+    def close(self):
+        self._buf.close()
+
+
+def load_index(text: str, path: str, max_section_chars: int = 1500) -> SectionSearch:
+    """
+    Map the compiled index of text, compiling it first if the file is stale
+
+    Falls back to an in-memory index if the file can not be written or read.
+
+    Args:
+        text: Full knowledge base text
+        path: Artifact file
+        max_section_chars: Maximum size of a section
+
+    Returns:
+        Index over the sections of text
+    """
+    version = content_hash(text)
+    try:
+        if is_fresh(path, version, max_section_chars):
+            logger.info(f"Using compiled knowledge base {path} ({version})")
+        else:
+            write_artifact(path, text, max_section_chars)
+        return CompiledIndex(path)
+    except (OSError, ArtifactError) as e:
+        logger.warning(f"Compiled knowledge base {path} is unavailable, indexing in memory: {e}")
+        return KnowledgeBaseIndex.from_text(text, max_section_chars)
+
+
+def ensure_compiled(data_file: str, path: str, max_section_chars: int = 1500) -> bool:
+    """
+    Recompile the artifact if data_file changed since it was built
+
+    Called by the supervisor before starting workers, so that they all map
+    one up-to-date file instead of compiling it concurrently.
+
+    Returns:
+        True if the artifact had to be rebuilt
+    """
+    with open(data_file, encoding="utf-8") as f:
+        text = f.read()
+    if is_fresh(path, content_hash(text), max_section_chars):
+        return False
+    write_artifact(path, text, max_section_chars)
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile data.txt into a memory-mapped knowledge base")
+    parser.add_argument("--data", default="data/data.txt", help="knowledge base text")
+    parser.add_argument("--output", default="data/data.kb", help="artifact file")
+    parser.add_argument("--max-section-chars", type=int, default=1500)
+    parser.add_argument("--check", action="store_true", help="only report whether the artifact is up to date")
+    args = parser.parse_args()
+
+    with open(args.data, encoding="utf-8") as f:
+        text = f.read()
+    version = content_hash(text)
+
+    if args.check:
+        fresh = is_fresh(args.output, version, args.max_section_chars)
+        print(f"{args.output}: {'up to date' if fresh else 'stale'} (data.txt {version})")
+        raise SystemExit(0 if fresh else 1)
+
+    started = time.perf_counter()
+    write_artifact(args.output, text, args.max_section_chars)
+    index = CompiledIndex(args.output)
+    print(
+        f"{args.output}: {index.section_count} sections, {index.term_count} terms, "
+        f"{os.path.getsize(args.output)} bytes, version {index.version}, "
+        f"{(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
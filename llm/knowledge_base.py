@@ -0,0 +1,50 @@
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Optional
+
+from .cache import content_hash
+from .kb_artifact import load_index
+from .retrieval import KnowledgeBaseIndex, SectionSearch
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class KnowledgeBase:
+    """Immutable snapshot of data.txt and everything derived from it
+
+    The client swaps the whole snapshot on reload, so a request that already
+    took a reference keeps working with a consistent text, version and index.
+    """
+    text: str
+    version: str
+    index: Optional[SectionSearch] = None
+    loaded_at: float = field(default_factory=time.time)
+
+    @classmethod
+    def build(
+        cls,
+        text: str,
+        with_index: bool = False,
+        max_section_chars: int = 1500,
+        artifact_path: Optional[str] = None,
+    ) -> "KnowledgeBase":
+        """
+        Build snapshot from knowledge base text
+
+        Args:
+            text: Full knowledge base text
+            with_index: Build retrieval index over sections
+            max_section_chars: Maximum size of a section in the index
+            artifact_path: Compiled index file to map, rebuilt if compiled from other text
+
+        Returns:
+            New snapshot
+        """
+        index = None
+        if with_index and artifact_path:
+            index = load_index(text, artifact_path, max_section_chars)
+        elif with_index:
+            index = KnowledgeBaseIndex.from_text(text, max_section_chars)
+        return cls(text=text, version=content_hash(text), index=index)
@@ -0,0 +1,219 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+from .retrieval import CHARS_PER_TOKEN, WORD_RE, estimate_tokens, normalize_word
+
+logger = logging.getLogger(__name__)
+
+MEMORY_USERS = REGISTRY.gauge("conversation_memory_users", "Users with a stored conversation")
+MEMORY_SUMMARIES = REGISTRY.counter("conversation_summaries_total", "Summarizations of old conversation turns by result")
+
+# Words that point back at earlier turns: pronouns, demonstratives and references
+FOLLOW_UP_WORDS = frozenset({
+    "это", "этот", "эта", "эти", "этого", "этой", "этом", "этим", "этих", "этому", "эту",
+    "тот", "та", "те", "того", "той", "том", "тем", "тех", "ту",
+    "он", "она", "оно", "они", "его", "ее", "их", "ему", "ей", "им", "ими",
+    "него", "нее", "них", "нему", "ней", "ним", "нем", "ними",
+    "там", "туда", "оттуда", "тогда", "такой", "такая", "такое", "такие", "таком", "такого",
+    "выше", "ранее", "раньше", "предыдущий", "предыдущем", "предыдущего", "прошлый", "прошлом",
+    "сказал", "сказали", "упомянул", "упомянули", "написал", "написали",
+    "подробнее", "поподробнее", "еще", "тоже", "также",
+})
+# First words that continue the previous question, e.g. «а в Москве?»
+FOLLOW_UP_OPENINGS = frozenset({"а", "и", "но", "или", "ну", "значит"})
+
+# (question, answer)
+Turn = Tuple[str, str]
+# (old summary, trimmed turns, user_id) -> new summary
+Summarizer = Callable[[str, List[Turn], int], Awaitable[str]]
+
+
+@dataclass
+class Conversation:
+    """Recent turns of one user and a summary of older ones"""
+    turns: List[Turn] = field(default_factory=list)
+    summary: str = ""
+    tokens: int = 0  # estimated tokens of summary and turns
+    updated_at: float = 0.0
+    overflow: List[Turn] = field(default_factory=list)  # trimmed turns waiting to be summarized
+    summarizing: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.turns or self.summary)
+
+
+def is_follow_up(query: str) -> bool:
+    """
+    Guess whether a question only makes sense together with the conversation
+
+    Stand-alone questions are answered without history, so they can still come
+    from the answer cache and share in-flight calls with other users.
+
+    Args:
+        query: User question
+
+    Returns:
+        True if the question refers back to earlier turns or continues one
+    """
+    words = [normalize_word(match.group()) for match in WORD_RE.finditer(query)]
+    if not words:
+        return False
+    return words[0] in FOLLOW_UP_OPENINGS or any(word in FOLLOW_UP_WORDS for word in words)
+
+
+def turn_tokens(turn: Turn) -> int:
+    return estimate_tokens(turn[0]) + estimate_tokens(turn[1])
+
+
+class ConversationMemory:
+    """Per-user conversation history with an LRU limit on users and a TTL
+
+    History is trimmed to token_budget estimated tokens on every new turn, so
+    the prompt does not grow with the conversation. Trimmed turns are either
+    dropped or, when a summarizer is set, folded into a short summary in the
+    background, so the answer itself never waits for summarization.
+    """
+
+    def __init__(
+        self,
+        max_users: int = 10000,
+        ttl_seconds: float = 3600,
+        token_budget: int = 1000,
+        summary_tokens: int = 200,
+        summarizer: Optional[Summarizer] = None,
+        follow_ups_only: bool = True,
+    ):
+        """
+        Args:
+            max_users: Conversations kept; the least recently active are dropped first
+            ttl_seconds: Conversation is forgotten after this long without new questions
+            token_budget: Maximum estimated tokens of summary and turns in the prompt
+            summary_tokens: Maximum estimated tokens of the summary
+            summarizer: Coroutine function (old summary, trimmed turns, user_id) -> new summary
+            follow_ups_only: Give history only to questions that look like follow-ups,
+                so stand-alone ones stay cacheable
+        """
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summarizer = summarizer
+        self.follow_ups_only = follow_ups_only
+        self._conversations: "OrderedDict[int, Conversation]" = OrderedDict()
+        self._tasks: set = set()
+        REGISTRY.register_collector(self._collect_metrics)
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def _collect_metrics(self):
+        MEMORY_USERS.set(len(self._conversations))
+
+    def get(self, user_id: int) -> Optional[Conversation]:
+        """Conversation of a user, None if there is none or it expired"""
+        conversation = self._conversations.get(user_id)
+        if conversation is None:
+            return None
+        if time.monotonic() - conversation.updated_at > self.ttl_seconds:
+            del self._conversations[user_id]
+            return None
+        return conversation
+
+    def history_for(self, user_id: int, query: str) -> Optional[Conversation]:
+        """Conversation a question continues, None if it has none or stands on its own"""
+        if self.follow_ups_only and not is_follow_up(query):
+            return None
+        return self.get(user_id) or None
+
+    def reset(self, user_id: int) -> bool:
+        """Forget a user's conversation, True if there was one"""
+        return self._conversations.pop(user_id, None) is not None
+
+    def add(self, user_id: int, question: str, answer: str):
+        """
+        Remember a question and its answer
+
+        Args:
+            user_id: Telegram user ID
+            question: User question
+            answer: Answer sent to the user
+        """
+        conversation = self.get(user_id)
+        if conversation is None:
+            conversation = Conversation()
+            self._conversations[user_id] = conversation
+        self._conversations.move_to_end(user_id)
+
+        # A single long answer must not push everything else out of the budget
+        max_chars = self.token_budget * CHARS_PER_TOKEN // 2
+        if len(answer) > max_chars:
+            answer = answer[:max_chars] + "…"
+
+        turn = (question, answer)
+        conversation.turns.append(turn)
+        conversation.tokens += turn_tokens(turn)
+        conversation.updated_at = time.monotonic()
+
+        trimmed = []
+        while conversation.tokens > self.token_budget and len(conversation.turns) > 1:
+            old = conversation.turns.pop(0)
+            conversation.tokens -= turn_tokens(old)
+            trimmed.append(old)
+
+        if trimmed and self.summarizer is not None:
+            conversation.overflow.extend(trimmed)
+            if not conversation.summarizing:
+                conversation.summarizing = True
+                task = asyncio.create_task(self._summarize(user_id, conversation))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+        while len(self._conversations) > self.max_users:
+            self._conversations.popitem(last=False)
+
+    async def _summarize(self, user_id: int, conversation: Conversation):
+        """Fold trimmed turns into the summary until none are left"""
+        try:
+            while conversation.overflow:
+                turns, conversation.overflow = conversation.overflow, []
+                try:
+                    summary = await self.summarizer(conversation.summary, turns, user_id)
+                except Exception as e:
+                    MEMORY_SUMMARIES.inc(result="error")
+                    logger.warning(f"Failed to summarize conversation of user {user_id}: {e}")
+                    continue
+                if not summary:
+                    MEMORY_SUMMARIES.inc(result="error")
+                    continue
+
+                MEMORY_SUMMARIES.inc(result="ok")
+                summary = summary.strip()[:self.summary_tokens * CHARS_PER_TOKEN]
+                conversation.tokens += estimate_tokens(summary) - (
+                    estimate_tokens(conversation.summary) if conversation.summary else 0
+                )
+                conversation.summary = summary
+
+                # Make room for the summary within the budget
+                while conversation.tokens > self.token_budget and len(conversation.turns) > 1:
+                    old = conversation.turns.pop(0)
+                    conversation.tokens -= turn_tokens(old)
+                    conversation.overflow.append(old)
+        finally:
+            conversation.summarizing = False
+
+    async def close(self):
+        """Wait for background summarizations"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'users': len(self._conversations),
+            'summarizing': len(self._tasks),
+        }
@@ -1,31 +1,169 @@
+import asyncio
 import logging
+import time
+import weakref
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
 from pathlib import Path
-from typing import List, Dict
-from openai import OpenAI
+from typing import AsyncIterator, Callable, List, Dict, Optional
+from openai import OpenAI, AsyncOpenAI
+
+from metrics import REGISTRY
+from .cache import AnswerCache, normalize_query
+from .coalescing import CallAborted, SingleFlight
+from .knowledge_base import KnowledgeBase
+from .memory import Conversation, ConversationMemory, Turn
+from .reasoning import ALWAYS, MODE_ALWAYS, NEVER, ReasoningClassifier, ReasoningDecision
+from .routing import ModelRouter, ModelSpec
+from .transport import HTTPTransport
 
 logger = logging.getLogger(__name__)
 
+OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+ERROR_ANSWER = "Извините, произошла ошибка при генерации ответа. Попробуйте позже."
+ERROR_CHAT = "Извините, произошла ошибка."
+
+LLM_DURATION = REGISTRY.histogram("llm_request_duration_seconds", "Duration of OpenRouter requests")
+LLM_TTFT = REGISTRY.histogram("llm_time_to_first_token_seconds", "Time until the first streamed answer token")
+LLM_QUEUE_WAIT = REGISTRY.histogram("llm_queue_wait_seconds", "Time spent waiting for a free LLM slot")
+LLM_TOKENS = REGISTRY.counter("llm_tokens_total", "Tokens reported by OpenRouter usage")
+LLM_ERRORS = REGISTRY.counter("llm_errors_total", "Failed OpenRouter requests")
+LLM_IN_FLIGHT = REGISTRY.gauge("llm_in_flight", "OpenRouter requests in progress")
+LLM_QUEUE_DEPTH = REGISTRY.gauge("llm_queue_depth", "Requests waiting for a free LLM slot")
+
+CONTEXT_MODE_FULL = "full"
+CONTEXT_MODE_RETRIEVAL = "retrieval"
+
+
+class QueueFullError(Exception):
+    """Raised when too many requests are already waiting for a free LLM slot"""
+
+
+class EmptyResponseError(Exception):
+    """Raised when a model finished a stream without any answer text"""
+
+
+class StreamInterrupted(Exception):
+    """Raised when a stream fails after part of the answer was already yielded"""
+
+
+@dataclass
+class AnswerInfo:
+    """How an answer was produced; filled in by the client for the interaction log"""
+    source: str = "llm"  # "llm", "cache", "coalesced" or "error"
+    model: Optional[str] = None
+    kb_version: Optional[str] = None
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+    def add_usage(self, usage):
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens or 0
+            self.completion_tokens += usage.completion_tokens or 0
+
+    def add_abandoned(self, results: List, usage):
+        """Charge hedged requests that lost the race: their own usage if they finished, else the winner's prompt"""
+        for result in results:
+            own = getattr(result, "usage", None)
+            if own is not None:
+                self.add_usage(own)
+            elif usage is not None:
+                self.prompt_tokens += usage.prompt_tokens or 0
+
 
 class OpenRouterClient:
-    """Client for OpenRouter API using a plain system prompt with full data.txt"""
+    """Client for OpenRouter API using a system prompt with data.txt (full or retrieved sections)"""
 
-    def __init__(self, api_key: str, model: str = "amazon/nova-2-lite-v1:free", data_file: str = "data/data.txt"):
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "amazon/nova-2-lite-v1:free",
+        data_file: str = "data/data.txt",
+        max_concurrency: int = 8,
+        max_queue_size: int = 64,
+        context_mode: str = CONTEXT_MODE_FULL,
+        top_k: int = 5,
+        context_token_budget: int = 3000,
+        max_section_chars: int = 1500,
+        cache: Optional[AnswerCache] = None,
+        coalesce: bool = True,
+        base_url: str = OPENROUTER_BASE_URL,
+        router: Optional[ModelRouter] = None,
+        transport: Optional[HTTPTransport] = None,
+        memory: Optional[ConversationMemory] = None,
+        kb_artifact: Optional[str] = None,
+        reasoning: Optional[ReasoningClassifier] = None,
+    ):
         """
         Initialize OpenRouter client
 
         Args:
             api_key: OpenRouter API key
-            model: Model name to use
+            model: Model name to use when no router is given
             data_file: Path to full knowledge base text that will be injected into the system prompt
+            max_concurrency: Maximum number of simultaneous async requests to OpenRouter
+            max_queue_size: Maximum number of async requests waiting for a free slot
+            context_mode: "full" to inject the whole knowledge base, "retrieval" to inject
+                only the sections relevant to the question
+            top_k: Maximum number of sections in retrieval mode
+            context_token_budget: Maximum estimated tokens of sections in retrieval mode
+            max_section_chars: Maximum size of a knowledge base section in retrieval mode
+            cache: Optional cache of generated answers
+            coalesce: Share one upstream call between concurrent identical questions
+            base_url: OpenAI-compatible API endpoint, e.g. a local stub for benchmarks
+            router: Ordered models with deadlines, hedging and circuit breaking
+            transport: Shared connection pools, timeouts and retries for API calls
+            memory: Per-user conversation history for follow-up questions
+            kb_artifact: Compiled knowledge base file mapped in retrieval mode instead of
+                indexing data.txt on every start
+            reasoning: Per-question choice of reasoning effort; reasoning is always
+                enabled without it
         """
-        self.model = model
+        if context_mode not in (CONTEXT_MODE_FULL, CONTEXT_MODE_RETRIEVAL):
+            raise ValueError(f"Unknown context mode: {context_mode}")
+
+        self.router = router or ModelRouter([ModelSpec(model)])
+        self.model = self.router.primary
         self.data_file = Path(data_file)
-        self.knowledge_base_text = self._load_data()
+        self.context_mode = context_mode
+        self.top_k = top_k
+        self.context_token_budget = context_token_budget
+        self.max_section_chars = max_section_chars
+        self.kb_artifact = kb_artifact
+        self.cache = cache
+        self.memory = memory
+        self.reasoning = reasoning or ReasoningClassifier(mode=MODE_ALWAYS)
+        # (user_id, prompt tokens, completion tokens) of calls made for a user outside answers
+        self.usage_recorder: Optional[Callable[[int, int, int], None]] = None
+        self.inflight = SingleFlight() if coalesce else None
+        self._data_mtime = self._get_data_mtime()
+        self._kb = self._build_kb(self._load_data())
+        self.transport = transport or HTTPTransport()
+        # Retries are done by the transport within its retry budget
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=base_url,
             api_key=api_key,
+            http_client=self.transport.client,
+            timeout=self.transport.timeout,
+            max_retries=0,
+        )
+        self.async_client = AsyncOpenAI(
+            base_url=base_url,
+            api_key=api_key,
+            http_client=self.transport.async_client,
+            timeout=self.transport.timeout,
+            max_retries=0,
+        )
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._in_flight = 0
+        self._waiting = 0
+        REGISTRY.register_collector(self._collect_metrics)
+        logger.info(
+            f"OpenRouter client initialized with models: {[m.spec.name for m in self.router.models]} "
+            f"(context={context_mode}, concurrency={max_concurrency}, queue={max_queue_size})"
         )
-        logger.info(f"OpenRouter client initialized with model: {model}")
 
     def _load_data(self) -> str:
         """Load the full knowledge base from disk"""
@@ -40,17 +178,220 @@ class OpenRouterClient:
             logger.error(f"Failed to load knowledge base: {e}")
             return ""
 
-    def generate_answer(self, query: str) -> str:
+    def _build_kb(self, text: str) -> KnowledgeBase:
+        """Build knowledge base snapshot for the configured context mode"""
+        return KnowledgeBase.build(
+            text,
+            with_index=self.context_mode == CONTEXT_MODE_RETRIEVAL,
+            max_section_chars=self.max_section_chars,
+            artifact_path=self.kb_artifact
+        )
+
+    def _get_data_mtime(self) -> Optional[float]:
+        """Modification time of the knowledge base file, None if it is missing"""
+        try:
+            return self.data_file.stat().st_mtime
+        except OSError:
+            return None
+
+    @property
+    def knowledge_base(self) -> KnowledgeBase:
+        """Currently active knowledge base snapshot"""
+        return self._kb
+
+    @property
+    def knowledge_base_text(self) -> str:
+        """Text of the active knowledge base"""
+        return self._kb.text
+
+    @property
+    def kb_version(self) -> str:
+        """Content hash of the active knowledge base"""
+        return self._kb.version
+
+    @property
+    def index(self):
+        """Retrieval index of the active knowledge base (None in full mode)"""
+        return self._kb.index
+
+    def _read_and_build(self) -> KnowledgeBase:
+        """Read data file and build a new snapshot, raising on read errors"""
+        text = self.data_file.read_text(encoding="utf-8")
+        return self._build_kb(text)
+
+    def _activate(self, kb: KnowledgeBase) -> str:
+        """Atomically make snapshot active for new requests"""
+        old = self._kb
+        self._kb = kb
+        close = getattr(old.index, "close", None)
+        if close is not None:
+            # Requests that took the old snapshot may still search it, unmap once they are done
+            weakref.finalize(old, close)
+        logger.info(
+            f"Knowledge base reloaded from {self.data_file}: {old.version} -> {kb.version} "
+            f"({len(kb.text)} chars)"
+        )
+        return kb.version
+
+    def reload_data(self) -> str:
         """
-        Generate answer using the entire knowledge base injected into the system prompt
+        Reload knowledge base from disk without restarting
 
-        Args:
-            query: User question
+        Requests that already started keep using the previous snapshot.
 
         Returns:
-            Generated answer
+            Version hash of the new knowledge base
+
+        Raises:
+            OSError: If the data file can not be read (the old snapshot stays active)
         """
-        logger.info(f"Generating answer for query: {query}")
+        # Taken before reading so an edit made while indexing triggers another reload
+        mtime = self._get_data_mtime()
+        version = self._activate(self._read_and_build())
+        self._data_mtime = mtime
+        return version
+
+    async def areload_data(self) -> str:
+        """Async version of reload_data that parses and indexes the file in a worker thread"""
+        mtime = self._get_data_mtime()
+        loop = asyncio.get_running_loop()
+        kb = await loop.run_in_executor(None, self._read_and_build)
+        version = self._activate(kb)
+        self._data_mtime = mtime
+        return version
+
+    async def watch_data_file(self, interval: float = 5.0):
+        """
+        Reload knowledge base whenever the data file modification time changes
+
+        Args:
+            interval: Seconds between checks
+        """
+        logger.info(f"Watching {self.data_file} for changes every {interval}s")
+        while True:
+            await asyncio.sleep(interval)
+            mtime = self._get_data_mtime()
+            if mtime is None or mtime == self._data_mtime:
+                continue
+            try:
+                await self.areload_data()
+            except Exception as e:
+                logger.error(f"Failed to reload knowledge base: {e}")
+
+    @property
+    def in_flight(self) -> int:
+        """Number of async requests currently talking to OpenRouter"""
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of async requests waiting for a free slot"""
+        return self._waiting
+
+    def _collect_metrics(self):
+        """Refresh gauges before metrics are read"""
+        LLM_IN_FLIGHT.set(self._in_flight)
+        LLM_QUEUE_DEPTH.set(self._waiting)
+
+    def _record_usage(self, usage, model: str, reasoning: ReasoningDecision):
+        """Count prompt, completion and reasoning tokens from an OpenRouter usage object"""
+        if usage is None:
+            return
+        LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt", reasoning=reasoning.effort)
+        LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion", reasoning=reasoning.effort)
+        # Reasoning tokens are part of completion tokens
+        details = getattr(usage, "completion_tokens_details", None)
+        if details is not None and details.reasoning_tokens:
+            LLM_TOKENS.inc(details.reasoning_tokens, model=model, kind="reasoning", reasoning=reasoning.effort)
+
+    def _decide_reasoning(self, messages: List[Dict[str, str]]) -> ReasoningDecision:
+        """Reasoning effort for free-form chat, chosen by the last user message"""
+        for message in reversed(messages):
+            if message.get("role") == "user":
+                return self.reasoning.decide(message.get("content") or "")
+        return self.reasoning.decide("")
+
+    @asynccontextmanager
+    async def _acquire_slot(self):
+        """Wait for a free concurrency slot, rejecting the request if the queue is full"""
+        if self._semaphore.locked() and self._waiting >= self.max_queue_size:
+            raise QueueFullError(
+                f"LLM queue is full ({self._waiting} waiting, {self._in_flight} in flight)"
+            )
+
+        self._waiting += 1
+        started = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self._waiting -= 1
+        LLM_QUEUE_WAIT.observe(time.perf_counter() - started)
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def _get_cached(self, query: str, kb: KnowledgeBase) -> Optional[str]:
+        """Return cached answer for the given knowledge base version, if any"""
+        if self.cache is None:
+            return None
+
+        answer = self.cache.get(query, kb.version)
+        if answer is not None:
+            logger.debug("Answer served from cache")
+        return answer
+
+    def cached_answer(self, query: str) -> Optional[str]:
+        """Cached answer to a question for the active knowledge base, without calling the model"""
+        return self._get_cached(query, self._kb)
+
+    def _set_cached(self, query: str, kb: KnowledgeBase, answer: str):
+        """Store successful answer in cache"""
+        if self.cache is not None and answer and answer.strip():
+            self.cache.set(query, kb.version, answer)
+
+    @staticmethod
+    def _coalescing_key(query: str, kb: KnowledgeBase) -> str:
+        """Identity of a question for request coalescing"""
+        return f"{kb.version}\n{normalize_query(query)}"
+
+    def _build_context(self, query: str, kb: KnowledgeBase) -> str:
+        """
+        Build knowledge base part of the system prompt
+
+        In retrieval mode only the most relevant sections are used. If nothing
+        relevant is found, the whole knowledge base is used as a fallback.
+        """
+        if kb.index is not None:
+            sections = kb.index.select_context(
+                query, top_k=self.top_k, token_budget=self.context_token_budget
+            )
+            if sections:
+                logger.debug(
+                    f"Selected {len(sections)} sections (~{sum(s.tokens for s in sections)} tokens): "
+                    f"{[s.title[:40] for s in sections]}"
+                )
+                context = "\n\n".join(section.text for section in sections)
+                return f"Релевантные фрагменты базы знаний:\n{context}"
+            logger.info("No relevant sections found, using full knowledge base")
+
+        return f"Полный контекст базы знаний:\n{kb.text}"
+
+    def _build_messages(
+        self,
+        query: str,
+        kb: Optional[KnowledgeBase] = None,
+        history: Optional[Conversation] = None,
+    ) -> List[Dict[str, str]]:
+        """Build system, history and user messages for a question"""
+        if kb is None:
+            kb = self._kb
+
+        # Follow-ups like "а какие там сроки?" only make sense with the previous question
+        context_query = f"{history.turns[-1][0]}\n{query}" if history and history.turns else query
 
         system_prompt = f"""Ты помощник для абитуриентов Школы анализа данных (ШАД).
 Отвечай на вопросы только на основе предоставленного контекста базы знаний.
@@ -65,28 +406,370 @@ class OpenRouterClient:
 - не используй заголовки (###), таблицы, ссылки и кодовые блоки
 - никаких дополнительных комментариев
 
-Полный контекст базы знаний:
-{self.knowledge_base_text}"""
+{self._build_context(context_query, kb)}"""
+
+        messages = [{"role": "system", "content": system_prompt}]
+        if history:
+            if history.summary:
+                messages.append({
+                    "role": "system",
+                    "content": f"Краткое содержание более раннего разговора с пользователем:\n{history.summary}"
+                })
+            for question, answer in history.turns:
+                messages.append({"role": "user", "content": f"Вопрос: {question}"})
+                messages.append({"role": "assistant", "content": answer})
+        messages.append({"role": "user", "content": f"Вопрос: {query}"})
+        return messages
+
+    def _history(self, user_id: Optional[int], query: str) -> Optional[Conversation]:
+        """Conversation to continue, None for a fresh or stand-alone question"""
+        if self.memory is None or user_id is None:
+            return None
+        return self.memory.history_for(user_id, query)
+
+    def _remember(self, user_id: Optional[int], query: str, answer: Optional[str]):
+        """Add a successful answer to the user's conversation"""
+        if self.memory is None or user_id is None or not answer or not answer.strip() or answer == ERROR_ANSWER:
+            return
+        self.memory.add(user_id, query, answer)
+
+    def reset_conversation(self, user_id: int) -> bool:
+        """Forget a user's conversation, True if there was one"""
+        return self.memory is not None and self.memory.reset(user_id)
+
+    def _complete(
+        self, spec: ModelSpec, messages: List[Dict[str, str]], mode: str, reasoning: ReasoningDecision
+    ) -> str:
+        """Blocking completion request to one model"""
+        started = time.perf_counter()
+        response = self.client.chat.completions.create(
+            model=spec.name,
+            messages=messages,
+            extra_body=reasoning.request_options(),
+            timeout=self.transport.timeout_for(spec.timeout)
+        )
+        LLM_DURATION.observe(time.perf_counter() - started, mode=mode, reasoning=reasoning.effort)
+        self._record_usage(response.usage, spec.name, reasoning)
+        # Content is None when the model returns nothing but reasoning or a refusal
+        return response.choices[0].message.content or ""
+
+    async def _acomplete(
+        self, spec: ModelSpec, messages: List[Dict[str, str]], mode: str, reasoning: ReasoningDecision
+    ):
+        """Completion request to one model, returns the whole API response"""
+        started = time.perf_counter()
+        response = await self.async_client.chat.completions.create(
+            model=spec.name,
+            messages=messages,
+            extra_body=reasoning.request_options(),
+            timeout=self.transport.timeout_for(spec.timeout)
+        )
+        LLM_DURATION.observe(time.perf_counter() - started, mode=mode, reasoning=reasoning.effort)
+        self._record_usage(response.usage, spec.name, reasoning)
+        return response
+
+    async def _aopen_stream(self, spec: ModelSpec, messages: List[Dict[str, str]], reasoning: ReasoningDecision):
+        """
+        Start streaming from one model and wait for the first piece of text
+
+        Returns:
+            Tuple of model name, the open stream and the first text delta
+
+        Raises:
+            EmptyResponseError: If the stream ended without text
+        """
+        stream = await self.async_client.chat.completions.create(
+            model=spec.name,
+            messages=messages,
+            extra_body=reasoning.request_options(),
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=self.transport.timeout_for(spec.timeout)
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    self._record_usage(chunk.usage, spec.name, reasoning)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    return spec.name, stream, chunk.choices[0].delta.content
+        except BaseException:
+            await stream.close()
+            raise
+        await stream.close()
+        raise EmptyResponseError(f"{spec.name} returned an empty stream")
+
+    def generate_answer(self, query: str) -> str:
+        """
+        Generate answer using the knowledge base injected into the system prompt
+
+        Args:
+            query: User question
+
+        Returns:
+            Generated answer
+        """
+        logger.debug(f"Generating answer for query: {query}")
 
-        user_message = f"Вопрос: {query}"
+        kb = self._kb
+        cached = self._get_cached(query, kb)
+        if cached is not None:
+            return cached
 
+        messages = self._build_messages(query, kb)
+        reasoning = self.reasoning.decide(query)
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_message}
-                ],
-                extra_body={"reasoning": {"enabled": True}}
+            answer = self.router.call_sync(
+                lambda spec: self._complete(spec, messages, "complete", reasoning), kind=f"complete:{reasoning.effort}"
             )
-
-            answer = response.choices[0].message.content
-            logger.info(f"Generated answer: {answer[:200]}...")
+            logger.debug(f"Generated answer: {answer[:200]}...")
+            self._set_cached(query, kb, answer)
             return answer
 
         except Exception as e:
+            LLM_ERRORS.inc(mode="complete")
             logger.error(f"Error generating answer: {e}")
-            return "Извините, произошла ошибка при генерации ответа. Попробуйте позже."
+            return ERROR_ANSWER
+
+    async def agenerate_answer(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        info: Optional[AnswerInfo] = None,
+    ) -> str:
+        """
+        Async version of generate_answer that does not block the event loop
+
+        With conversation memory, a follow-up question bypasses the answer
+        cache and coalescing: its answer depends on history. Stand-alone
+        questions of users with a conversation still use both.
+
+        Args:
+            query: User question
+            user_id: Telegram user ID whose conversation the question continues
+            info: Filled with the answer source, model and token usage
+
+        Returns:
+            Generated answer
+
+        Raises:
+            QueueFullError: If too many requests are already waiting for a slot
+        """
+        logger.debug(f"Generating answer for query: {query}")
+
+        kb = self._kb
+        if info is None:
+            info = AnswerInfo()
+        info.kb_version = kb.version
+
+        history = self._history(user_id, query)
+        if history is not None:
+            answer = await self._agenerate_uncached(query, kb, info, history)
+            self._remember(user_id, query, answer)
+            return answer
+
+        answer = await self._agenerate_fresh(query, kb, info)
+        self._remember(user_id, query, answer)
+        return answer
+
+    async def _agenerate_fresh(self, query: str, kb: KnowledgeBase, info: AnswerInfo) -> str:
+        """Answer a question without history: cache, then coalesced upstream call"""
+        cached = self._get_cached(query, kb)
+        if cached is not None:
+            info.source = "cache"
+            return cached
+
+        if self.inflight is None:
+            return await self._agenerate_uncached(query, kb, info)
+
+        key = self._coalescing_key(query, kb)
+        while True:
+            # Stays "coalesced" unless this caller becomes the leader and calls the model
+            info.source = "coalesced"
+            try:
+                return await self.inflight.do(key, lambda: self._agenerate_uncached(query, kb, info))
+            except CallAborted:
+                logger.info("Coalesced request was aborted by its leader, retrying")
+
+    async def _agenerate_uncached(
+        self,
+        query: str,
+        kb: KnowledgeBase,
+        info: AnswerInfo,
+        history: Optional[Conversation] = None,
+    ) -> str:
+        """Call OpenRouter for a question that is not in cache"""
+        info.source = "llm"
+        async with self._acquire_slot():
+            messages = self._build_messages(query, kb, history)
+            reasoning = self.reasoning.decide(query)
+            losers = []
+            try:
+                response = await self.router.call(
+                    lambda spec: self._acomplete(spec, messages, "complete", reasoning),
+                    kind=f"complete:{reasoning.effort}",
+                    abandoned=lambda spec, result: losers.append(result)
+                )
+                answer = response.choices[0].message.content or ""
+                info.model = response.model
+                info.add_usage(response.usage)
+                info.add_abandoned(losers, response.usage)
+                logger.debug(f"Generated answer: {answer[:200]}...")
+                if history is None:
+                    self._set_cached(query, kb, answer)
+                return answer
+
+            except Exception as e:
+                LLM_ERRORS.inc(mode="complete")
+                logger.error(f"Error generating answer: {e}")
+                info.source = "error"
+                return ERROR_ANSWER
+
+    async def astream_answer(
+        self,
+        query: str,
+        user_id: Optional[int] = None,
+        info: Optional[AnswerInfo] = None,
+    ) -> AsyncIterator[str]:
+        """
+        Stream answer text as the model generates it
+
+        Cached answers are yielded as a single chunk. If the request fails before
+        any text arrives, the generic error answer is yielded instead. A stream
+        cut off midway raises StreamInterrupted: the partial answer is neither
+        cached, remembered nor shared with coalesced callers.
+
+        Args:
+            query: User question
+            user_id: Telegram user ID whose conversation the question continues
+            info: Filled with the answer source, model and token usage
+
+        Yields:
+            Pieces of the answer in generation order
+
+        Raises:
+            QueueFullError: If too many requests are already waiting for a slot
+            StreamInterrupted: If the stream failed after part of the answer was yielded
+        """
+        logger.debug(f"Streaming answer for query: {query}")
+
+        kb = self._kb
+        if info is None:
+            info = AnswerInfo()
+        info.kb_version = kb.version
+
+        history = self._history(user_id, query)
+        if history is not None:
+            parts = []
+            async for delta in self._astream_uncached(query, kb, info, history):
+                parts.append(delta)
+                yield delta
+            self._remember(user_id, query, "".join(parts))
+            return
+
+        cached = self._get_cached(query, kb)
+        if cached is not None:
+            info.source = "cache"
+            yield cached
+            self._remember(user_id, query, cached)
+            return
+
+        if self.inflight is not None:
+            key = self._coalescing_key(query, kb)
+            future = self.inflight.in_flight(key)
+            if future is not None:
+                try:
+                    answer = await self.inflight.join(future)
+                    info.source = "coalesced"
+                    yield answer
+                    self._remember(user_id, query, answer)
+                    return
+                except CallAborted:
+                    logger.info("Coalesced request was aborted by its leader, streaming on its own")
+            future = self.inflight.begin(key)
+
+        parts = []
+        answer = None
+        error = None
+        stream = self._astream_uncached(query, kb, info)
+        try:
+            async for delta in stream:
+                parts.append(delta)
+                yield delta
+            answer = "".join(parts)
+        except Exception as e:
+            # Waiters got nothing yet, so they may as well ask the model themselves
+            error = CallAborted() if isinstance(e, StreamInterrupted) else e
+            raise
+        finally:
+            # Release the concurrency slot right away if the consumer stopped early
+            await stream.aclose()
+            if self.inflight is not None:
+                if answer is None and error is None:
+                    error = CallAborted()
+                self.inflight.finish(key, future, result=answer, error=error)
+        self._remember(user_id, query, answer)
+
+    async def _astream_uncached(
+        self,
+        query: str,
+        kb: KnowledgeBase,
+        info: AnswerInfo,
+        history: Optional[Conversation] = None,
+    ) -> AsyncIterator[str]:
+        """Stream OpenRouter answer for a question that is not in cache"""
+        info.source = "llm"
+        async with self._acquire_slot():
+            messages = self._build_messages(query, kb, history)
+            reasoning = self.reasoning.decide(query)
+            started = time.perf_counter()
+            losers = []
+            try:
+                model, stream, first = await self.router.call(
+                    lambda spec: self._aopen_stream(spec, messages, reasoning),
+                    kind=f"stream:{reasoning.effort}",
+                    discard=lambda opened: opened[1].close(),
+                    abandoned=lambda spec, result: losers.append(None)
+                )
+            except Exception as e:
+                LLM_ERRORS.inc(mode="stream")
+                logger.error(f"Error streaming answer: {e}")
+                info.source = "error"
+                yield ERROR_ANSWER
+                return
+
+            info.model = model
+            LLM_TTFT.observe(time.perf_counter() - started, reasoning=reasoning.effort)
+            parts = [first]
+            yield first
+
+            try:
+                async for chunk in stream:
+                    if chunk.usage is not None:
+                        self._record_usage(chunk.usage, model, reasoning)
+                        info.add_usage(chunk.usage)
+                        info.add_abandoned(losers, chunk.usage)
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+
+                LLM_DURATION.observe(time.perf_counter() - started, mode="stream", reasoning=reasoning.effort)
+
+            except Exception as e:
+                # Part of the answer is already shown, so switching models is not an option
+                LLM_ERRORS.inc(mode="stream")
+                logger.error(f"Error streaming answer from {model}: {e}")
+                info.source = "error"
+                raise StreamInterrupted(f"{model} stream failed after {len(parts)} chunks: {e}") from e
+            finally:
+                await stream.close()
+
+            answer = "".join(parts)
+            logger.debug(f"Generated answer: {answer[:200]}...")
+            if history is None:
+                self._set_cached(query, kb, answer)
 
     def chat(self, messages: List[Dict[str, str]]) -> str:
         """
@@ -98,14 +781,84 @@ class OpenRouterClient:
         Returns:
             Model response
         """
+        reasoning = self._decide_reasoning(messages)
         try:
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                extra_body={"reasoning": {"enabled": True}}
-            )
-            return response.choices[0].message.content
+            return self.router.call_sync(lambda spec: self._complete(spec, messages, "chat", reasoning))
 
         except Exception as e:
+            LLM_ERRORS.inc(mode="chat")
             logger.error(f"Error in chat: {e}")
-            return "Извините, произошла ошибка."
+            return ERROR_CHAT
+
+    async def achat(self, messages: List[Dict[str, str]]) -> str:
+        """
+        Async version of chat that does not block the event loop
+
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+
+        Returns:
+            Model response
+
+        Raises:
+            QueueFullError: If too many requests are already waiting for a slot
+        """
+        reasoning = self._decide_reasoning(messages)
+        async with self._acquire_slot():
+            try:
+                response = await self.router.call(lambda spec: self._acomplete(spec, messages, "chat", reasoning))
+                return response.choices[0].message.content or ""
+
+            except Exception as e:
+                LLM_ERRORS.inc(mode="chat")
+                logger.error(f"Error in chat: {e}")
+                return ERROR_CHAT
+
+    async def asummarize_conversation(self, summary: str, turns: List[Turn], user_id: Optional[int] = None) -> str:
+        """
+        Fold old conversation turns into a short summary (ConversationMemory summarizer)
+
+        Args:
+            summary: Current summary, may be empty
+            turns: Questions and answers trimmed from the conversation
+            user_id: Telegram user ID whose conversation it is; tokens are passed to usage_recorder
+
+        Returns:
+            New summary, empty on failure
+
+        Raises:
+            QueueFullError: If too many requests are already waiting for a slot
+        """
+        dialog = "\n".join(f"Пользователь: {question}\nБот: {answer}" for question, answer in turns)
+        if summary:
+            dialog = f"Прежнее краткое содержание: {summary}\n\n{dialog}"
+
+        messages = [
+            {
+                "role": "system",
+                "content": "Кратко перескажи разговор абитуриента с ботом ШАД в 2–4 предложениях: "
+                           "что пользователь спрашивал, что о себе рассказал и какие факты уже получил. "
+                           "Только пересказ, без вступлений."
+            },
+            {"role": "user", "content": dialog}
+        ]
+        # A retelling needs no reasoning, unless it is forced on for everything
+        reasoning = ALWAYS if self.reasoning.mode == MODE_ALWAYS else NEVER
+        async with self._acquire_slot():
+            losers = []
+            try:
+                response = await self.router.call(
+                    lambda spec: self._acomplete(spec, messages, "summary", reasoning),
+                    kind="summary",
+                    abandoned=lambda spec, result: losers.append(result)
+                )
+                if user_id is not None and self.usage_recorder is not None:
+                    info = AnswerInfo()
+                    info.add_usage(response.usage)
+                    info.add_abandoned(losers, response.usage)
+                    self.usage_recorder(user_id, info.prompt_tokens, info.completion_tokens)
+                return response.choices[0].message.content or ""
+            except Exception as e:
+                LLM_ERRORS.inc(mode="summary")
+                logger.error(f"Error summarizing conversation: {e}")
+                return ""
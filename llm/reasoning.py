@@ -0,0 +1,279 @@
+"""Per-question choice of model reasoning effort
+
+A question gets a complexity score from a small logistic model over cheap
+text features; the score is mapped to a reasoning effort through thresholds.
+Built-in weights are hand-tuned; a model trained on labelled questions can
+replace them:
+
+    python -m llm.reasoning --train labelled.jsonl --output reasoning_model.json
+
+Each line of the training file is {"question": "...", "reasoning": true|false}.
+"""
+import argparse
+import json
+import logging
+import math
+import random
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+REASONING_DECISIONS = REGISTRY.counter("llm_reasoning_decisions_total", "Questions by chosen reasoning effort")
+
+EFFORT_OFF = "off"
+EFFORTS = ("low", "medium", "high")
+
+MODE_AUTO = "auto"
+MODE_ALWAYS = "always"
+MODE_NEVER = "never"
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+CLAUSE_RE = re.compile(r",|;|\s(?:и|или|а|но|потому что|чтобы)\s")
+REASONING_CUES_RE = re.compile(
+    r"\b(почему|зачем|стоит ли|сравн|отлича|разниц|объясн|посовет|шанс|подготов|план|стратег|"
+    r"если|выбр|что делать|реально ли|лучше|как совместить|успею|имеет смысл)"
+)
+LOOKUP_CUES_RE = re.compile(
+    r"\b(когда|где|сайт|ссылк|адрес|телефон|почт|дата|до какого|сколько стоит|бесплатн|во сколько)"
+)
+SMALL_TALK_RE = re.compile(
+    r"^\W*(привет|здравствуй|добрый (день|вечер)|доброе утро|спасибо|благодарю|пока|ок|окей|понятно|"
+    r"хорошо|ясно|супер|класс)\W*$"
+)
+PERSONAL_RE = re.compile(r"\b(я|мне|меня|у меня|мой|моя|мои|мое)\b")
+DIGIT_RE = re.compile(r"\d")
+
+# Hand-tuned logistic model over the features below
+DEFAULT_BIAS = -1.0
+DEFAULT_WEIGHTS = {
+    "words": 2.0,
+    "questions": 0.3,
+    "clauses": 0.8,
+    "reasoning_cues": 1.8,
+    "lookup_cues": -1.0,
+    "small_talk": -3.0,
+    "numbers": 0.4,
+    "personal": 0.9,
+}
+
+
+def features(question: str) -> Dict[str, float]:
+    """Cheap text features of a question, each roughly within [0, 1]"""
+    text = question.lower().replace("ё", "е")
+    words = WORD_RE.findall(text)
+    return {
+        "words": min(len(words), 40) / 40,
+        "questions": min(text.count("?"), 3) / 3,
+        "clauses": min(len(CLAUSE_RE.findall(text)), 5) / 5,
+        "reasoning_cues": 1.0 if REASONING_CUES_RE.search(text) else 0.0,
+        "lookup_cues": 1.0 if LOOKUP_CUES_RE.search(text) else 0.0,
+        "small_talk": 1.0 if SMALL_TALK_RE.match(text) else 0.0,
+        "numbers": 1.0 if DIGIT_RE.search(text) else 0.0,
+        "personal": 1.0 if PERSONAL_RE.search(text) else 0.0,
+    }
+
+
+def _sigmoid(x: float) -> float:
+    if x < -30:
+        return 0.0
+    return 1 / (1 + math.exp(-x))
+
+
+@dataclass(frozen=True)
+class ReasoningDecision:
+    """Reasoning effort chosen for one request"""
+    effort: str  # "off", "low", "medium" or "high"
+    score: float = 1.0
+    reason: str = "auto"
+
+    @property
+    def enabled(self) -> bool:
+        return self.effort != EFFORT_OFF
+
+    def request_options(self) -> Dict:
+        """extra_body for an OpenRouter chat completion request"""
+        if not self.enabled:
+            return {"reasoning": {"enabled": False}}
+        if self.effort in EFFORTS:
+            return {"reasoning": {"effort": self.effort}}
+        return {"reasoning": {"enabled": True}}
+
+
+# Reasoning as it was before per-question decisions: enabled with the model's default effort
+ALWAYS = ReasoningDecision("on", reason=MODE_ALWAYS)
+NEVER = ReasoningDecision(EFFORT_OFF, score=0.0, reason=MODE_NEVER)
+
+
+class ReasoningClassifier:
+    """Decide per question whether the model should reason, and how hard"""
+
+    def __init__(
+        self,
+        mode: str = MODE_AUTO,
+        thresholds: Optional[Dict[str, float]] = None,
+        overrides: Optional[List[Dict[str, str]]] = None,
+        model_path: Optional[str] = None,
+    ):
+        """
+        Args:
+            mode: "auto" to classify, "always" or "never" to skip classification
+            thresholds: Minimum score for each effort, e.g. {"low": 0.5, "high": 0.9};
+                questions scoring below all of them get no reasoning
+            overrides: [{"pattern": regex, "effort": "off"|"low"|"medium"|"high"}], checked
+                in order before the model; the first matching pattern wins
+            model_path: JSON with "bias" and "weights" replacing the built-in weights
+        """
+        if mode not in (MODE_AUTO, MODE_ALWAYS, MODE_NEVER):
+            raise ValueError(f"Unknown reasoning mode: {mode}")
+
+        self.mode = mode
+        if thresholds is None:
+            thresholds = {"low": 0.5, "medium": 0.75, "high": 0.9}
+        for effort in thresholds:
+            if effort not in EFFORTS:
+                raise ValueError(f"Unknown reasoning effort: {effort}")
+        # Highest threshold first, so the first one the score reaches wins
+        self.thresholds: List[Tuple[float, str]] = sorted(
+            ((value, effort) for effort, value in thresholds.items()), reverse=True
+        )
+
+        self.overrides: List[Tuple[re.Pattern, str]] = []
+        for override in overrides or []:
+            effort = override["effort"]
+            if effort != EFFORT_OFF and effort not in EFFORTS:
+                raise ValueError(f"Unknown reasoning effort: {effort}")
+            self.overrides.append((re.compile(override["pattern"], re.IGNORECASE), effort))
+
+        self.bias = DEFAULT_BIAS
+        self.weights = dict(DEFAULT_WEIGHTS)
+        if model_path:
+            self.load_model(model_path)
+
+    def load_model(self, path: str):
+        """Replace weights with a trained model"""
+        with open(path, encoding="utf-8") as f:
+            model = json.load(f)
+        unknown = set(model["weights"]) - set(DEFAULT_WEIGHTS)
+        if unknown:
+            logger.warning(f"Reasoning model {path} has unknown features, ignoring: {sorted(unknown)}")
+        self.bias = model["bias"]
+        self.weights = {name: model["weights"].get(name, 0.0) for name in DEFAULT_WEIGHTS}
+        logger.info(f"Loaded reasoning model from {path}")
+
+    def score(self, question: str) -> float:
+        """Probability that the question benefits from reasoning"""
+        values = features(question)
+        return _sigmoid(self.bias + sum(self.weights[name] * values[name] for name in self.weights))
+
+    def decide(self, question: str) -> ReasoningDecision:
+        """
+        Choose reasoning effort for a question
+
+        Args:
+            question: User question
+
+        Returns:
+            Decision to pass with the request
+        """
+        decision = self._decide(question)
+        REASONING_DECISIONS.inc(effort=decision.effort, reason=decision.reason)
+        return decision
+
+    def _decide(self, question: str) -> ReasoningDecision:
+        if self.mode == MODE_ALWAYS:
+            return ALWAYS
+        if self.mode == MODE_NEVER:
+            return NEVER
+
+        for pattern, effort in self.overrides:
+            if pattern.search(question):
+                return ReasoningDecision(effort, reason="override")
+
+        score = self.score(question)
+        for threshold, effort in self.thresholds:
+            if score >= threshold:
+                return ReasoningDecision(effort, score=score)
+        return ReasoningDecision(EFFORT_OFF, score=score)
+
+
+def create_reasoning_classifier(config) -> ReasoningClassifier:
+    """
+    Build the reasoning classifier from config
+
+    Args:
+        config: ReasoningConfig from config.json
+
+    Returns:
+        Classifier for OpenRouterClient
+    """
+    classifier = ReasoningClassifier(
+        mode=config.mode,
+        thresholds=config.thresholds,
+        overrides=config.overrides,
+        model_path=config.model_path or None,
+    )
+    logger.info(f"Reasoning: {config.mode}, thresholds {config.thresholds}, {len(config.overrides)} overrides")
+    return classifier
+
+
+def train(examples: List[Tuple[str, bool]], epochs: int = 300, learning_rate: float = 0.5, l2: float = 0.001) -> Dict:
+    """
+    Fit logistic regression weights by gradient descent
+
+    Args:
+        examples: (question, needs reasoning) pairs
+        epochs: Passes over the data
+        learning_rate: Step size
+        l2: Weight decay
+
+    Returns:
+        Model with "bias" and "weights", loadable by ReasoningClassifier
+    """
+    rows = [(features(question), 1.0 if label else 0.0) for question, label in examples]
+    bias = DEFAULT_BIAS
+    weights = dict(DEFAULT_WEIGHTS)
+
+    for _ in range(epochs):
+        random.shuffle(rows)
+        for values, label in rows:
+            error = _sigmoid(bias + sum(weights[name] * values[name] for name in weights)) - label
+            bias -= learning_rate * error
+            for name in weights:
+                weights[name] -= learning_rate * (error * values[name] + l2 * weights[name])
+
+    return {"bias": round(bias, 4), "weights": {name: round(value, 4) for name, value in weights.items()}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train or try the reasoning classifier")
+    parser.add_argument("--train", help="JSONL with question and reasoning fields")
+    parser.add_argument("--output", default="reasoning_model.json")
+    parser.add_argument("--model", help="trained model to try questions with")
+    parser.add_argument("questions", nargs="*", help="questions to classify")
+    args = parser.parse_args()
+
+    if args.train:
+        with open(args.train, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        examples = [(row["question"], bool(row["reasoning"])) for row in rows]
+        model = train(examples)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(model, f, indent=2)
+
+        classifier = ReasoningClassifier(model_path=args.output)
+        correct = sum((classifier.score(question) >= 0.5) == label for question, label in examples)
+        print(f"Trained on {len(examples)} questions, accuracy {correct / len(examples):.0%}, saved to {args.output}")
+        return
+
+    classifier = ReasoningClassifier(model_path=args.model)
+    for question in args.questions:
+        decision = classifier._decide(question)
+        print(f"{decision.score:.2f} {decision.effort:<6} {question}")
+
+
+if __name__ == "__main__":
+    main()
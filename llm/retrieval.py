@@ -0,0 +1,220 @@
+import logging
+import math
+import re
+from abc import ABC, abstractmethod
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import List, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Rough average for Russian text with OpenAI-style tokenizers
+CHARS_PER_TOKEN = 3
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Suffixes of Russian inflections, longest first, stripped by the light stemmer
+RUSSIAN_SUFFIXES = sorted([
+    "ами", "ями", "ого", "его", "ому", "ему", "ыми", "ими", "ой", "ей", "ий", "ый", "ая", "яя",
+    "ое", "ее", "ые", "ие", "ую", "юю", "ом", "ем", "ах", "ях", "ам", "ям", "ов", "ев", "ею",
+    "ою", "ых", "их", "ия", "ии", "ию", "ть", "ти", "ет", "ют", "ут", "ит", "ат", "ят",
+    "ешь", "ишь", "им", "ете", "ите", "ал", "ял", "ил", "ел", "ла", "ли", "ло", "ся", "сь",
+    "ться", "тся", "ение", "ения", "ению", "ением", "ений", "ость", "ости", "остью",
+    "а", "я", "о", "е", "ы", "и", "у", "ю", "ь", "й",
+], key=len, reverse=True)
+
+# Short frequent words that carry no meaning for search
+STOP_WORDS = {
+    "и", "в", "во", "не", "на", "с", "со", "что", "как", "а", "по", "к", "ко", "у", "из",
+    "за", "от", "до", "о", "об", "для", "или", "же", "ли", "бы", "то", "это", "мне", "меня",
+    "мы", "вы", "я", "он", "она", "они", "его", "ее", "их", "есть", "при", "так",
+    "но", "да", "нет", "ну", "the", "a", "an", "of", "to", "in", "and", "or", "is",
+}
+
+MIN_STEM_LENGTH = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate number of model tokens in text"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def normalize_word(word: str) -> str:
+    """Lowercase a word and unify ё/е"""
+    return word.lower().replace("ё", "е")
+
+
+def stem(word: str) -> str:
+    """Strip the longest known inflection suffix, keeping at least a short stem"""
+    for suffix in RUSSIAN_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= MIN_STEM_LENGTH:
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized, stemmed terms without stop words"""
+    terms = []
+    for match in WORD_RE.finditer(text):
+        word = normalize_word(match.group())
+        if word in STOP_WORDS:
+            continue
+        terms.append(stem(word))
+    return terms
+
+
+@dataclass
+class Section:
+    """Part of the knowledge base that can be included into the prompt"""
+    title: str
+    text: str
+    position: int
+    tokens: int = field(init=False)
+
+    def __post_init__(self):
+        self.tokens = estimate_tokens(self.text)
+
+
+def split_sections(text: str, max_chars: int = 1500) -> List[Section]:
+    """
+    Split knowledge base into sections separated by blank lines
+
+    Sections longer than max_chars are split by lines; each part keeps
+    the section title as its first line so it stays understandable alone.
+
+    Args:
+        text: Full knowledge base text
+        max_chars: Maximum size of a single section
+
+    Returns:
+        Sections in document order
+    """
+    sections: List[Section] = []
+
+    for block in re.split(r"\n\s*\n", text):
+        lines = [line for line in block.strip().splitlines() if line.strip()]
+        if not lines:
+            continue
+
+        title = lines[0].strip()
+        body = "\n".join(lines)
+        if len(body) <= max_chars:
+            sections.append(Section(title=title, text=body, position=len(sections)))
+            continue
+
+        part = [lines[0]]
+        part_len = len(lines[0])
+        for line in lines[1:]:
+            if part_len + len(line) + 1 > max_chars and len(part) > 1:
+                sections.append(Section(title=title, text="\n".join(part), position=len(sections)))
+                part = [title]
+                part_len = len(title)
+            part.append(line)
+            part_len += len(line) + 1
+        if len(part) > 1:
+            sections.append(Section(title=title, text="\n".join(part), position=len(sections)))
+
+    return sections
+
+
+class SectionSearch(ABC):
+    """Context selection on top of a BM25 search over sections"""
+
+    @abstractmethod
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Section, float]]:
+        """
+        Find sections most relevant to the query
+
+        Args:
+            query: User question
+            top_k: Maximum number of sections to return
+
+        Returns:
+            Pairs of (section, score) with positive score, best first
+        """
+
+    def select_context(self, query: str, top_k: int = 5, token_budget: int = 3000) -> List[Section]:
+        """
+        Pick the most relevant sections that fit into the token budget
+
+        Args:
+            query: User question
+            top_k: Maximum number of sections
+            token_budget: Maximum total estimated tokens of selected sections
+
+        Returns:
+            Selected sections in document order
+        """
+        selected = []
+        used = 0
+        for section, _ in self.search(query, top_k=top_k):
+            if used + section.tokens > token_budget:
+                continue
+            selected.append(section)
+            used += section.tokens
+
+        selected.sort(key=lambda section: section.position)
+        return selected
+
+
+class KnowledgeBaseIndex(SectionSearch):
+    """In-memory BM25 index over knowledge base sections"""
+
+    def __init__(self, sections: List[Section], k1: float = 1.5, b: float = 0.75):
+        """
+        Build index
+
+        Args:
+            sections: Knowledge base sections
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+        """
+        self.sections = sections
+        self.k1 = k1
+        self.b = b
+
+        self._term_freqs: List[Counter] = []
+        self._lengths: List[int] = []
+        doc_freqs: Counter = Counter()
+
+        for section in sections:
+            # Titles are usually the question the section answers, so weigh them twice
+            terms = tokenize(section.text) + tokenize(section.title)
+            freqs = Counter(terms)
+            self._term_freqs.append(freqs)
+            self._lengths.append(len(terms))
+            doc_freqs.update(freqs.keys())
+
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        n = len(sections)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in doc_freqs.items()
+        }
+
+        logger.info(f"Built knowledge base index: {n} sections, {len(self._idf)} terms")
+
+    @classmethod
+    def from_text(cls, text: str, max_section_chars: int = 1500) -> "KnowledgeBaseIndex":
+        """Split text into sections and index them"""
+        return cls(split_sections(text, max_chars=max_section_chars))
+
+    def search(self, query: str, top_k: int = 5) -> List[Tuple[Section, float]]:
+        query_terms = set(tokenize(query))
+        if not query_terms or not self.sections:
+            return []
+
+        scored = []
+        for i, freqs in enumerate(self._term_freqs):
+            score = 0.0
+            length_norm = 1 - self.b + self.b * self._lengths[i] / (self._avg_length or 1)
+            for term in query_terms:
+                tf = freqs.get(term)
+                if not tf:
+                    continue
+                score += self._idf[term] * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+            if score > 0:
+                scored.append((self.sections[i], score))
+
+        scored.sort(key=lambda pair: pair[1], reverse=True)
+        return scored[:top_k]
@@ -0,0 +1,336 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+MODEL_REQUESTS = REGISTRY.counter("llm_model_requests_total", "Requests per model by result")
+HEDGED_REQUESTS = REGISTRY.counter("llm_hedged_requests_total", "Hedged requests started because the previous model was slow")
+HEDGE_WINS = REGISTRY.counter("llm_hedge_wins_total", "Hedged requests that answered first")
+CIRCUIT_OPEN = REGISTRY.gauge("llm_circuit_open", "1 if the model is skipped by its circuit breaker")
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half-open"
+
+
+class ModelTimeoutError(Exception):
+    """Raised when a model did not answer within its deadline"""
+
+
+@dataclass
+class ModelSpec:
+    """Model and its per-request deadline in seconds (None for no deadline)"""
+    name: str
+    timeout: Optional[float] = None
+
+
+class ModelStats:
+    """Recent latencies, outcome counters and circuit breaker of one model"""
+
+    def __init__(self, spec: ModelSpec, window: int):
+        self.spec = spec
+        self.latencies: Dict[str, Deque[float]] = {}
+        self.window = window
+        self.successes = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.consecutive_failures = 0
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+
+    def record_latency(self, kind: str, seconds: float):
+        self.latencies.setdefault(kind, deque(maxlen=self.window)).append(seconds)
+
+    def quantile(self, kind: str, q: float) -> Optional[float]:
+        values = self.latencies.get(kind)
+        if not values:
+            return None
+        ordered = sorted(values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def samples(self, kind: str) -> int:
+        return len(self.latencies.get(kind, ()))
+
+
+class ModelRouter:
+    """Send each request to an ordered list of models with hedging and circuit breaking
+
+    The first available model gets the request. If it has not answered by its
+    observed p95 latency, a hedged request goes to the next model and the first
+    successful answer wins; the slower one is cancelled. Errors and deadline
+    misses fail over to the next model right away. A model that failed
+    failure_threshold times in a row is skipped for cooldown_seconds, then one
+    probe request decides whether it is used again.
+    """
+
+    def __init__(
+        self,
+        models: List[ModelSpec],
+        hedge: bool = True,
+        hedge_delay: float = 10.0,
+        hedge_min_delay: float = 1.0,
+        hedge_min_samples: int = 20,
+        failure_threshold: int = 5,
+        cooldown_seconds: float = 30.0,
+        window: int = 200,
+    ):
+        """
+        Args:
+            models: Models in order of preference
+            hedge: Start a request to the next model when the current one is slow
+            hedge_delay: Hedge delay used until a model has hedge_min_samples latencies
+            hedge_min_delay: Lower bound of the hedge delay
+            hedge_min_samples: Latencies needed before the observed p95 is trusted
+            failure_threshold: Consecutive failures that open the circuit
+            cooldown_seconds: How long an open circuit skips the model
+            window: Number of recent latencies kept per model and request kind
+        """
+        if not models:
+            raise ValueError("At least one model is required")
+
+        self.models = [ModelStats(spec, window) for spec in models]
+        self.hedge = hedge
+        self.hedge_delay = hedge_delay
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+        REGISTRY.register_collector(self._collect_metrics)
+
+    @property
+    def primary(self) -> str:
+        return self.models[0].spec.name
+
+    def _collect_metrics(self):
+        for model in self.models:
+            CIRCUIT_OPEN.set(1 if model.state == STATE_OPEN else 0, model=model.spec.name)
+
+    def _available(self, model: ModelStats) -> bool:
+        """Whether the circuit breaker lets a request through"""
+        if model.state == STATE_OPEN and time.monotonic() - model.opened_at >= self.cooldown_seconds:
+            model.state = STATE_HALF_OPEN
+            model.probe_in_flight = False
+        if model.state == STATE_HALF_OPEN:
+            return not model.probe_in_flight
+        return model.state == STATE_CLOSED
+
+    def candidates(self) -> List[ModelStats]:
+        """Models to try in order; all of them if every circuit is open"""
+        available = [model for model in self.models if self._available(model)]
+        return available or list(self.models)
+
+    def _hedge_after(self, model: ModelStats, kind: str) -> float:
+        """Seconds to wait for a model before hedging"""
+        delay = self.hedge_delay
+        if model.samples(kind) >= self.hedge_min_samples:
+            delay = model.quantile(kind, 0.95)
+        return max(self.hedge_min_delay, delay)
+
+    def _record_success(self, model: ModelStats, kind: str, seconds: float):
+        model.successes += 1
+        model.consecutive_failures = 0
+        model.probe_in_flight = False
+        model.record_latency(kind, seconds)
+        MODEL_REQUESTS.inc(model=model.spec.name, result="ok")
+        if model.state != STATE_CLOSED:
+            logger.info(f"Model {model.spec.name} recovered, closing circuit")
+            model.state = STATE_CLOSED
+
+    def _record_failure(self, model: ModelStats, error: BaseException):
+        if isinstance(error, ModelTimeoutError):
+            model.timeouts += 1
+            MODEL_REQUESTS.inc(model=model.spec.name, result="timeout")
+        else:
+            model.errors += 1
+            MODEL_REQUESTS.inc(model=model.spec.name, result="error")
+        model.consecutive_failures += 1
+        model.probe_in_flight = False
+
+        if model.state == STATE_HALF_OPEN or model.consecutive_failures >= self.failure_threshold:
+            if model.state != STATE_OPEN:
+                logger.warning(
+                    f"Opening circuit for {model.spec.name} for {self.cooldown_seconds}s "
+                    f"after {model.consecutive_failures} failures"
+                )
+            model.state = STATE_OPEN
+            model.opened_at = time.monotonic()
+
+    async def _attempt(self, model: ModelStats, kind: str, fn: Callable[[ModelSpec], Awaitable[Any]]) -> Any:
+        """Run one request against a model within its deadline and record the outcome"""
+        if model.state == STATE_HALF_OPEN:
+            model.probe_in_flight = True
+
+        started = time.perf_counter()
+        try:
+            if model.spec.timeout:
+                try:
+                    result = await asyncio.wait_for(fn(model.spec), model.spec.timeout)
+                except asyncio.TimeoutError:
+                    raise ModelTimeoutError(f"{model.spec.name} did not answer in {model.spec.timeout}s") from None
+            else:
+                result = await fn(model.spec)
+        except asyncio.CancelledError:
+            # Lost the race or the caller gave up: not the model's fault
+            model.probe_in_flight = False
+            MODEL_REQUESTS.inc(model=model.spec.name, result="cancelled")
+            raise
+        except Exception as e:
+            self._record_failure(model, e)
+            raise
+
+        self._record_success(model, kind, time.perf_counter() - started)
+        return result
+
+    async def call(
+        self,
+        fn: Callable[[ModelSpec], Awaitable[Any]],
+        kind: str = "complete",
+        discard: Optional[Callable[[Any], Awaitable[None]]] = None,
+        abandoned: Optional[Callable[[ModelSpec, Any], None]] = None,
+    ) -> Any:
+        """
+        Run fn against models until one succeeds
+
+        Args:
+            fn: Coroutine function performing the request for a given model
+            kind: Latency class for hedging statistics, e.g. "complete" or "stream"
+            discard: Called with results that finished after the winner, e.g. to close streams
+            abandoned: Called with the model and late result (None if cancelled) of every
+                request that lost to the winner; the provider may bill them all the same
+
+        Returns:
+            Result of the first successful request
+
+        Raises:
+            Exception: Error of the last model if all of them failed
+        """
+        queue = self.candidates()
+        pending: Dict[asyncio.Task, ModelStats] = {}
+        hedged: set = set()
+        last_error: Optional[BaseException] = None
+
+        def launch(is_hedge: bool = False):
+            model = queue.pop(0)
+            task = asyncio.create_task(self._attempt(model, kind, fn))
+            pending[task] = model
+            if is_hedge:
+                hedged.add(task)
+                model.hedges += 1
+                HEDGED_REQUESTS.inc(model=model.spec.name)
+                logger.info(f"Hedging request to {model.spec.name}")
+            return model
+
+        current = launch()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and queue and len(pending) == 1:
+                    timeout = self._hedge_after(current, kind)
+
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    current = launch(is_hedge=True)
+                    continue
+
+                for task in done:
+                    model = pending.pop(task)
+                    if task.exception() is None:
+                        if task in hedged:
+                            model.hedge_wins += 1
+                            HEDGE_WINS.inc(model=model.spec.name)
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"Model {model.spec.name} failed: {last_error}")
+
+                if not pending and queue:
+                    current = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                results = await asyncio.gather(*pending, return_exceptions=True)
+                for model, result in zip(pending.values(), results):
+                    late = None if isinstance(result, BaseException) else result
+                    if late is not None and discard is not None:
+                        await discard(late)
+                    if abandoned is not None:
+                        abandoned(model.spec, late)
+
+        raise last_error
+
+    def call_sync(self, fn: Callable[[ModelSpec], Any], kind: str = "complete") -> Any:
+        """Blocking variant of call: tries models one after another, without hedging"""
+        last_error: Optional[BaseException] = None
+        for model in self.candidates():
+            started = time.perf_counter()
+            try:
+                result = fn(model.spec)
+            except Exception as e:
+                self._record_failure(model, e)
+                logger.warning(f"Model {model.spec.name} failed: {e}")
+                last_error = e
+                continue
+            self._record_success(model, kind, time.perf_counter() - started)
+            return result
+        raise last_error
+
+    def stats(self) -> List[Dict]:
+        """Per-model statistics for admins"""
+        result = []
+        for model in self.models:
+            self._available(model)
+            latency = {}
+            for kind in sorted(model.latencies):
+                latency[kind] = {
+                    'p50': model.quantile(kind, 0.5),
+                    'p95': model.quantile(kind, 0.95),
+                    'samples': model.samples(kind),
+                }
+            result.append({
+                'model': model.spec.name,
+                'timeout': model.spec.timeout,
+                'state': model.state,
+                'successes': model.successes,
+                'errors': model.errors,
+                'timeouts': model.timeouts,
+                'hedges': model.hedges,
+                'hedge_wins': model.hedge_wins,
+                'latency': latency,
+            })
+        return result
+
+
+def create_model_router(config, default_model: str) -> ModelRouter:
+    """
+    Build a model router from config
+
+    Args:
+        config: RoutingConfig from config.json
+        default_model: Model used when config.models is empty (llm.model)
+
+    Returns:
+        Router for OpenRouterClient
+    """
+    models = [
+        ModelSpec(item["name"], item.get("timeout", config.timeout))
+        for item in config.models
+    ] or [ModelSpec(default_model, config.timeout)]
+    logger.info(f"Model routing: {' -> '.join(spec.name for spec in models)}")
+    return ModelRouter(
+        models,
+        hedge=config.hedge,
+        hedge_delay=config.hedge_delay,
+        hedge_min_delay=config.hedge_min_delay,
+        hedge_min_samples=config.hedge_min_samples,
+        failure_threshold=config.failure_threshold,
+        cooldown_seconds=config.cooldown_seconds,
+    )
@@ -0,0 +1,323 @@
+import asyncio
+import importlib.util
+import logging
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Deque, Optional
+
+import httpx
+
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+HTTP_RETRIES = REGISTRY.counter("llm_http_retries_total", "Retried LLM HTTP requests by reason")
+HTTP_RETRY_DENIED = REGISTRY.counter("llm_http_retry_budget_exhausted_total", "Retries skipped because the retry budget was spent")
+
+RETRY_STATUSES = frozenset({408, 429, 500, 502, 503, 504})
+
+# Errors raised before the request could reach the server; safe to send again.
+# RemoteProtocolError is left out: it also means the server dropped a request it
+# had already accepted (and billed), and a replay would generate it twice
+RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+
+def http2_available() -> bool:
+    """Whether the optional h2 package needed for HTTP/2 is installed"""
+    return importlib.util.find_spec("h2") is not None
+
+
+class RetryBudget:
+    """Limit retries to a share of recent requests
+
+    Within the last `window` seconds at most min_retries + ratio * requests
+    retries are allowed. When the API is down every request fails, so without
+    a budget each of them would be sent 1 + max_retries times; with it the
+    extra load stays around `ratio`.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 3, window: float = 10.0):
+        """
+        Args:
+            ratio: Retries allowed per request sent
+            min_retries: Retries allowed regardless of traffic, so single failures are still retried
+            window: Length of the sliding window in seconds
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.window = window
+        self._requests: Deque[float] = deque()
+        self._retries: Deque[float] = deque()
+        self._lock = threading.Lock()
+
+    def _prune(self, now: float):
+        cutoff = now - self.window
+        for events in (self._requests, self._retries):
+            while events and events[0] < cutoff:
+                events.popleft()
+
+    def record_request(self):
+        """Count a first attempt"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            self._requests.append(now)
+
+    def try_retry(self) -> bool:
+        """Take one retry from the budget, False if it is spent"""
+        now = time.monotonic()
+        with self._lock:
+            self._prune(now)
+            if len(self._retries) >= self.min_retries + self.ratio * len(self._requests):
+                return False
+            self._retries.append(now)
+            return True
+
+
+class RetryPolicy:
+    """When and how long to wait before sending a failed request again"""
+
+    def __init__(
+        self,
+        max_retries: int = 2,
+        backoff: float = 0.5,
+        backoff_max: float = 8.0,
+        budget: Optional[RetryBudget] = None,
+    ):
+        """
+        Args:
+            max_retries: Retries of one request
+            backoff: Base delay; attempt n waits a random time up to backoff * 2**n
+            backoff_max: Upper bound of the delay, also the longest Retry-After honoured
+            budget: Shared limit on retries across all requests
+        """
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.budget = budget or RetryBudget()
+
+    @staticmethod
+    def _retry_after(response: httpx.Response) -> Optional[float]:
+        value = response.headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+    def delay(self, attempt: int, reason: str, response: Optional[httpx.Response] = None) -> Optional[float]:
+        """
+        Decide whether to retry
+
+        Args:
+            attempt: Number of retries already made for this request
+            reason: Status code or error name, for metrics
+            response: Failed response, if there was one
+
+        Returns:
+            Seconds to wait before the retry, None to give up
+        """
+        if attempt >= self.max_retries:
+            return None
+
+        retry_after = self._retry_after(response) if response is not None else None
+        if retry_after is not None and retry_after > self.backoff_max:
+            # The server asks for a longer pause than a waiting user can afford
+            return None
+
+        if not self.budget.try_retry():
+            HTTP_RETRY_DENIED.inc()
+            return None
+
+        HTTP_RETRIES.inc(reason=reason)
+        # Full jitter spreads retries of requests that failed together
+        delay = random.uniform(0, min(self.backoff_max, self.backoff * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+
+class RetryTransport(httpx.BaseTransport):
+    """Blocking transport that retries connection errors and retryable statuses"""
+
+    def __init__(self, transport: httpx.BaseTransport, policy: RetryPolicy):
+        self.transport = transport
+        self.policy = policy
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        self.policy.budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_ERRORS as e:
+                delay = self.policy.delay(attempt, type(e).__name__)
+                if delay is None:
+                    raise
+                logger.warning(f"{request.url.host}: {e!r}, retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self.policy.delay(attempt, str(response.status_code), response)
+                if delay is None:
+                    return response
+                response.close()
+                logger.warning(f"{request.url.host}: HTTP {response.status_code}, retrying in {delay:.2f}s")
+
+            time.sleep(delay)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+class AsyncRetryTransport(httpx.AsyncBaseTransport):
+    """Async transport that retries connection errors and retryable statuses"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, policy: RetryPolicy):
+        self.transport = transport
+        self.policy = policy
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        self.policy.budget.record_request()
+        attempt = 0
+        while True:
+            try:
+                response = await self.transport.handle_async_request(request)
+            except RETRY_ERRORS as e:
+                delay = self.policy.delay(attempt, type(e).__name__)
+                if delay is None:
+                    raise
+                logger.warning(f"{request.url.host}: {e!r}, retrying in {delay:.2f}s")
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    return response
+                delay = self.policy.delay(attempt, str(response.status_code), response)
+                if delay is None:
+                    return response
+                await response.aclose()
+                logger.warning(f"{request.url.host}: HTTP {response.status_code}, retrying in {delay:.2f}s")
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class HTTPTransport:
+    """Connection pools shared by all LLM clients of the process
+
+    One blocking and one async httpx client with sized keep-alive pools,
+    HTTP/2 when the h2 package is installed, separate connect/read/write/pool
+    timeouts and jittered retries limited by a shared retry budget.
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 32,
+        max_keepalive_connections: int = 16,
+        keepalive_expiry: float = 60.0,
+        http2: bool = True,
+        connect_timeout: float = 5.0,
+        read_timeout: float = 60.0,
+        write_timeout: float = 10.0,
+        pool_timeout: float = 10.0,
+        retry: Optional[RetryPolicy] = None,
+    ):
+        """
+        Args:
+            max_connections: Open connections per client
+            max_keepalive_connections: Idle connections kept warm per client
+            keepalive_expiry: Seconds an idle connection is kept
+            http2: Use HTTP/2 if h2 is installed
+            connect_timeout: Seconds to establish a connection, TLS included
+            read_timeout: Seconds to wait for each chunk of the response
+            write_timeout: Seconds to send each chunk of the request
+            pool_timeout: Seconds to wait for a free connection from the pool
+            retry: Retry policy, two retries with a 10% budget by default
+        """
+        self.http2 = http2 and http2_available()
+        if http2 and not self.http2:
+            logger.info("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.connect_timeout = connect_timeout
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout, read=read_timeout, write=write_timeout, pool=pool_timeout
+        )
+        self.retry = retry or RetryPolicy()
+
+        self.client = httpx.Client(
+            transport=RetryTransport(httpx.HTTPTransport(limits=self.limits, http2=self.http2), self.retry),
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+        self.async_client = httpx.AsyncClient(
+            transport=AsyncRetryTransport(httpx.AsyncHTTPTransport(limits=self.limits, http2=self.http2), self.retry),
+            timeout=self.timeout,
+            follow_redirects=True,
+        )
+
+    def timeout_for(self, deadline: Optional[float]) -> httpx.Timeout:
+        """Timeouts of a request that must finish within deadline seconds"""
+        if not deadline:
+            return self.timeout
+        return httpx.Timeout(
+            connect=min(self.connect_timeout, deadline),
+            read=min(self.timeout.read, deadline),
+            write=min(self.timeout.write, deadline),
+            pool=min(self.timeout.pool, deadline),
+        )
+
+    async def aclose(self):
+        """Close both connection pools"""
+        self.client.close()
+        await self.async_client.aclose()
+
+
+def create_http_transport(config) -> HTTPTransport:
+    """
+    Build the shared LLM transport from config
+
+    Args:
+        config: HTTPConfig from config.json
+
+    Returns:
+        Transport for OpenRouterClient
+    """
+    transport = HTTPTransport(
+        max_connections=config.max_connections,
+        max_keepalive_connections=config.max_keepalive_connections,
+        keepalive_expiry=config.keepalive_expiry,
+        http2=config.http2,
+        connect_timeout=config.connect_timeout,
+        read_timeout=config.read_timeout,
+        write_timeout=config.write_timeout,
+        pool_timeout=config.pool_timeout,
+        retry=RetryPolicy(
+            max_retries=config.max_retries,
+            backoff=config.retry_backoff,
+            backoff_max=config.retry_backoff_max,
+            budget=RetryBudget(
+                ratio=config.retry_budget_ratio,
+                min_retries=config.retry_budget_min,
+                window=config.retry_budget_window,
+            ),
+        ),
+    )
+    logger.info(
+        f"LLM transport: {'HTTP/2' if transport.http2 else 'HTTP/1.1'}, "
+        f"{config.max_connections} connections, {config.max_retries} retries"
+    )
+    return transport
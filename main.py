@@ -2,38 +2,101 @@ import asyncio
 import logging
 from aiogram import Bot, Dispatcher
 from aiogram.client.bot import DefaultBotProperties
-from aiogram.fsm.storage.memory import MemoryStorage
 
 from bot.config import BotConfig
-from bot.logger_config import setup_logging
-from bot.handlers import register_handlers, set_dependencies
-from bot.feedback import init_db
-from llm import OpenRouterClient
+from bot.logger_config import setup_logging, stop_logging
+from bot.handlers import close_debounce, register_handlers, set_dependencies
+from bot.feedback import init_db, close_db
+from bot.interactions import init_interaction_log, close_interaction_log
+from bot.usage import init_usage, close_usage, record_usage
+from bot.fsm_storage import create_fsm_storage
+from bot.webhook import WebhookServer
+from llm import (
+    OpenRouterClient, AnswerCache, ConversationMemory, create_http_transport, create_model_router,
+    create_reasoning_classifier
+)
+from metrics import start_metrics_server
 
 logger = logging.getLogger(__name__)
 
 
-async def main():
-    """Main function to run the bot"""
+async def main(config: BotConfig = None, receive_updates=None):
+    """
+    Main function to run the bot
+
+    Args:
+        config: Loaded configuration, read from .env and config.json when None
+        receive_updates: Coroutine function (dp, bot) that feeds updates to the
+            dispatcher instead of polling or webhook; used by supervisor workers
+    """
+    # Load configuration
+    if config is None:
+        config = BotConfig.from_env()
+
     # Setup logging
-    setup_logging(level=logging.INFO)
+    setup_logging(config=config.logging)
     logger.info("Starting ШАД Admission Bot")
 
-    # Initialize feedback database
-    init_db()
-    logger.info("Feedback database initialized")
-
-    # Load configuration
-    config = BotConfig.from_env()
     config.validate()
     logger.info("Configuration loaded and validated")
 
+    # Initialize feedback database
+    await init_db()
+
+    # Initialize interaction log
+    await init_interaction_log(config.interactions)
+
+    # Initialize usage accounting and budgets
+    await init_usage(config.usage)
+
+    # Initialize answer cache
+    answer_cache = None
+    if config.cache.enabled:
+        answer_cache = AnswerCache(
+            max_size=config.cache.max_size,
+            ttl_seconds=config.cache.ttl_seconds,
+            db_path=config.cache.db_path,
+            lemmatize=config.cache.lemmatize
+        )
+        await answer_cache.start()
+
+    # Initialize conversation memory
+    memory = None
+    if config.memory.enabled:
+        memory = ConversationMemory(
+            max_users=config.memory.max_users,
+            ttl_seconds=config.memory.ttl_seconds,
+            token_budget=config.memory.token_budget,
+            summary_tokens=config.memory.summary_tokens,
+            follow_ups_only=config.memory.follow_ups_only
+        )
+
     # Initialize LLM client
     logger.info("Initializing OpenRouter client...")
+    llm_transport = create_http_transport(config.http)
     llm_client = OpenRouterClient(
         api_key=config.openrouter_api_key,
-        data_file=config.data_file
+        model=config.llm.model,
+        data_file=config.data_file,
+        max_concurrency=config.llm.max_concurrency,
+        max_queue_size=config.llm.max_queue_size,
+        context_mode=config.retrieval.mode,
+        top_k=config.retrieval.top_k,
+        context_token_budget=config.retrieval.token_budget,
+        max_section_chars=config.retrieval.max_section_chars,
+        kb_artifact=config.kb_artifact or None,
+        cache=answer_cache,
+        coalesce=config.llm.coalesce,
+        base_url=config.llm.base_url,
+        router=create_model_router(config.routing, config.llm.model),
+        transport=llm_transport,
+        memory=memory,
+        reasoning=create_reasoning_classifier(config.reasoning)
     )
+    if memory is not None and config.memory.summarize:
+        memory.summarizer = llm_client.asummarize_conversation
+    # Summaries are made for a user in the background; their tokens count toward the user's budget
+    llm_client.usage_recorder = record_usage
 
     # Set dependencies for handlers
     set_dependencies(llm_client, config)
@@ -43,17 +106,68 @@ async def main():
         token=config.telegram_token,
         default=DefaultBotProperties(parse_mode="Markdown")
     )
-    storage = MemoryStorage()
+    storage = create_fsm_storage(config.fsm_storage)
     dp = Dispatcher(storage=storage)
 
     # Register handlers
     register_handlers(dp)
 
+    # Reload knowledge base automatically when data file changes
+    watcher = None
+    if config.data_watch_interval > 0:
+        watcher = asyncio.create_task(llm_client.watch_data_file(config.data_watch_interval))
+
+    # Expose metrics for Prometheus
+    metrics_runner = None
+    if config.metrics.enabled:
+        metrics_runner = await start_metrics_server(config.metrics.host, config.metrics.port)
+
+    # Receive updates over webhook or long polling
+    webhook_server = None
+    if config.webhook.enabled:
+        webhook_server = WebhookServer(
+            dp,
+            bot,
+            path=config.webhook.path,
+            secret_token=config.webhook_secret,
+            workers=config.webhook.workers,
+            max_queue_size=config.webhook.max_queue_size
+        )
+
     logger.info("Bot is starting...")
     try:
-        await dp.start_polling(bot)
+        if receive_updates is not None:
+            await receive_updates(dp, bot)
+        elif webhook_server is not None:
+            await webhook_server.start(
+                config.webhook.host,
+                config.webhook.port,
+                config.webhook.url,
+                drop_pending_updates=config.webhook.drop_pending_updates
+            )
+            await asyncio.Event().wait()
+        else:
+            # Polling fails while a webhook from a previous webhook run is still set
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
     finally:
+        if webhook_server is not None:
+            await webhook_server.stop()
+        await close_debounce()
+        if watcher is not None:
+            watcher.cancel()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         await bot.session.close()
+        await storage.close()
+        if memory is not None:
+            await memory.close()
+        await llm_transport.aclose()
+        await close_db()
+        await close_interaction_log()
+        await close_usage()
+        if answer_cache is not None:
+            await answer_cache.close()
         logger.info("Bot stopped")
 
 
@@ -64,3 +178,5 @@ if __name__ == "__main__":
         logger.info("Bot stopped by user")
     except Exception as e:
         logger.error(f"Fatal error: {e}", exc_info=True)
+    finally:
+        stop_logging()
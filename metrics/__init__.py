@@ -0,0 +1,4 @@
+from .registry import REGISTRY, Registry, Counter, Gauge, Histogram
+from .server import start_metrics_server
+
+__all__ = ['REGISTRY', 'Registry', 'Counter', 'Gauge', 'Histogram', 'start_metrics_server']
@@ -0,0 +1,238 @@
+import bisect
+import logging
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Latency buckets in seconds, from fast handlers up to slow reasoning completions
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Sequence[Tuple[str, str]] = ()) -> str:
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self._values.get(_label_key(labels), 0)
+
+    def samples(self) -> Dict[LabelKey, float]:
+        with self._lock:
+            return dict(self._values)
+
+    def merge(self, samples: Dict[LabelKey, float]):
+        """Add samples taken from another registry"""
+        with self._lock:
+            for key, value in samples.items():
+                self._values[key] = self._values.get(key, 0) + value
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}" for key, value in self.samples().items()]
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Distribution of observed values in cumulative buckets"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[LabelKey, Dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+                self._series[key] = series
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def samples(self) -> Dict[LabelKey, Dict]:
+        with self._lock:
+            return {
+                key: {"counts": list(series["counts"]), "sum": series["sum"], "count": series["count"]}
+                for key, series in self._series.items()
+            }
+
+    def merge(self, samples: Dict[LabelKey, Dict]):
+        """Add series taken from another registry with the same buckets"""
+        with self._lock:
+            for key, other in samples.items():
+                series = self._series.setdefault(
+                    key, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+                )
+                series["counts"] = [a + b for a, b in zip(series["counts"], other["counts"])]
+                series["sum"] += other["sum"]
+                series["count"] += other["count"]
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """Estimate quantile by linear interpolation inside the matching bucket"""
+        series = self.samples().get(_label_key(labels))
+        return quantile_from_buckets(self.buckets, series, q) if series else None
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, series in self.samples().items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), series["counts"]):
+                cumulative += count
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(key, [('le', _format_value(bound))])} {cumulative}"
+                )
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+def quantile_from_buckets(buckets: Sequence[float], series: Dict, q: float) -> Optional[float]:
+    """Estimate quantile from per-bucket (non-cumulative) counts"""
+    total = series["count"]
+    if not total:
+        return None
+
+    rank = q * total
+    cumulative = 0
+    lower = 0.0
+    for bound, count in zip(list(buckets) + [math.inf], series["counts"]):
+        if cumulative + count >= rank and count:
+            if bound == math.inf:
+                return lower
+            return lower + (bound - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = bound if bound != math.inf else lower
+    return lower
+
+
+class Registry:
+    """Collection of metrics rendered in Prometheus text format"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = cls(name, documentation, **kwargs)
+                self._metrics[name] = metric
+            elif type(metric) is not cls:
+                raise ValueError(f"Metric {name} already registered as {metric.type_name}")
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._get_or_create(Counter, name, documentation)
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation)
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, buckets=buckets)
+
+    def get(self, name: str):
+        return self._metrics.get(name)
+
+    def register_collector(self, collector: Callable[[], None]):
+        """Register a callback that refreshes gauges right before they are read"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        """Run collectors so gauges reflect current state"""
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Current values of all metrics as plain data, e.g. to send to another process"""
+        self.collect()
+        return {
+            name: {
+                "type": metric.type_name,
+                "documentation": metric.documentation,
+                "buckets": getattr(metric, "buckets", None),
+                "samples": metric.samples(),
+            }
+            for name, metric in list(self._metrics.items())
+        }
+
+    def merge(self, snapshot: Dict[str, Dict]):
+        """Add values from a snapshot: counters, gauges and histograms are summed"""
+        for name, data in snapshot.items():
+            if data["type"] == "histogram":
+                metric = self.histogram(name, data["documentation"], buckets=data["buckets"])
+            elif data["type"] == "gauge":
+                metric = self.gauge(name, data["documentation"])
+            else:
+                metric = self.counter(name, data["documentation"])
+            metric.merge(data["samples"])
+
+    def render(self) -> str:
+        """Render all metrics in Prometheus text exposition format"""
+        self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
@@ -0,0 +1,37 @@
+import logging
+
+from aiohttp import web
+
+from .registry import REGISTRY, Registry
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    registry: Registry = request.app["registry"]
+    return web.Response(text=registry.render(), headers={"Content-Type": CONTENT_TYPE})
+
+
+async def start_metrics_server(host: str = "127.0.0.1", port: int = 9100, registry: Registry = REGISTRY) -> web.AppRunner:
+    """
+    Serve metrics in Prometheus text format on http://host:port/metrics
+
+    Args:
+        host: Interface to bind, keep it local unless a scraper needs remote access
+        port: TCP port
+        registry: Metrics registry to expose
+
+    Returns:
+        Runner; call its cleanup() on shutdown
+    """
+    app = web.Application()
+    app["registry"] = registry
+    app.router.add_get("/metrics", _handle_metrics)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics endpoint listening on http://{host}:{port}/metrics")
+    return runner
@@ -0,0 +1,3 @@
+from .writer import PRAGMAS, BackgroundWriter, connect
+
+__all__ = ['PRAGMAS', 'BackgroundWriter', 'connect']
@@ -0,0 +1,114 @@
+import asyncio
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Durable enough for logs and counters, and writers don't block readers
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+)
+
+
+def connect(path: str, pragmas=PRAGMAS, **kwargs) -> sqlite3.Connection:
+    """Open a SQLite connection usable from the writer thread and apply pragmas"""
+    conn = sqlite3.connect(path, check_same_thread=False, **kwargs)
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+class BackgroundWriter:
+    """A dedicated thread for storage I/O and a task flushing buffered writes
+
+    Owners buffer writes in memory and pass their flush coroutine; it runs
+    every flush_interval seconds, or sooner after wake(). All storage calls go
+    through run(), so the event loop never waits on disk and one connection is
+    only ever used by one thread.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush: Callable[[], Awaitable[None]],
+        flush_interval: float = 1.0,
+        open: Optional[Callable[[], None]] = None,
+        close: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            name: Thread name prefix and name used in logs
+            flush: Owner coroutine writing buffered data, called from the background task
+            flush_interval: Seconds between flushes
+            open: Opens storage on the writer thread
+            close: Closes storage on the writer thread
+        """
+        self.name = name
+        self.flush_interval = flush_interval
+        self._flush = flush
+        self._open = open
+        self._close = close
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        # Owners hold it while flushing, so batches are written in order
+        self.lock: Optional[asyncio.Lock] = None
+
+    @property
+    def started(self) -> bool:
+        return self._executor is not None
+
+    async def run(self, fn, *args):
+        """Run fn on the writer thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def start(self):
+        """Start the thread, open storage and start periodic flushes"""
+        if self._executor is not None:
+            return
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=self.name)
+        self.lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        if self._open is not None:
+            await self.run(self._open)
+        self._task = asyncio.create_task(self._loop())
+
+    def wake(self):
+        """Flush without waiting for the rest of the interval"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._flush()
+            except Exception as e:
+                logger.error(f"Failed to flush {self.name}: {e}", exc_info=True)
+
+    async def stop(self):
+        """Flush what is buffered, close storage and stop the thread"""
+        if self._executor is None:
+            return
+
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self._flush()
+        except Exception as e:
+            logger.error(f"Failed to flush {self.name} on shutdown: {e}")
+        if self._close is not None:
+            await self.run(self._close)
+        self._executor.shutdown(wait=True)
+        self._executor = None
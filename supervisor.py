@@ -0,0 +1,68 @@
+import asyncio
+import logging
+import os
+import signal
+
+from bot.config import BotConfig
+from bot.logger_config import setup_logging, stop_logging
+from bot.workers import Supervisor, consume_updates
+from llm.kb_artifact import ensure_compiled
+import main as bot_main
+
+logger = logging.getLogger(__name__)
+
+
+def worker_main(worker_id, updates, status, heartbeat_interval):
+    """Entry point of a worker process: the regular bot fed by the supervisor"""
+    # Ctrl+C reaches the whole process group; shutdown is driven by the supervisor
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    config = BotConfig.from_env()
+    # Telegram traffic and the metrics endpoint belong to the supervisor
+    config.webhook.enabled = False
+    config.metrics.enabled = False
+    # Separate log files, so workers never rotate the same file
+    root, ext = os.path.splitext(config.logging.file)
+    config.logging.file = f"{root}-{worker_id}{ext}"
+    if config.interactions.backend == "jsonl":
+        root, ext = os.path.splitext(config.interactions.path)
+        config.interactions.path = f"{root}-{worker_id}{ext}"
+
+    async def receive_updates(dp, bot):
+        await consume_updates(dp, bot, worker_id, updates, status, heartbeat_interval)
+
+    try:
+        asyncio.run(bot_main.main(config, receive_updates))
+    except Exception as e:
+        logger.error(f"Worker {worker_id} failed: {e}", exc_info=True)
+        raise
+    finally:
+        stop_logging()
+
+
+async def main():
+    """Run the bot in several worker processes"""
+    config = BotConfig.from_env()
+    setup_logging(config=config.logging)
+    config.validate()
+
+    if config.retrieval.mode == "retrieval" and config.kb_artifact:
+        try:
+            ensure_compiled(config.data_file, config.kb_artifact, config.retrieval.max_section_chars)
+        except OSError as e:
+            logger.warning(f"Could not compile knowledge base, workers will index it themselves: {e}")
+
+    supervisor = Supervisor(config, worker_main)
+    logger.info(f"Starting supervisor with {len(supervisor.workers)} workers")
+    await supervisor.run()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        logger.info("Supervisor stopped by user")
+    except Exception as e:
+        logger.error(f"Fatal error: {e}", exc_info=True)
+    finally:
+        stop_logging()
@@ -0,0 +1,27 @@
+import pytest
+
+from bench.stub_server import StubLLMServer
+from llm import OpenRouterClient
+from llm.reasoning import MODE_NEVER, ReasoningClassifier
+
+
+@pytest.fixture
+def stub_client(tmp_path):
+    """Async factory (stub, **client options) -> (client, runner) talking to the stub over HTTP"""
+
+    async def start(stub: StubLLMServer, **options):
+        runner = await stub.start(port=0)
+        port = runner.addresses[0][1]
+        data_file = tmp_path / "data.txt"
+        data_file.write_text("ШАД принимает по итогам экзамена.", encoding="utf-8")
+        options.setdefault("reasoning", ReasoningClassifier(mode=MODE_NEVER))
+        client = OpenRouterClient(
+            api_key="test",
+            model="stub",
+            data_file=str(data_file),
+            base_url=f"http://127.0.0.1:{port}/v1",
+            **options,
+        )
+        return client, runner
+
+    return start
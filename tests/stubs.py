@@ -0,0 +1,14 @@
+from bench.stub_server import LatencyModel, StubLLMServer
+
+WORDS = ["Поступить", "можно", "через", "экзамен"]
+
+
+class FixedStub(StubLLMServer):
+    """Stub that answers at once, always with WORDS"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("latency", LatencyModel(distribution="fixed", mean=0, token_interval=0.01))
+        super().__init__(**kwargs)
+
+    def _words(self):
+        return list(WORDS)
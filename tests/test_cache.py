@@ -0,0 +1,73 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from llm import cache as cache_module
+from llm.cache import AnswerCache
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    return clock
+
+
+def test_answer_expires_after_ttl(clock):
+    cache = AnswerCache(ttl_seconds=60, db_path=None)
+    cache.set("Как поступить в ШАД?", "v1", "Сдать экзамен")
+
+    clock.now += 59
+    assert cache.get("как поступить в шад", "v1") == "Сдать экзамен"
+
+    clock.now += 2
+    assert cache.get("Как поступить в ШАД?", "v1") is None
+    assert cache.stats()["size"] == 0
+
+
+def test_answer_belongs_to_knowledge_base_version(clock):
+    cache = AnswerCache(db_path=None)
+    cache.set("вопрос", "v1", "ответ")
+    assert cache.get("вопрос", "v2") is None
+
+
+def test_expired_answers_are_not_loaded_from_disk(clock, tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = AnswerCache(ttl_seconds=60, db_path=path)
+    cache.set("старый", "v1", "ответ 1")
+    clock.now += 30
+    cache.set("новый", "v1", "ответ 2")
+    asyncio.run(cache.close())
+
+    clock.now += 45
+    reopened = AnswerCache(ttl_seconds=60, db_path=path)
+    assert reopened.get("старый", "v1") is None
+    assert reopened.get("новый", "v1") == "ответ 2"
+    asyncio.run(reopened.close())
+
+    rows = sqlite3.connect(path).execute("SELECT answer FROM answer_cache").fetchall()
+    assert rows == [("ответ 2",)]
+
+
+def test_expired_answer_is_deleted_by_the_writer(clock, tmp_path):
+    path = str(tmp_path / "cache.db")
+
+    async def scenario():
+        cache = AnswerCache(ttl_seconds=60, db_path=path, flush_interval=60)
+        cache.set("вопрос", "v1", "ответ")
+        await cache.start()
+        clock.now += 61
+        assert cache.get("вопрос", "v1") is None
+        await cache.close()
+
+    asyncio.run(scenario())
+    assert sqlite3.connect(path).execute("SELECT count(*) FROM answer_cache").fetchone() == (0,)
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from llm.coalescing import CallAborted, SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flight = SingleFlight()
+        calls = 0
+        release = asyncio.Event()
+
+        async def fetch():
+            nonlocal calls
+            calls += 1
+            await release.wait()
+            return "answer"
+
+        tasks = [asyncio.create_task(flight.do("q", fetch)) for _ in range(3)]
+        await asyncio.sleep(0)
+        release.set()
+        return calls, await asyncio.gather(*tasks), flight.stats()
+
+    calls, results, stats = asyncio.run(scenario())
+    assert calls == 1
+    assert results == ["answer"] * 3
+    assert stats == {"in_flight": 0, "upstream_calls": 1, "coalesced": 2}
+
+
+def test_leader_error_reaches_waiters():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            raise ValueError("upstream failed")
+
+        leader = asyncio.create_task(flight.do("q", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("q", fetch))
+        await asyncio.sleep(0)
+        release.set()
+        return await asyncio.gather(leader, waiter, return_exceptions=True), flight.in_flight("q")
+
+    (leader_error, waiter_error), in_flight = asyncio.run(scenario())
+    assert isinstance(leader_error, ValueError)
+    assert waiter_error is leader_error
+    assert in_flight is None
+
+
+def test_cancelled_leader_aborts_waiters_and_frees_the_key():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def hang():
+            await asyncio.Event().wait()
+
+        async def fetch():
+            return "fresh"
+
+        leader = asyncio.create_task(flight.do("q", hang))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("q", hang))
+        await asyncio.sleep(0)
+        leader.cancel()
+        results = await asyncio.gather(leader, waiter, return_exceptions=True)
+        return results, await flight.do("q", fetch)
+
+    (leader_result, waiter_result), retry = asyncio.run(scenario())
+    assert isinstance(leader_result, asyncio.CancelledError)
+    assert isinstance(waiter_result, CallAborted)
+    assert retry == "fresh"
+
+
+def test_cancelled_waiter_does_not_cancel_leader():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def fetch():
+            await release.wait()
+            return "answer"
+
+        leader = asyncio.create_task(flight.do("q", fetch))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(flight.do("q", fetch))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        release.set()
+        return await leader
+
+    assert asyncio.run(scenario()) == "answer"
+
+
+def test_finish_with_abort_lets_waiters_retry():
+    async def scenario():
+        flight = SingleFlight()
+        future = flight.begin("q")
+        waiter = asyncio.create_task(flight.join(future))
+        await asyncio.sleep(0)
+        flight.finish("q", future, error=CallAborted())
+        with pytest.raises(CallAborted):
+            await waiter
+        return flight.in_flight("q")
+
+    assert asyncio.run(scenario()) is None
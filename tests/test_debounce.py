@@ -0,0 +1,124 @@
+import asyncio
+import types
+from datetime import datetime
+
+from aiogram.types import Chat, Message, User
+
+from bot.middlewares import DebounceMiddleware
+
+DATA = {"handler": types.SimpleNamespace(flags={"debounce": True})}
+
+
+def message(text: str, user_id: int = 1, message_id: int = 1) -> Message:
+    return Message(
+        message_id=message_id,
+        date=datetime.now(),
+        chat=Chat(id=user_id, type="private"),
+        from_user=User(id=user_id, is_bot=False, first_name="Тест"),
+        text=text,
+    )
+
+
+class Recorder:
+    """Handler that records the questions it got and how many of them finished"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.started = []
+        self.finished = []
+
+    async def __call__(self, event: Message, data: dict):
+        self.started.append(event.text)
+        await asyncio.sleep(self.delay)
+        self.finished.append(event.text)
+
+
+def test_burst_is_answered_once_with_all_texts():
+    async def scenario():
+        debounce = DebounceMiddleware(window=0.05, max_wait=1.0)
+        handler = Recorder()
+        for i, text in enumerate(["Как поступить", "в ШАД", "из другого города?"]):
+            assert await debounce(handler, message(text, message_id=i), DATA) is None
+            await asyncio.sleep(0.01)
+        assert handler.started == []
+        await debounce.wait(1)
+        return handler.finished
+
+    assert asyncio.run(scenario()) == ["Как поступить\nв ШАД\nиз другого города?"]
+
+
+def test_users_are_debounced_separately():
+    async def scenario():
+        debounce = DebounceMiddleware(window=0.05, max_wait=1.0)
+        handler = Recorder()
+        await debounce(handler, message("первый", user_id=1), DATA)
+        await debounce(handler, message("второй", user_id=2), DATA)
+        await debounce.wait(1)
+        await debounce.wait(2)
+        return sorted(handler.finished)
+
+    assert asyncio.run(scenario()) == ["второй", "первый"]
+
+
+def test_new_fragment_cancels_the_answer_in_progress():
+    async def scenario():
+        debounce = DebounceMiddleware(window=0.02, max_wait=1.0)
+        handler = Recorder(delay=0.2)
+        await debounce(handler, message("Сколько стоит"), DATA)
+        await asyncio.sleep(0.05)
+        assert handler.started == ["Сколько стоит"]
+        await debounce(handler, message("обучение?", message_id=2), DATA)
+        await debounce.wait(1)
+        return handler.started, handler.finished
+
+    started, finished = asyncio.run(scenario())
+    assert started == ["Сколько стоит", "Сколько стоит\nобучение?"]
+    assert finished == ["Сколько стоит\nобучение?"]
+
+
+def test_max_wait_caps_the_delay():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        debounce = DebounceMiddleware(window=0.1, max_wait=0.25)
+        handler = Recorder()
+        started = loop.time()
+        answered_at = None
+        # A fragment every 0.05 s would push a plain window back forever
+        for i in range(12):
+            await debounce(handler, message(f"часть {i}", message_id=i), DATA)
+            await asyncio.sleep(0.05)
+            if handler.finished and answered_at is None:
+                answered_at = loop.time() - started
+        await debounce.wait(1)
+        return answered_at, handler.finished
+
+    answered_at, finished = asyncio.run(scenario())
+    assert answered_at is not None and answered_at < 0.45
+    assert len(finished) >= 2
+    assert "\n".join(finished).split("\n") == [f"часть {i}" for i in range(12)]
+
+
+def test_close_answers_pending_messages_right_away():
+    async def scenario():
+        loop = asyncio.get_running_loop()
+        debounce = DebounceMiddleware(window=10.0, max_wait=30.0)
+        handler = Recorder()
+        await debounce(handler, message("первый", user_id=1), DATA)
+        await debounce(handler, message("второй", user_id=2), DATA)
+        started = loop.time()
+        await debounce.close()
+        return loop.time() - started, sorted(handler.finished)
+
+    elapsed, finished = asyncio.run(scenario())
+    assert elapsed < 1.0
+    assert finished == ["второй", "первый"]
+
+
+def test_unflagged_handlers_run_directly():
+    async def scenario():
+        debounce = DebounceMiddleware(window=10.0)
+        handler = Recorder()
+        await debounce(handler, message("/start"), {"handler": types.SimpleNamespace(flags={})})
+        return handler.finished
+
+    assert asyncio.run(scenario()) == ["/start"]
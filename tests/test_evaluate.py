@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import json
+import socket
+
+import pytest
+
+from bench.evaluate import diff, load_questions, load_run, run
+
+
+def write_jsonl(path, rows):
+    path.write_text("".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows), encoding="utf-8")
+    return str(path)
+
+
+def result(question_id: str, latency_ms: float = 100.0, answer: str = "Сдать экзамен в мае", **fields) -> dict:
+    row = {
+        "id": question_id,
+        "question": f"вопрос {question_id}",
+        "answer": answer,
+        "error": False,
+        "cached": False,
+        "latency_ms": latency_ms,
+        "prompt_tokens": 1000,
+        "completion_tokens": 100,
+        "expected_total": 1,
+        "expected_hits": 1,
+    }
+    row.update(fields)
+    return row
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_load_questions_detects_field_and_ids(tmp_path):
+    path = write_jsonl(tmp_path / "questions.jsonl", [
+        {"id": "deadline", "question": "Когда дедлайн?", "expected": "май"},
+        {"title": "Сколько длится обучение?"},
+        {"id": "deadline", "question": "Повтор"},
+    ])
+
+    questions = load_questions(path)
+
+    assert [item["question"] for item in questions] == ["Когда дедлайн?", "Сколько длится обучение?"]
+    assert questions[0] == {"id": "deadline", "question": "Когда дедлайн?", "expected": ["май"]}
+    assert len(questions[1]["id"]) == 12
+    assert load_questions(path)[1]["id"] == questions[1]["id"]
+
+
+def test_load_questions_requires_a_question_field(tmp_path):
+    path = write_jsonl(tmp_path / "questions.jsonl", [{"id": "x", "body": "Где учиться?"}])
+
+    with pytest.raises(ValueError, match="questions.jsonl:1"):
+        load_questions(path)
+    assert load_questions(path, field="body")[0]["question"] == "Где учиться?"
+
+
+def test_identical_runs_have_no_regressions(tmp_path):
+    rows = [result(str(i), latency_ms=100 + i) for i in range(10)]
+    base = write_jsonl(tmp_path / "base.jsonl", rows)
+    new = write_jsonl(tmp_path / "new.jsonl", rows)
+
+    assert diff(base, new, threshold=0.1, max_recall_drop=0.05, show=0) == []
+
+
+def test_slower_run_with_more_errors_and_lost_keywords_regresses(tmp_path):
+    base = write_jsonl(tmp_path / "base.jsonl", [result(str(i)) for i in range(10)])
+    new_rows = [result(str(i), latency_ms=200.0) for i in range(8)]
+    new_rows.append(result("8", answer="Не знаю", expected_hits=0))
+    new_rows.append(result("9", error=True))
+    new = write_jsonl(tmp_path / "new.jsonl", new_rows)
+
+    regressions = diff(base, new, threshold=0.1, max_recall_drop=0.05, show=2)
+
+    assert any(item.startswith("p50 latency") for item in regressions)
+    assert "errors 0 -> 1" in regressions
+    assert any(item.startswith("expected keywords") for item in regressions)
+
+
+def test_only_shared_questions_are_compared(tmp_path):
+    base = write_jsonl(tmp_path / "base.jsonl", [result("a"), result("slow", latency_ms=10_000)])
+    new = write_jsonl(tmp_path / "new.jsonl", [result("a"), result("b")])
+
+    assert diff(base, new, threshold=0.1, max_recall_drop=0.05, show=0) == []
+
+
+def test_run_against_stub_resumes_where_it_stopped(tmp_path, monkeypatch):
+    # Default settings instead of the repository's config.json
+    monkeypatch.chdir(tmp_path)
+    data_file = tmp_path / "data.txt"
+    data_file.write_text("Экзамен в ШАД проходит в мае.", encoding="utf-8")
+    questions = write_jsonl(tmp_path / "questions.jsonl", [
+        {"id": "exam", "question": "Когда экзамен?"},
+        {"id": "site", "question": "Какой сайт у ШАД?"},
+    ])
+    output = tmp_path / "runs" / "stub.jsonl"
+    args = argparse.Namespace(
+        questions=questions, output=str(output), field=None, id_field="id", limit=1, concurrency=2,
+        streaming=True, retry_errors=False, cache=None, data_file=str(data_file), model=None,
+        context_mode=None, reasoning="never", stub=True, stub_port=free_port(),
+        latency="fixed", mean=0.0, spread=0.0, token_interval=0.0, answer_tokens=5, error_rate=0.0,
+    )
+
+    assert asyncio.run(run(args)) == 0
+    assert list(load_run(str(output))) == ["exam"]
+
+    args.limit = 0
+    args.stub_port = free_port()
+    assert asyncio.run(run(args)) == 0
+
+    rows = load_run(str(output))
+    assert sorted(rows) == ["exam", "site"]
+    assert all(not row["error"] and row["answer"] and row["ttft_ms"] is not None for row in rows.values())
+    assert json.loads((tmp_path / "runs" / "stub.jsonl.meta.json").read_text(encoding="utf-8"))["resumed"]
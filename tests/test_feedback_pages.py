@@ -0,0 +1,109 @@
+import asyncio
+import sqlite3
+
+from bot.feedback import FeedbackStorage, format_feedback_page
+
+RATINGS = ["positive", "negative", "positive", "positive", "negative", "positive", "negative"]
+
+
+def with_storage(db_path, scenario):
+    """Run scenario(storage) against a storage filled with RATINGS, ids 1..7"""
+
+    async def run():
+        storage = FeedbackStorage(str(db_path))
+        await storage.start()
+        try:
+            for user_id, rating in enumerate(RATINGS, start=1):
+                await storage.save_feedback(user_id, None, None, None, rating)
+            return await scenario(storage)
+        finally:
+            await storage.close()
+
+    return asyncio.run(run())
+
+
+def ids(page) -> list:
+    return [item["id"] for item in page["items"]]
+
+
+def test_pages_walk_older_and_back_newer(tmp_path):
+    async def scenario(storage):
+        first = await storage.get_feedback_page(limit=3)
+        second = await storage.get_feedback_page(cursor=first["items"][-1]["id"], direction="older", limit=3)
+        last = await storage.get_feedback_page(cursor=second["items"][-1]["id"], direction="older", limit=3)
+        back = await storage.get_feedback_page(cursor=second["items"][0]["id"], direction="newer", limit=3)
+        return first, second, last, back
+
+    first, second, last, back = with_storage(tmp_path / "feedback.db", scenario)
+
+    assert ids(first) == [7, 6, 5]
+    assert (first["has_newer"], first["has_older"]) == (False, True)
+    assert ids(second) == [4, 3, 2]
+    assert (second["has_newer"], second["has_older"]) == (True, True)
+    assert ids(last) == [1]
+    assert (last["has_newer"], last["has_older"]) == (True, False)
+    assert ids(back) == [7, 6, 5]
+    assert back["has_newer"] is False
+
+
+def test_rating_filter(tmp_path):
+    async def scenario(storage):
+        first = await storage.get_feedback_page(rating="negative", limit=2)
+        rest = await storage.get_feedback_page(
+            cursor=first["items"][-1]["id"], direction="older", rating="negative", limit=2
+        )
+        return first, rest
+
+    first, rest = with_storage(tmp_path / "feedback.db", scenario)
+
+    assert ids(first) == [7, 5]
+    assert first["has_older"] is True
+    assert ids(rest) == [2]
+    assert rest["has_older"] is False
+
+
+def test_stats_follow_inserts_and_deletes(tmp_path):
+    db_path = tmp_path / "feedback.db"
+
+    async def scenario(storage):
+        def delete_first():
+            with storage._conn:
+                storage._conn.execute("DELETE FROM feedback WHERE id = 1")
+
+        stats = await storage.get_feedback_stats()
+        await storage._writer.run(delete_first)
+        return stats, await storage.get_feedback_stats()
+
+    stats, after_delete = with_storage(db_path, scenario)
+
+    assert stats == {"total": 7, "positive": 4, "negative": 3}
+    assert after_delete == {"total": 6, "positive": 3, "negative": 3}
+
+
+def test_stats_are_backfilled_for_existing_rows(tmp_path):
+    db_path = tmp_path / "feedback.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE feedback (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+            "username TEXT, first_name TEXT, last_name TEXT, rating TEXT NOT NULL, comment TEXT, "
+            "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP, interaction_id TEXT)"
+        )
+        conn.executemany("INSERT INTO feedback (user_id, rating) VALUES (?, ?)", [(1, "positive"), (2, "negative")])
+
+    async def scenario(storage):
+        return await storage.get_feedback_stats()
+
+    assert with_storage(db_path, scenario) == {"total": 9, "positive": 5, "negative": 4}
+
+
+def test_format_page_shows_stats_and_entries():
+    items = [{
+        "id": 3, "user_id": 42, "username": "student", "first_name": None, "last_name": None,
+        "rating": "negative", "comment": "а" * 120, "created_at": "2024-05-01 12:30:45", "interaction_id": "abc",
+    }]
+    text = format_feedback_page(items, {"total": 1, "positive": 0, "negative": 1}, rating="negative")
+
+    assert "📝 Отрицательные отзывы:" in text
+    assert "#3 | 👎 | student | 2024-05-01 12:30" in text
+    assert "↪ ответ abc" in text
+    assert "💬 " + "а" * 100 + "..." in text
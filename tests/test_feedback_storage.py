@@ -0,0 +1,124 @@
+import asyncio
+import sqlite3
+
+from bot.feedback import FeedbackStorage
+
+
+def save(storage: FeedbackStorage, user_id: int, rating: str = "positive", comment: str = None):
+    return storage.save_feedback(user_id, f"user{user_id}", "Имя", None, rating, comment)
+
+
+def count_rows(db_path) -> int:
+    with sqlite3.connect(db_path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM feedback").fetchone()[0]
+
+
+def test_database_runs_in_wal_mode(tmp_path):
+    db_path = tmp_path / "feedback.db"
+
+    async def scenario():
+        storage = FeedbackStorage(str(db_path))
+        await storage.start()
+        mode = await storage._writer.run(lambda: storage._conn.execute("PRAGMA journal_mode").fetchone()[0])
+        await storage.close()
+        return mode
+
+    assert asyncio.run(scenario()) == "wal"
+
+
+def test_inserts_are_buffered_until_flush(tmp_path):
+    db_path = tmp_path / "feedback.db"
+
+    async def scenario():
+        storage = FeedbackStorage(str(db_path), flush_interval=60, batch_size=100)
+        await storage.start()
+        await save(storage, 1)
+        await save(storage, 2)
+        before = count_rows(db_path)
+        await storage.flush()
+        after = count_rows(db_path)
+        await storage.close()
+        return before, after
+
+    assert asyncio.run(scenario()) == (0, 2)
+
+
+def test_full_batch_is_written_at_once(tmp_path):
+    db_path = tmp_path / "feedback.db"
+
+    async def scenario():
+        storage = FeedbackStorage(str(db_path), flush_interval=60, batch_size=3)
+        await storage.start()
+        for user_id in range(3):
+            await save(storage, user_id)
+        written = count_rows(db_path)
+        await storage.close()
+        return written
+
+    assert asyncio.run(scenario()) == 3
+
+
+def test_close_writes_pending_feedback(tmp_path):
+    db_path = tmp_path / "feedback.db"
+
+    async def scenario():
+        storage = FeedbackStorage(str(db_path), flush_interval=60)
+        await storage.start()
+        await save(storage, 1, "negative", "Не помогло")
+        await storage.close()
+
+    asyncio.run(scenario())
+
+    with sqlite3.connect(db_path) as conn:
+        assert conn.execute("SELECT user_id, rating, comment FROM feedback").fetchall() == [(1, "negative", "Не помогло")]
+
+
+def test_failed_flush_keeps_rows_for_the_next_attempt(tmp_path, monkeypatch):
+    db_path = tmp_path / "feedback.db"
+
+    async def scenario():
+        storage = FeedbackStorage(str(db_path), flush_interval=60)
+        await storage.start()
+        await save(storage, 1)
+
+        insert_batch = storage._insert_batch
+
+        def failing_insert_batch(rows):
+            raise sqlite3.OperationalError("database is locked")
+
+        monkeypatch.setattr(storage, "_insert_batch", failing_insert_batch)
+        try:
+            await storage.flush()
+        except sqlite3.OperationalError:
+            pass
+        pending = len(storage._pending)
+
+        monkeypatch.setattr(storage, "_insert_batch", insert_batch)
+        await storage.close()
+        return pending
+
+    assert asyncio.run(scenario()) == 1
+    assert count_rows(db_path) == 1
+
+
+def test_old_database_gets_interaction_column(tmp_path):
+    db_path = tmp_path / "feedback.db"
+    with sqlite3.connect(db_path) as conn:
+        conn.execute(
+            "CREATE TABLE feedback (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER NOT NULL, "
+            "username TEXT, first_name TEXT, last_name TEXT, rating TEXT NOT NULL, comment TEXT, "
+            "created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)"
+        )
+        conn.execute("INSERT INTO feedback (user_id, rating) VALUES (1, 'positive')")
+
+    async def scenario():
+        storage = FeedbackStorage(str(db_path))
+        await storage.start()
+        await storage.save_feedback(2, None, None, None, "negative", interaction_id="abc123")
+        page = await storage.get_feedback_page()
+        await storage.close()
+        return page
+
+    page = asyncio.run(scenario())
+
+    assert [(item["user_id"], item["interaction_id"]) for item in page["items"]] == [(2, "abc123"), (1, None)]
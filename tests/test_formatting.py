@@ -0,0 +1,55 @@
+from bot.formatting import format_answer, parse_markdown, preview, render_plain, split_tokens
+
+
+def utf16_len(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def test_short_answer_is_one_message():
+    messages = split_tokens(parse_markdown("Привет, **мир**!"), limit=100)
+    assert len(messages) == 1
+    assert render_plain(messages[0]) == "Привет, мир!"
+
+
+def test_limit_counts_utf16_units():
+    # Each emoji is one character but two UTF-16 code units
+    text = "😀" * 30
+    messages = split_tokens(parse_markdown(text), limit=20)
+    parts = [render_plain(message) for message in messages]
+    assert "".join(parts) == text
+    assert all(utf16_len(part) <= 20 for part in parts)
+    assert [len(part) for part in parts] == [10, 10, 10]
+
+
+def test_cuts_at_word_boundaries():
+    text = " ".join(["слово"] * 50)
+    parts = [render_plain(message) for message in split_tokens(parse_markdown(text), limit=64)]
+    assert all(utf16_len(part) <= 64 for part in parts)
+    assert all(part.split() == ["слово"] * len(part.split()) for part in parts)
+    assert sum(len(part.split()) for part in parts) == 50
+
+
+def test_formatting_is_reopened_in_the_next_message():
+    text = " ".join(["жирный текст"] * 20)
+    messages = split_tokens(parse_markdown(f"**{text}**"), limit=50)
+    assert len(messages) > 1
+    for message in messages:
+        assert message[0][:2] == ("open", "b")
+        assert message[-1] == ("close", "b")
+
+
+def test_every_part_fits_after_rendering():
+    text = "Заголовок\n\n" + "Абзац с эмодзи 🎓 и ссылкой. " * 400
+    for html_text, plain_text in format_answer(text):
+        assert utf16_len(plain_text) <= 4096
+
+
+def test_blank_answer_has_no_parts():
+    assert format_answer("  \n\t") == []
+
+
+def test_preview_fits_in_utf16_units():
+    text = "🎓" * 10
+    short = preview(text, limit=9)
+    assert utf16_len(short) <= 9
+    assert short.endswith("…")
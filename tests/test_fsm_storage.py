@@ -0,0 +1,182 @@
+import asyncio
+import sqlite3
+import types
+
+import pytest
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from bot import fsm_storage
+from bot.fsm_storage import RespStorage, SQLiteStorage, create_fsm_storage
+from bot.handlers import FeedbackStates
+
+KEY = StorageKey(bot_id=1, chat_id=10, user_id=10)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self) -> float:
+        return self.now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+async def _round_trip(storage) -> tuple:
+    """Walk the feedback flow through FSMContext and return what was read back"""
+    context = FSMContext(storage=storage, key=KEY)
+    await context.set_state(FeedbackStates.waiting_for_comment)
+    await context.update_data(rating="positive", comment="Спасибо")
+    state, data = await context.get_state(), await context.get_data()
+    await context.clear()
+    return state, data, await context.get_state(), await context.get_data()
+
+
+def test_sqlite_round_trip(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "fsm.db"), cache_ttl=0)
+
+    async def scenario():
+        try:
+            return await _round_trip(storage)
+        finally:
+            await storage.close()
+
+    state, data, cleared_state, cleared_data = asyncio.run(scenario())
+    assert state == FeedbackStates.waiting_for_comment.state
+    assert data == {"rating": "positive", "comment": "Спасибо"}
+    assert cleared_state is None
+    assert cleared_data == {}
+
+
+def test_sqlite_uses_shared_connection_settings(tmp_path):
+    path = str(tmp_path / "fsm.db")
+    storage = SQLiteStorage(path)
+
+    async def scenario():
+        await storage.set_state(KEY, "state")
+        await storage.close()
+
+    asyncio.run(scenario())
+    assert sqlite3.connect(path).execute("PRAGMA journal_mode").fetchone() == ("wal",)
+
+
+def test_sqlite_state_is_shared_between_processes(tmp_path):
+    path = str(tmp_path / "fsm.db")
+
+    async def scenario():
+        first, second = SQLiteStorage(path, cache_ttl=0), SQLiteStorage(path, cache_ttl=0)
+        try:
+            await first.set_state(KEY, "waiting")
+            return await second.get_state(KEY)
+        finally:
+            await first.close()
+            await second.close()
+
+    assert asyncio.run(scenario()) == "waiting"
+
+
+def test_sqlite_state_expires(tmp_path, monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fsm_storage, "time", clock)
+    storage = SQLiteStorage(str(tmp_path / "fsm.db"), ttl_seconds=60, cache_ttl=0)
+
+    async def scenario():
+        try:
+            await storage.set_state(KEY, "waiting")
+            clock.now += 59
+            alive = await storage.get_state(KEY)
+            clock.now += 2
+            return alive, await storage.get_state(KEY)
+        finally:
+            await storage.close()
+
+    assert asyncio.run(scenario()) == ("waiting", None)
+
+
+class FakeRedis:
+    """In-memory server speaking just enough RESP2 for RespStorage"""
+
+    def __init__(self):
+        self.values = {}
+        self.commands = []
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            header = await reader.readline()
+            if not header:
+                break
+            args = []
+            for _ in range(int(header[1:])):
+                length = int((await reader.readline())[1:])
+                args.append((await reader.readexactly(length + 2))[:-2].decode("utf-8"))
+            self.commands.append(args)
+            writer.write(self.reply(args))
+            await writer.drain()
+        writer.close()
+
+    def reply(self, args) -> bytes:
+        command = args[0].upper()
+        if command == "GET":
+            value = self.values.get(args[1])
+            if value is None:
+                return b"$-1\r\n"
+            data = value.encode("utf-8")
+            return f"${len(data)}\r\n".encode() + data + b"\r\n"
+        if command == "SET":
+            self.values[args[1]] = args[2]
+            return b"+OK\r\n"
+        if command == "DEL":
+            return f":{int(self.values.pop(args[1], None) is not None)}\r\n".encode()
+        if command in ("SELECT", "AUTH"):
+            return b"+OK\r\n"
+        return b"-ERR unknown command\r\n"
+
+
+def test_redis_round_trip():
+    redis = FakeRedis()
+
+    async def scenario():
+        server = await asyncio.start_server(redis.handle, "127.0.0.1", 0)
+        port = server.sockets[0].getsockname()[1]
+        storage = RespStorage(f"redis://:secret@127.0.0.1:{port}/2", ttl_seconds=60, cache_ttl=0)
+        try:
+            return await _round_trip(storage)
+        finally:
+            await storage.close()
+            server.close()
+            await server.wait_closed()
+
+    state, data, cleared_state, cleared_data = asyncio.run(scenario())
+    assert state == FeedbackStates.waiting_for_comment.state
+    assert data == {"rating": "positive", "comment": "Спасибо"}
+    assert (cleared_state, cleared_data) == (None, {})
+    assert redis.commands[:2] == [["AUTH", "secret"], ["SELECT", "2"]]
+    assert ["PX", "60000"] == next(command for command in redis.commands if command[0] == "SET")[3:]
+    assert redis.values == {}
+
+
+def _config(backend: str, tmp_path) -> types.SimpleNamespace:
+    return types.SimpleNamespace(
+        backend=backend,
+        db_path=str(tmp_path / "fsm.db"),
+        url="redis://127.0.0.1:6380/1",
+        ttl_seconds=3600,
+        cache_ttl=1.0,
+    )
+
+
+@pytest.mark.parametrize("backend, storage_class", [
+    ("sqlite", SQLiteStorage),
+    ("redis", RespStorage),
+    ("memory", MemoryStorage),
+    ("memcached", MemoryStorage),
+])
+def test_backend_selection(backend, storage_class, tmp_path):
+    storage = create_fsm_storage(_config(backend, tmp_path))
+    assert type(storage) is storage_class
+    if backend == "redis":
+        assert (storage.client.host, storage.client.port, storage.client.db) == ("127.0.0.1", 6380, 1)
+    asyncio.run(storage.close())
@@ -0,0 +1,147 @@
+import gc
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+from llm import OpenRouterClient, kb_artifact
+from llm.cache import content_hash
+from llm.kb_artifact import ArtifactError, CompiledIndex, ensure_compiled, is_fresh, load_index, write_artifact
+from llm.openrouter_client import CONTEXT_MODE_RETRIEVAL
+from llm.retrieval import KnowledgeBaseIndex
+
+DATA_TEXT = (Path(__file__).parent.parent / "data" / "data.txt").read_text(encoding="utf-8")
+
+TEXT = """Поступление
+Вступительный экзамен проходит онлайн в мае.
+
+Обучение
+Занятия идут по вечерам, обучение длится два года.
+
+Стоимость
+Обучение в ШАД бесплатное."""
+
+QUERIES = ["Как проходит вступительный экзамен?", "сколько стоит обучение", "занятия по вечерам", "ШАД", "zzz"]
+
+
+def test_compiled_search_matches_in_memory_index(tmp_path):
+    path = str(tmp_path / "data.kb")
+    write_artifact(path, DATA_TEXT)
+    compiled = CompiledIndex(path)
+    in_memory = KnowledgeBaseIndex.from_text(DATA_TEXT)
+    try:
+        assert len(compiled) == len(in_memory.sections)
+        assert [s.text for s in compiled.sections] == [s.text for s in in_memory.sections]
+        for query in QUERIES + ["Какие требования для поступления в ШАД?"]:
+            expected = in_memory.search(query, top_k=5)
+            found = compiled.search(query, top_k=5)
+            assert [s.position for s, _ in found] == [s.position for s, _ in expected]
+            assert [score for _, score in found] == pytest.approx([score for _, score in expected])
+    finally:
+        compiled.close()
+
+
+def test_load_index_compiles_once_and_reuses_fresh_file(tmp_path):
+    path = str(tmp_path / "data.kb")
+    index = load_index(TEXT, path)
+    assert isinstance(index, CompiledIndex)
+    assert index.search("стоимость обучения", top_k=1)[0][0].title == "Стоимость"
+    index.close()
+
+    os.utime(path, (1, 1))
+    load_index(TEXT, path).close()
+    assert os.stat(path).st_mtime == 1
+
+
+def test_stale_file_is_recompiled(tmp_path):
+    path = str(tmp_path / "data.kb")
+    write_artifact(path, TEXT)
+    changed = TEXT + "\n\nОбщежитие\nОбщежитие не предоставляется."
+
+    assert not is_fresh(path, content_hash(changed), 1500)
+    assert not is_fresh(path, content_hash(TEXT), 500)
+
+    index = load_index(changed, path)
+    try:
+        assert index.version == content_hash(changed)
+        assert index.search("общежитие", top_k=1)[0][0].title == "Общежитие"
+    finally:
+        index.close()
+
+
+def test_damaged_file_is_rejected_and_replaced(tmp_path):
+    path = tmp_path / "data.kb"
+    path.write_bytes(b"not an artifact at all, just some bytes " * 4)
+
+    with pytest.raises(ArtifactError):
+        CompiledIndex(str(path))
+
+    index = load_index(TEXT, str(path))
+    assert isinstance(index, CompiledIndex)
+    index.close()
+
+
+def test_unwritable_location_falls_back_to_memory(tmp_path):
+    index = load_index(TEXT, str(tmp_path / "missing" / "data.kb"))
+
+    assert isinstance(index, KnowledgeBaseIndex)
+    assert index.search("экзамен", top_k=1)[0][0].title == "Поступление"
+
+
+def test_ensure_compiled_only_rebuilds_after_change(tmp_path):
+    data_file = tmp_path / "data.txt"
+    data_file.write_text(TEXT, encoding="utf-8")
+    path = str(tmp_path / "data.kb")
+
+    assert ensure_compiled(str(data_file), path) is True
+    assert ensure_compiled(str(data_file), path) is False
+    data_file.write_text(TEXT + "\n\nНовое\nНовый раздел.", encoding="utf-8")
+    assert ensure_compiled(str(data_file), path) is True
+
+
+def test_check_command_reports_stale_artifact(tmp_path, monkeypatch, capsys):
+    data_file = tmp_path / "data.txt"
+    data_file.write_text(TEXT, encoding="utf-8")
+    path = str(tmp_path / "data.kb")
+    args = ["kb_artifact", "--data", str(data_file), "--output", path]
+
+    monkeypatch.setattr(sys, "argv", args + ["--check"])
+    with pytest.raises(SystemExit) as stale:
+        kb_artifact.main()
+
+    monkeypatch.setattr(sys, "argv", args)
+    kb_artifact.main()
+
+    monkeypatch.setattr(sys, "argv", args + ["--check"])
+    with pytest.raises(SystemExit) as fresh:
+        kb_artifact.main()
+
+    assert (stale.value.code, fresh.value.code) == (1, 0)
+    assert "up to date" in capsys.readouterr().out
+
+
+def test_reload_unmaps_replaced_index_once_released(tmp_path):
+    data_file = tmp_path / "data.txt"
+    data_file.write_text(TEXT, encoding="utf-8")
+    client = OpenRouterClient(
+        api_key="test",
+        data_file=str(data_file),
+        context_mode=CONTEXT_MODE_RETRIEVAL,
+        kb_artifact=str(tmp_path / "data.kb"),
+    )
+    taken = client.knowledge_base
+    old_index = taken.index
+    assert isinstance(old_index, CompiledIndex)
+
+    data_file.write_text(TEXT + "\n\nОбщежитие\nОбщежитие не предоставляется.", encoding="utf-8")
+    client.reload_data()
+
+    # A request holding the old snapshot can still search it
+    assert old_index.search("экзамен", top_k=1)
+    assert not old_index._buf.closed
+
+    del taken
+    gc.collect()
+    assert old_index._buf.closed
+    assert client.index.search("общежитие", top_k=1)[0][0].title == "Общежитие"
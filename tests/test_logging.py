@@ -0,0 +1,146 @@
+import json
+import logging
+import queue
+import sys
+import types
+
+import pytest
+
+from bot.logger_config import (
+    JsonFormatter,
+    RequestContextFilter,
+    SamplingFilter,
+    SizedTimedRotatingFileHandler,
+    TracebackQueueHandler,
+    request_id_var,
+    setup_logging,
+    stop_logging,
+)
+
+
+def record(level: int = logging.INFO, name: str = "bot.handlers", msg: str = "Ответ за %.1fs", args=(1.5,), **extra):
+    result = logging.makeLogRecord({
+        "name": name,
+        "levelno": level,
+        "levelname": logging.getLevelName(level),
+        "msg": msg,
+        "args": args,
+    })
+    result.__dict__.update(extra)
+    return result
+
+
+@pytest.fixture
+def root_logger():
+    """Root logger whose handlers and level are restored after the test"""
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    yield root
+    stop_logging()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    for handler in handlers:
+        root.addHandler(handler)
+    root.setLevel(level)
+
+
+def test_json_formatter_includes_request_id_and_extras():
+    line = JsonFormatter().format(record(request_id="42", user_id=7))
+    data = json.loads(line)
+
+    assert data["message"] == "Ответ за 1.5s"
+    assert data["level"] == "INFO"
+    assert data["logger"] == "bot.handlers"
+    assert data["request_id"] == "42"
+    assert data["user_id"] == 7
+    assert "exc_info" not in data
+
+
+def test_traceback_survives_the_queue():
+    log_queue = queue.SimpleQueue()
+    handler = TracebackQueueHandler(log_queue)
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        handler.handle(record(level=logging.ERROR, exc_info=sys.exc_info()))
+
+    queued = log_queue.get_nowait()
+    data = json.loads(JsonFormatter().format(queued))
+
+    assert data["message"] == "Ответ за 1.5s"
+    assert "ValueError: broken" in data["exc_info"]
+    assert "Traceback" not in data["message"]
+
+
+def test_request_id_comes_from_context():
+    token = request_id_var.set("update-9")
+    try:
+        item = record()
+        RequestContextFilter().filter(item)
+    finally:
+        request_id_var.reset(token)
+
+    assert item.request_id == "update-9"
+
+    outside = record()
+    RequestContextFilter().filter(outside)
+    assert outside.request_id == "-"
+
+
+def test_sampling_drops_only_low_levels_of_configured_loggers():
+    sampling = SamplingFilter({"bot.handlers": 0.0})
+
+    assert not sampling.filter(record(name="bot.handlers"))
+    assert not sampling.filter(record(name="bot.handlers.questions"))
+    assert sampling.filter(record(level=logging.WARNING, name="bot.handlers"))
+    assert sampling.filter(record(name="llm.openrouter_client"))
+
+
+def test_file_rotates_by_size_without_overwriting(tmp_path):
+    path = tmp_path / "bot.log"
+    handler = SizedTimedRotatingFileHandler(str(path), max_bytes=100, when="midnight", backupCount=10, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    try:
+        for i in range(10):
+            handler.emit(record(msg="x" * 40 + str(i), args=None))
+    finally:
+        handler.close()
+
+    files = sorted(tmp_path.iterdir())
+    lines = [line for file in files for line in file.read_text(encoding="utf-8").splitlines()]
+
+    assert len(files) > 2
+    assert all(file.stat().st_size <= 100 + 42 for file in files)
+    assert sorted(lines) == sorted("x" * 40 + str(i) for i in range(10))
+
+
+def test_setup_logging_writes_json_lines_from_the_listener(tmp_path, root_logger):
+    path = tmp_path / "bot.log"
+    config = types.SimpleNamespace(
+        level="info",
+        format="json",
+        file=str(path),
+        max_bytes=0,
+        rotate_when="midnight",
+        backup_count=1,
+        sampling={},
+        levels={"noisy": "error"},
+    )
+    setup_logging(config=config)
+
+    token = request_id_var.set("update-1")
+    try:
+        logging.getLogger("bot.handlers").info("Вопрос от %s", "user", extra={"user_id": 5})
+        logging.getLogger("noisy").warning("Скрыто")
+    finally:
+        request_id_var.reset(token)
+    stop_logging()
+
+    entries = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    question = next(entry for entry in entries if entry["logger"] == "bot.handlers")
+
+    assert question["message"] == "Вопрос от user"
+    assert question["request_id"] == "update-1"
+    assert question["user_id"] == 5
+    assert all(entry["logger"] != "noisy" for entry in entries)
+    assert isinstance(root_logger.handlers[0], TracebackQueueHandler)
@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from llm import AnswerInfo
+from llm.cache import AnswerCache
+from llm.memory import ConversationMemory, is_follow_up
+from tests.stubs import FixedStub
+
+
+@pytest.mark.parametrize("query", [
+    "А в Москве?",
+    "а какие там сроки?",
+    "Расскажи подробнее",
+    "И сколько это стоит?",
+    "Что он имел в виду?",
+])
+def test_follow_ups_are_detected(query):
+    assert is_follow_up(query)
+
+
+@pytest.mark.parametrize("query", [
+    "Как поступить в ШАД?",
+    "Сколько стоит обучение?",
+    "Когда экзамен?",
+    "Можно ли совмещать с работой?",
+    "",
+])
+def test_stand_alone_questions_are_not_follow_ups(query):
+    assert not is_follow_up(query)
+
+
+def test_history_only_for_follow_ups():
+    memory = ConversationMemory()
+    memory.add(1, "Как поступить?", "Через экзамен")
+    assert memory.history_for(1, "Сколько стоит обучение?") is None
+    assert memory.history_for(1, "А когда он?").turns == [("Как поступить?", "Через экзамен")]
+    assert memory.history_for(2, "А когда он?") is None
+
+    every_question = ConversationMemory(follow_ups_only=False)
+    every_question.add(1, "Как поступить?", "Через экзамен")
+    assert every_question.history_for(1, "Сколько стоит обучение?") is not None
+
+
+def test_returning_user_still_gets_cached_answers(stub_client):
+    async def scenario():
+        stub = FixedStub()
+        client, runner = await stub_client(stub, cache=AnswerCache(db_path=None), memory=ConversationMemory())
+        try:
+            sources = []
+            for user_id, query in [
+                (1, "Как поступить в ШАД?"),
+                (2, "Сколько стоит обучение?"),
+                (1, "Сколько стоит обучение?"),
+                (1, "А для студентов это бесплатно?"),
+            ]:
+                info = AnswerInfo()
+                await client.agenerate_answer(query, user_id=user_id, info=info)
+                sources.append(info.source)
+            return sources, stub.requests, len(client.memory.get(1).turns)
+        finally:
+            await client.transport.aclose()
+            await runner.cleanup()
+
+    sources, requests, turns = asyncio.run(scenario())
+    # The stand-alone question of a user with a conversation comes from cache, the follow-up does not
+    assert sources == ["llm", "llm", "cache", "llm"]
+    assert requests == 3
+    assert turns == 3
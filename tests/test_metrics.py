@@ -0,0 +1,120 @@
+import asyncio
+
+import aiohttp
+import pytest
+
+from bot.stats import format_stats
+from metrics import Registry, start_metrics_server
+
+
+def test_counter_keeps_one_value_per_label_set():
+    registry = Registry()
+    counter = registry.counter("bot_updates_total", "Updates")
+    counter.inc(handler="question")
+    counter.inc(2, handler="question")
+    counter.inc(handler="start")
+
+    assert counter.get(handler="question") == 3
+    assert counter.get(handler="start") == 1
+    assert counter.get(handler="missing") == 0
+    assert registry.counter("bot_updates_total", "Updates") is counter
+
+
+def test_name_can_not_change_type():
+    registry = Registry()
+    registry.counter("bot_updates_total", "Updates")
+
+    with pytest.raises(ValueError):
+        registry.gauge("bot_updates_total", "Updates")
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    histogram = registry.histogram("llm_request_duration_seconds", "Latency", buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.7, 3):
+        histogram.observe(value, mode="stream")
+
+    lines = registry.render().splitlines()
+
+    assert "# TYPE llm_request_duration_seconds histogram" in lines
+    assert 'llm_request_duration_seconds_bucket{mode="stream",le="0.1"} 1' in lines
+    assert 'llm_request_duration_seconds_bucket{mode="stream",le="1"} 3' in lines
+    assert 'llm_request_duration_seconds_bucket{mode="stream",le="+Inf"} 4' in lines
+    assert 'llm_request_duration_seconds_sum{mode="stream"} 4.25' in lines
+    assert 'llm_request_duration_seconds_count{mode="stream"} 4' in lines
+
+
+def test_histogram_quantile_interpolates_inside_bucket():
+    registry = Registry()
+    histogram = registry.histogram("latency", "Latency", buckets=(1, 2))
+    for value in (1.5, 1.5, 1.5, 1.5):
+        histogram.observe(value)
+
+    assert histogram.quantile(0.5) == pytest.approx(1.5)
+    assert histogram.quantile(0.5, handler="missing") is None
+
+
+def test_label_values_are_escaped():
+    registry = Registry()
+    registry.counter("errors_total", "Errors").inc(error='bad "quote"\nnext')
+
+    assert 'errors_total{error="bad \\"quote\\"\\nnext"} 1' in registry.render()
+
+
+def test_snapshots_of_workers_are_summed():
+    workers = []
+    for requests in (2, 3):
+        worker = Registry()
+        worker.counter("requests_total", "Requests").inc(requests, model="a")
+        worker.gauge("in_flight", "In flight").set(requests)
+        worker.histogram("latency", "Latency", buckets=(1,)).observe(0.5)
+        workers.append(worker.snapshot())
+
+    total = Registry()
+    for snapshot in workers:
+        total.merge(snapshot)
+
+    assert total.get("requests_total").get(model="a") == 5
+    assert total.get("in_flight").get() == 5
+    assert total.get("latency").samples()[()]["count"] == 2
+
+
+def test_failing_collector_does_not_break_rendering():
+    registry = Registry()
+    gauge = registry.gauge("queue_depth", "Queue depth")
+    registry.register_collector(lambda: gauge.set(7))
+    registry.register_collector(lambda: 1 / 0)
+
+    assert "queue_depth 7" in registry.render().splitlines()
+
+
+def test_stats_summarize_handlers_and_tokens():
+    registry = Registry()
+    registry.histogram("bot_handler_duration_seconds", "Handlers").observe(0.2, handler="question")
+    registry.counter("llm_tokens_total", "Tokens").inc(120, kind="prompt", model="a")
+
+    text = format_stats(registry)
+
+    assert "• question: 1 шт." in text
+    assert "• токены: промпт 120, ответ 0 (рассуждения 0)" in text
+
+
+def test_endpoint_serves_prometheus_text():
+    registry = Registry()
+    registry.counter("requests_total", "Requests").inc()
+
+    async def scenario():
+        runner = await start_metrics_server("127.0.0.1", 0, registry)
+        port = runner.addresses[0][1]
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                    return response.status, response.headers["Content-Type"], await response.text()
+        finally:
+            await runner.cleanup()
+
+    status, content_type, body = asyncio.run(scenario())
+
+    assert status == 200
+    assert content_type.startswith("text/plain")
+    assert "requests_total 1" in body.splitlines()
@@ -0,0 +1,87 @@
+import json
+import random
+
+import pytest
+
+from llm.reasoning import (
+    EFFORT_OFF,
+    MODE_ALWAYS,
+    MODE_NEVER,
+    ReasoningClassifier,
+    ReasoningDecision,
+    train,
+)
+
+SIMPLE = ["привет", "Спасибо!", "какой сайт у ШАД?", "Когда дедлайн подачи заявки?"]
+HARD = [
+    "Стоит ли мне поступать в ШАД, если я работаю полный день и у меня нет математического образования? Как совместить?",
+    "Почему лучше готовиться по алгебре, а не по программированию, если до экзамена 3 месяца?",
+]
+
+
+def test_small_talk_and_lookups_get_no_reasoning():
+    classifier = ReasoningClassifier()
+
+    for question in SIMPLE:
+        decision = classifier.decide(question)
+        assert decision.effort == EFFORT_OFF, question
+        assert not decision.enabled
+
+
+def test_open_questions_get_reasoning():
+    classifier = ReasoningClassifier()
+
+    for question in HARD:
+        assert classifier.decide(question).enabled, question
+    assert max(map(classifier.score, SIMPLE)) < min(map(classifier.score, HARD))
+
+
+def test_effort_follows_thresholds():
+    classifier = ReasoningClassifier(thresholds={"low": 0.1, "high": 0.99})
+
+    assert classifier.decide("какой сайт у ШАД?").effort == "low"
+    assert classifier.decide("привет").effort == EFFORT_OFF
+
+
+def test_modes_skip_classification():
+    assert ReasoningClassifier(mode=MODE_ALWAYS).decide("привет").request_options() == {"reasoning": {"enabled": True}}
+    assert ReasoningClassifier(mode=MODE_NEVER).decide(HARD[0]).request_options() == {"reasoning": {"enabled": False}}
+
+
+def test_first_matching_override_wins():
+    classifier = ReasoningClassifier(overrides=[
+        {"pattern": r"расписан", "effort": "off"},
+        {"pattern": r"ШАД", "effort": "medium"},
+    ])
+
+    assert classifier.decide("Где посмотреть расписание ШАД?").effort == EFFORT_OFF
+    assert classifier.decide("шад это что").effort == "medium"
+    assert classifier.decide("шад это что").reason == "override"
+
+
+def test_request_options_per_effort():
+    assert ReasoningDecision("high").request_options() == {"reasoning": {"effort": "high"}}
+    assert ReasoningDecision(EFFORT_OFF).request_options() == {"reasoning": {"enabled": False}}
+
+
+def test_invalid_configuration_is_rejected():
+    with pytest.raises(ValueError):
+        ReasoningClassifier(mode="sometimes")
+    with pytest.raises(ValueError):
+        ReasoningClassifier(thresholds={"extreme": 0.5})
+    with pytest.raises(ValueError):
+        ReasoningClassifier(overrides=[{"pattern": "x", "effort": "max"}])
+
+
+def test_trained_model_is_loaded(tmp_path):
+    random.seed(0)
+    examples = [(question, False) for question in SIMPLE] + [(question, True) for question in HARD]
+    model = train(examples, epochs=50)
+    path = tmp_path / "reasoning_model.json"
+    path.write_text(json.dumps(model), encoding="utf-8")
+
+    classifier = ReasoningClassifier(model_path=str(path))
+
+    assert classifier.weights == model["weights"]
+    assert all(classifier.score(question) < 0.5 for question in SIMPLE)
+    assert all(classifier.score(question) >= 0.5 for question in HARD)
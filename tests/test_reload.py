@@ -0,0 +1,105 @@
+import asyncio
+import os
+
+import pytest
+
+from llm import OpenRouterClient
+from llm.cache import AnswerCache
+from llm.openrouter_client import CONTEXT_MODE_RETRIEVAL
+
+OLD_TEXT = "ШАД принимает по итогам экзамена."
+NEW_TEXT = "ШАД принимает по итогам экзамена и собеседования."
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = tmp_path / "data.txt"
+    path.write_text(OLD_TEXT, encoding="utf-8")
+    return path
+
+
+def touch(path, text: str, mtime: float):
+    """Rewrite file with an mtime that differs from the previous one even on coarse clocks"""
+    path.write_text(text, encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+
+
+def make_client(data_file, **options) -> OpenRouterClient:
+    return OpenRouterClient(api_key="test", data_file=str(data_file), **options)
+
+
+def test_reload_swaps_snapshot_and_keeps_the_taken_one(data_file):
+    client = make_client(data_file)
+    taken = client.knowledge_base
+    old_version = client.kb_version
+
+    data_file.write_text(NEW_TEXT, encoding="utf-8")
+    version = client.reload_data()
+
+    assert version == client.kb_version != old_version
+    assert client.knowledge_base_text == NEW_TEXT
+    assert taken.text == OLD_TEXT
+
+
+def test_failed_reload_keeps_old_snapshot(data_file):
+    client = make_client(data_file)
+    old_version = client.kb_version
+
+    data_file.unlink()
+    with pytest.raises(OSError):
+        client.reload_data()
+
+    assert client.kb_version == old_version
+    assert client.knowledge_base_text == OLD_TEXT
+
+
+def test_cached_answers_are_not_served_after_reload(data_file):
+    client = make_client(data_file, cache=AnswerCache(db_path=None))
+    client._set_cached("Как поступить?", client.knowledge_base, "Сдать экзамен")
+    assert client.cached_answer("Как поступить?") == "Сдать экзамен"
+
+    data_file.write_text(NEW_TEXT, encoding="utf-8")
+    client.reload_data()
+
+    assert client.cached_answer("Как поступить?") is None
+
+
+def test_async_reload_rebuilds_retrieval_index(data_file):
+    client = make_client(data_file, context_mode=CONTEXT_MODE_RETRIEVAL)
+    old_index = client.index
+
+    data_file.write_text(NEW_TEXT, encoding="utf-8")
+    asyncio.run(client.areload_data())
+
+    assert client.index is not old_index
+    assert client.knowledge_base_text == NEW_TEXT
+
+
+def test_watcher_reloads_on_change_and_retries_after_failed_read(data_file, monkeypatch):
+    client = make_client(data_file)
+    read_and_build = client._read_and_build
+    failures = []
+
+    def flaky_read_and_build():
+        if not failures:
+            failures.append(1)
+            raise OSError("file is being replaced")
+        return read_and_build()
+
+    monkeypatch.setattr(client, "_read_and_build", flaky_read_and_build)
+
+    async def scenario():
+        watcher = asyncio.create_task(client.watch_data_file(interval=0.01))
+        touch(data_file, NEW_TEXT, data_file.stat().st_mtime + 10)
+        try:
+            for _ in range(200):
+                await asyncio.sleep(0.01)
+                if client.knowledge_base_text == NEW_TEXT:
+                    break
+        finally:
+            watcher.cancel()
+
+    asyncio.run(scenario())
+
+    assert failures == [1]
+    assert client.knowledge_base_text == NEW_TEXT
@@ -0,0 +1,155 @@
+import asyncio
+import time
+
+import pytest
+
+from llm.routing import STATE_CLOSED, STATE_HALF_OPEN, STATE_OPEN, ModelRouter, ModelSpec, ModelTimeoutError
+
+
+class FakeModels:
+    """Async request function with a fixed delay and outcome per model"""
+
+    def __init__(self, delays=None, failing=()):
+        self.delays = delays or {}
+        self.failing = set(failing)
+        self.started = []
+        self.cancelled = []
+
+    async def __call__(self, spec: ModelSpec) -> str:
+        self.started.append(spec.name)
+        try:
+            await asyncio.sleep(self.delays.get(spec.name, 0))
+        except asyncio.CancelledError:
+            self.cancelled.append(spec.name)
+            raise
+        if spec.name in self.failing:
+            raise RuntimeError(f"{spec.name} is down")
+        return f"ответ {spec.name}"
+
+
+def make_router(*specs, **options) -> ModelRouter:
+    options.setdefault("hedge_delay", 0.05)
+    options.setdefault("hedge_min_delay", 0.01)
+    return ModelRouter([ModelSpec(*spec) if isinstance(spec, tuple) else ModelSpec(spec) for spec in specs], **options)
+
+
+def test_fast_primary_is_not_hedged():
+    router = make_router("primary", "backup")
+    models = FakeModels()
+
+    assert asyncio.run(router.call(models)) == "ответ primary"
+    assert models.started == ["primary"]
+    assert router.models[0].successes == 1
+
+
+def test_slow_primary_is_hedged_and_loser_cancelled():
+    router = make_router("primary", "backup")
+    models = FakeModels(delays={"primary": 1.0})
+    abandoned = []
+
+    result = asyncio.run(router.call(models, abandoned=lambda spec, late: abandoned.append((spec.name, late))))
+
+    assert result == "ответ backup"
+    assert models.started == ["primary", "backup"]
+    assert models.cancelled == ["primary"]
+    assert abandoned == [("primary", None)]
+    assert (router.models[1].hedges, router.models[1].hedge_wins) == (1, 1)
+    # Losing the race is not the primary's fault
+    assert router.models[0].consecutive_failures == 0
+
+
+def test_hedge_waits_for_observed_p95_once_there_are_enough_samples():
+    router = make_router("primary", "backup", hedge_delay=10.0, hedge_min_samples=3)
+    for _ in range(3):
+        router.models[0].record_latency("complete", 0.02)
+
+    assert router._hedge_after(router.models[0], "complete") == pytest.approx(0.02)
+    assert router._hedge_after(router.models[0], "stream") == 10.0
+
+
+def test_error_fails_over_without_waiting_for_hedge_delay():
+    router = make_router("primary", "backup", hedge_delay=10.0, hedge_min_delay=10.0)
+    models = FakeModels(failing={"primary"})
+
+    started = time.perf_counter()
+    assert asyncio.run(router.call(models)) == "ответ backup"
+    assert time.perf_counter() - started < 1.0
+    assert router.models[0].errors == 1
+
+
+def test_deadline_miss_counts_as_timeout_and_fails_over():
+    router = make_router(("primary", 0.05), "backup", hedge=False)
+    models = FakeModels(delays={"primary": 1.0})
+
+    assert asyncio.run(router.call(models)) == "ответ backup"
+    assert router.models[0].timeouts == 1
+
+
+def test_last_error_is_raised_when_every_model_fails():
+    router = make_router(("primary", 0.01), "backup", hedge=False)
+    models = FakeModels(delays={"primary": 1.0}, failing={"backup"})
+
+    with pytest.raises(RuntimeError, match="backup is down"):
+        asyncio.run(router.call(models))
+
+    router = make_router(("only", 0.01))
+    with pytest.raises(ModelTimeoutError):
+        asyncio.run(router.call(FakeModels(delays={"only": 1.0})))
+
+
+def test_breaker_opens_then_probe_closes_it():
+    router = make_router("primary", "backup", failure_threshold=2, cooldown_seconds=0.05)
+    primary = router.models[0]
+
+    failing = FakeModels(failing={"primary"})
+    for _ in range(2):
+        asyncio.run(router.call(failing))
+    assert primary.state == STATE_OPEN
+
+    skipped = FakeModels()
+    asyncio.run(router.call(skipped))
+    assert skipped.started == ["backup"]
+
+    time.sleep(0.06)
+    assert router.candidates()[0] is primary
+    assert primary.state == STATE_HALF_OPEN
+
+    healthy = FakeModels()
+    assert asyncio.run(router.call(healthy)) == "ответ primary"
+    assert primary.state == STATE_CLOSED
+
+
+def test_failed_probe_opens_breaker_again():
+    router = make_router("primary", "backup", failure_threshold=1, cooldown_seconds=0.05)
+    primary = router.models[0]
+    failing = FakeModels(failing={"primary"})
+
+    asyncio.run(router.call(failing))
+    time.sleep(0.06)
+    asyncio.run(router.call(failing))
+
+    assert primary.state == STATE_OPEN
+    assert failing.started == ["primary", "backup", "primary", "backup"]
+
+
+def test_every_model_is_tried_when_all_circuits_are_open():
+    router = make_router("primary", "backup", failure_threshold=1, cooldown_seconds=60)
+    for model in router.models:
+        router._record_failure(model, RuntimeError("down"))
+
+    assert [model.spec.name for model in router.candidates()] == ["primary", "backup"]
+
+
+def test_call_sync_fails_over_in_order():
+    router = make_router("primary", "backup")
+    calls = []
+
+    def request(spec: ModelSpec) -> str:
+        calls.append(spec.name)
+        if spec.name == "primary":
+            raise RuntimeError("primary is down")
+        return "ответ"
+
+    assert router.call_sync(request) == "ответ"
+    assert calls == ["primary", "backup"]
+    assert router.stats()[0]["errors"] == 1
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from bot.scheduler import FairScheduler, SchedulerFullError
+
+
+async def _queue(scheduler: FairScheduler, requests, order: list):
+    """Queue (user_id, priority) requests behind a held slot, then free it and record the grant order"""
+    await scheduler.acquire(0)
+
+    async def request(user_id: int, priority: bool, label: str):
+        async with scheduler.slot(user_id, priority):
+            order.append(label)
+
+    tasks = []
+    for user_id, priority, label in requests:
+        tasks.append(asyncio.create_task(request(user_id, priority, label)))
+        await asyncio.sleep(0)
+    scheduler.release()
+    await asyncio.gather(*tasks)
+
+
+def test_slots_go_round_robin_across_users():
+    order = []
+    scheduler = FairScheduler(max_active=1)
+    requests = [(1, False, "a1"), (1, False, "a2"), (1, False, "a3"), (2, False, "b1"), (3, False, "c1")]
+    asyncio.run(_queue(scheduler, requests, order))
+    assert order == ["a1", "b1", "c1", "a2", "a3"]
+    assert scheduler.active == 0
+    assert scheduler.queue_depth == 0
+
+
+def test_priority_users_are_served_first():
+    order = []
+    requests = [(1, False, "user"), (2, False, "other"), (9, True, "admin")]
+    asyncio.run(_queue(FairScheduler(max_active=1), requests, order))
+    assert order == ["admin", "user", "other"]
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        scheduler = FairScheduler(max_active=1, max_queue_size=1)
+        await scheduler.acquire(1)
+        waiter = asyncio.create_task(scheduler.acquire(2))
+        await asyncio.sleep(0)
+        with pytest.raises(SchedulerFullError):
+            await scheduler.acquire(3)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return scheduler.queue_depth
+
+    assert asyncio.run(scenario()) == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def scenario():
+        scheduler = FairScheduler(max_active=1)
+        await scheduler.acquire(1)
+        cancelled = asyncio.create_task(scheduler.acquire(2))
+        waiting = asyncio.create_task(scheduler.acquire(3))
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        depth = scheduler.queue_depth
+        scheduler.release()
+        await waiting
+        return depth, scheduler.active, scheduler.queue_depth
+
+    assert asyncio.run(scenario()) == (1, 1, 0)
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def scenario():
+        scheduler = FairScheduler(max_active=1)
+        await scheduler.acquire(1)
+        cancelled = asyncio.create_task(scheduler.acquire(2))
+        waiting = asyncio.create_task(scheduler.acquire(3))
+        await asyncio.sleep(0)
+        # The slot goes to user 2, who is cancelled before it gets to run
+        scheduler.release()
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        await asyncio.wait_for(waiting, 1)
+        return scheduler.active, scheduler.queue_depth
+
+    assert asyncio.run(scenario()) == (1, 0)
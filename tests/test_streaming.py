@@ -0,0 +1,202 @@
+import asyncio
+import json
+import types
+
+import pytest
+from aiohttp import web
+
+from bench.stub_server import LatencyModel, StubLLMServer
+from bot import handlers
+from bot.formatting import EMPTY_ANSWER_TEXT
+from bot.middlewares import BUSY_TEXT
+from llm import AnswerInfo, QueueFullError, StreamInterrupted
+from llm.cache import AnswerCache
+from tests.stubs import WORDS, FixedStub
+
+
+def _sse(data: dict) -> bytes:
+    return f"data: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class BrokenStub(StubLLMServer):
+    """Stub that drops the connection after the first streamed word"""
+
+    async def handle(self, request: web.Request) -> web.StreamResponse:
+        await request.json()
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        chunk = {
+            "id": "chatcmpl-broken", "object": "chat.completion.chunk", "created": 0, "model": "stub",
+            "choices": [{"index": 0, "delta": {"content": "Поступить"}, "finish_reason": None}],
+        }
+        await response.write(_sse(chunk))
+        await asyncio.sleep(0.05)
+        request.transport.close()
+        return response
+
+
+def test_stream_yields_deltas_in_order_and_caches_the_answer(stub_client):
+    async def scenario():
+        stub = FixedStub()
+        client, runner = await stub_client(stub, cache=AnswerCache(db_path=None))
+        try:
+            info = AnswerInfo()
+            deltas = [delta async for delta in client.astream_answer("Как поступить?", info=info)]
+            cached_info = AnswerInfo()
+            cached = [delta async for delta in client.astream_answer("как поступить", info=cached_info)]
+            return deltas, info, cached, cached_info, stub.requests
+        finally:
+            await client.transport.aclose()
+            await runner.cleanup()
+
+    deltas, info, cached, cached_info, requests = asyncio.run(scenario())
+    assert deltas == ["Поступить", " можно", " через", " экзамен"]
+    assert info.source == "llm"
+    assert info.completion_tokens > 0
+    assert cached == ["".join(deltas)]
+    assert cached_info.source == "cache"
+    assert requests == 1
+
+
+def test_stream_cut_off_midway_raises(stub_client):
+    async def scenario():
+        cache = AnswerCache(db_path=None)
+        client, runner = await stub_client(BrokenStub(LatencyModel(distribution="fixed", mean=0)), cache=cache)
+        info = AnswerInfo()
+        deltas = []
+        try:
+            with pytest.raises(StreamInterrupted):
+                async for delta in client.astream_answer("Как поступить?", info=info):
+                    deltas.append(delta)
+            return deltas, info, cache.stats()["size"]
+        finally:
+            await client.transport.aclose()
+            await runner.cleanup()
+
+    deltas, info, cached = asyncio.run(scenario())
+    assert deltas == ["Поступить"]
+    assert info.source == "error"
+    assert cached == 0
+
+
+class FakePlaceholder:
+    def __init__(self):
+        self.edits = []
+        self.deleted = False
+
+    async def edit_text(self, text, parse_mode=None):
+        self.edits.append((text, parse_mode))
+
+    async def delete(self):
+        self.deleted = True
+
+
+class FakeBot:
+    id = 1
+
+    async def send_chat_action(self, **kwargs):
+        pass
+
+
+class FakeMessage:
+    def __init__(self):
+        self.bot = FakeBot()
+        self.chat = types.SimpleNamespace(id=10)
+        self.from_user = types.SimpleNamespace(id=10)
+        self.placeholder = FakePlaceholder()
+        self.sent = []
+
+    async def answer(self, text, parse_mode=None, **kwargs):
+        if not self.sent:
+            self.sent.append(text)
+            return self.placeholder
+        self.sent.append(text)
+        return FakePlaceholder()
+
+
+@pytest.fixture
+def stream(monkeypatch):
+    """Install a fake LLM client whose astream_answer runs the given async generator"""
+    monkeypatch.setattr(handlers, "bot_config", types.SimpleNamespace(streaming=types.SimpleNamespace(edit_interval=0.05)))
+
+    def install(generator):
+        monkeypatch.setattr(handlers, "llm_client", types.SimpleNamespace(astream_answer=generator))
+
+    return install
+
+
+def test_edits_are_throttled(stream):
+    async def answer(query, user_id=None, info=None):
+        for i in range(20):
+            await asyncio.sleep(0.01)
+            yield f"слово{i}" if i == 0 else f" слово{i}"
+
+    stream(answer)
+    message = FakeMessage()
+    text = asyncio.run(handlers.stream_answer(message, "вопрос", AnswerInfo()))
+
+    assert text == " ".join(f"слово{i}" for i in range(20))
+    previews = [edit for edit, parse_mode in message.placeholder.edits if parse_mode is None]
+    # 0.2 s of streaming with one edit per 0.05 s, not one per chunk
+    assert 2 <= len(previews) <= 6
+    assert all(text.startswith(edit) for edit in previews)
+    assert message.placeholder.edits[-1] == (text, "HTML")
+
+
+def test_placeholder_is_deleted_on_cancel(stream):
+    started = asyncio.Event()
+
+    async def answer(query, user_id=None, info=None):
+        yield "Начало"
+        started.set()
+        await asyncio.Event().wait()
+
+    async def scenario():
+        message = FakeMessage()
+        task = asyncio.create_task(handlers.stream_answer(message, "вопрос", AnswerInfo()))
+        await started.wait()
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        return message
+
+    stream(answer)
+    message = asyncio.run(scenario())
+    assert message.placeholder.deleted
+
+
+def test_interrupted_stream_keeps_the_partial_answer(stream):
+    async def answer(query, user_id=None, info=None):
+        yield "Половина ответа"
+        raise StreamInterrupted("connection lost")
+
+    stream(answer)
+    message = FakeMessage()
+    text = asyncio.run(handlers.stream_answer(message, "вопрос", AnswerInfo()))
+
+    assert text == "Половина ответа"
+    assert message.placeholder.edits[-1] == ("Половина ответа", "HTML")
+    assert message.sent[-1] == handlers.CUT_OFF_TEXT
+
+
+def test_interrupted_stream_without_text_shows_the_fallback(stream):
+    async def answer(query, user_id=None, info=None):
+        yield "  "
+        raise StreamInterrupted("connection lost")
+
+    stream(answer)
+    message = FakeMessage()
+    assert asyncio.run(handlers.stream_answer(message, "вопрос", AnswerInfo())) is None
+    assert message.placeholder.edits[-1] == (EMPTY_ANSWER_TEXT, None)
+    assert handlers.CUT_OFF_TEXT not in message.sent
+
+
+def test_full_queue_replaces_the_placeholder(stream):
+    async def answer(query, user_id=None, info=None):
+        raise QueueFullError("too many requests")
+        yield
+
+    stream(answer)
+    message = FakeMessage()
+    assert asyncio.run(handlers.stream_answer(message, "вопрос", AnswerInfo())) is None
+    assert message.placeholder.edits == [(BUSY_TEXT, None)]
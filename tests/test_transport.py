@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+
+from llm import transport as transport_module
+from llm.transport import AsyncRetryTransport, RetryBudget, RetryPolicy, RetryTransport
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(transport_module, "time", clock)
+    return clock
+
+
+def test_budget_allows_min_retries_without_traffic(clock):
+    budget = RetryBudget(ratio=0.1, min_retries=2, window=10)
+    assert [budget.try_retry() for _ in range(3)] == [True, True, False]
+
+
+def test_budget_grows_with_requests(clock):
+    budget = RetryBudget(ratio=0.5, min_retries=0, window=10)
+    for _ in range(4):
+        budget.record_request()
+    assert [budget.try_retry() for _ in range(3)] == [True, True, False]
+
+
+def test_budget_forgets_old_events(clock):
+    budget = RetryBudget(ratio=0.0, min_retries=1, window=10)
+    assert budget.try_retry()
+    assert not budget.try_retry()
+    clock.now += 11
+    assert budget.try_retry()
+
+
+def test_policy_stops_after_max_retries(clock):
+    policy = RetryPolicy(max_retries=2, backoff=0.5, budget=RetryBudget(min_retries=100))
+    delays = [policy.delay(attempt, "503") for attempt in range(3)]
+    assert delays[2] is None
+    assert 0 <= delays[0] <= 0.5
+    assert 0 <= delays[1] <= 1.0
+
+
+def test_policy_honours_short_retry_after(clock):
+    policy = RetryPolicy(backoff=0.01, backoff_max=5, budget=RetryBudget(min_retries=100))
+    response = httpx.Response(429, headers={"Retry-After": "2"})
+    assert policy.delay(0, "429", response) == 2.0
+    too_long = httpx.Response(429, headers={"Retry-After": "60"})
+    assert policy.delay(0, "429", too_long) is None
+
+
+def test_policy_gives_up_when_budget_is_spent(clock):
+    policy = RetryPolicy(max_retries=5, budget=RetryBudget(ratio=0, min_retries=1))
+    assert policy.delay(0, "503") is not None
+    assert policy.delay(1, "503") is None
+
+
+def _responder(outcomes):
+    """MockTransport handler returning or raising outcomes in order; records calls"""
+    calls = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        outcome = outcomes[min(len(calls), len(outcomes)) - 1]
+        if isinstance(outcome, Exception):
+            raise outcome
+        return httpx.Response(outcome)
+
+    return handle, calls
+
+
+def _policy(**kwargs) -> RetryPolicy:
+    kwargs.setdefault("budget", RetryBudget(min_retries=100))
+    return RetryPolicy(backoff=0, **kwargs)
+
+
+def test_retryable_status_is_retried():
+    handle, calls = _responder([503, 502, 200])
+    client = httpx.Client(transport=RetryTransport(httpx.MockTransport(handle), _policy(max_retries=2)))
+    assert client.post("http://llm.test/v1/chat/completions").status_code == 200
+    assert len(calls) == 3
+
+
+def test_last_failed_response_is_returned():
+    handle, calls = _responder([503])
+    client = httpx.Client(transport=RetryTransport(httpx.MockTransport(handle), _policy(max_retries=1)))
+    assert client.post("http://llm.test/v1/chat/completions").status_code == 503
+    assert len(calls) == 2
+
+
+def test_connect_errors_are_retried_async():
+    async def scenario():
+        handle, calls = _responder([httpx.ConnectError("refused"), 200])
+        transport = AsyncRetryTransport(httpx.MockTransport(handle), _policy())
+        async with httpx.AsyncClient(transport=transport) as client:
+            response = await client.post("http://llm.test/v1/chat/completions")
+        return response.status_code, len(calls)
+
+    assert asyncio.run(scenario()) == (200, 2)
+
+
+def test_dropped_connection_is_not_replayed():
+    async def scenario():
+        handle, calls = _responder([httpx.RemoteProtocolError("Server disconnected"), 200])
+        transport = AsyncRetryTransport(httpx.MockTransport(handle), _policy())
+        async with httpx.AsyncClient(transport=transport) as client:
+            with pytest.raises(httpx.RemoteProtocolError):
+                await client.post("http://llm.test/v1/chat/completions")
+        return len(calls)
+
+    assert asyncio.run(scenario()) == 1
+
+
+def test_client_errors_are_not_retried():
+    handle, calls = _responder([400, 200])
+    client = httpx.Client(transport=RetryTransport(httpx.MockTransport(handle), _policy()))
+    assert client.post("http://llm.test/v1/chat/completions").status_code == 400
+    assert len(calls) == 1
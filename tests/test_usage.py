@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+
+import pytest
+
+from bot import usage
+from bot.usage import SCOPE_GLOBAL, SCOPE_USER, UsageTracker
+
+
+@pytest.fixture
+def day(monkeypatch):
+    current = {"day": "2026-10-16"}
+    monkeypatch.setattr(usage, "today", lambda: current["day"])
+    return current
+
+
+def test_user_budget_resets_at_midnight(day, tmp_path):
+    async def scenario():
+        tracker = UsageTracker(path=str(tmp_path / "usage.db"), flush_interval=60, user_daily_tokens=100)
+        await tracker.start()
+        tracker.record(1, 80, 20)
+        assert tracker.check(1) == SCOPE_USER
+        assert tracker.check(2) is None
+        assert tracker.check(1, exempt=True) is None
+
+        # Still over budget once the counters are in the database
+        await tracker.flush()
+        assert tracker.check(1) == SCOPE_USER
+
+        day["day"] = "2026-10-17"
+        assert tracker.check(1) is None
+        assert tracker.used(1) == 0
+
+        await tracker.flush()
+        assert tracker.check(1) is None
+        await tracker.close()
+
+    asyncio.run(scenario())
+
+
+def test_usage_counted_before_midnight_stays_on_that_day(day, tmp_path):
+    path = str(tmp_path / "usage.db")
+
+    async def scenario():
+        tracker = UsageTracker(path=path, flush_interval=60, global_daily_tokens=150)
+        await tracker.start()
+        tracker.record(1, 100, 0)
+        day["day"] = "2026-10-17"
+        tracker.record(1, 10, 0)
+        assert tracker.global_used() == 10
+        assert tracker.check(1) is None
+
+        # The write of the old day must not count towards the new one
+        await tracker.flush()
+        assert tracker.used(1) == 10
+        tracker.record(2, 140, 0)
+        assert tracker.check(1) == SCOPE_GLOBAL
+        await tracker.close()
+
+    asyncio.run(scenario())
+    rows = sqlite3.connect(path).execute(
+        "SELECT day, user_id, requests, prompt_tokens FROM usage ORDER BY day, user_id"
+    ).fetchall()
+    assert rows == [("2026-10-16", 1, 1, 100), ("2026-10-17", 1, 1, 10), ("2026-10-17", 2, 1, 140)]
+
+
+def test_totals_are_shared_through_the_database(day, tmp_path):
+    path = str(tmp_path / "usage.db")
+
+    async def scenario():
+        first = UsageTracker(path=path, flush_interval=60, user_daily_tokens=100)
+        second = UsageTracker(path=path, flush_interval=60, user_daily_tokens=100)
+        await first.start()
+        await second.start()
+        first.record(1, 60, 0)
+        second.record(1, 50, 0)
+        assert first.check(1) is None
+
+        await second.flush()
+        await first.flush()
+        result = first.check(1), second.used(1)
+        await first.close()
+        await second.close()
+        return result
+
+    assert asyncio.run(scenario()) == (SCOPE_USER, 50)
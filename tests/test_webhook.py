@@ -0,0 +1,118 @@
+import asyncio
+
+import aiohttp
+from aiogram import Bot, Dispatcher
+from aiogram.types import Message
+
+from bot.webhook import SECRET_HEADER, WebhookServer
+
+SECRET = "s3cret"
+
+
+def update(update_id: int, text: str = "Как поступить?") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Тест"},
+            "text": text,
+        },
+    }
+
+
+class OfflineBot(Bot):
+    """Bot that remembers webhook registration instead of calling Telegram"""
+
+    webhook = None
+
+    async def set_webhook(self, **kwargs):
+        self.webhook = kwargs
+
+
+def make_server(handled: list, delay: float = 0.0, **options) -> WebhookServer:
+    dp = Dispatcher()
+
+    @dp.message()
+    async def record(message: Message):
+        await asyncio.sleep(delay)
+        handled.append(message.text)
+
+    bot = OfflineBot("123456:TEST")
+    options.setdefault("secret_token", SECRET)
+    return WebhookServer(dp, bot, **options)
+
+
+async def post_all(server: WebhookServer, bodies, secret: str = SECRET):
+    """Start server, post bodies one by one and return the response statuses"""
+    await server.start("127.0.0.1", 0, "https://example.com/webhook")
+    port = server._runner.addresses[0][1]
+    statuses = []
+    async with aiohttp.ClientSession() as session:
+        for body in bodies:
+            kwargs = {"json": body} if isinstance(body, dict) else {"data": body}
+            async with session.post(
+                f"http://127.0.0.1:{port}/webhook", headers={SECRET_HEADER: secret}, **kwargs
+            ) as response:
+                statuses.append(response.status)
+    return statuses
+
+
+def test_update_is_acknowledged_and_processed():
+    handled = []
+
+    async def scenario():
+        server = make_server(handled)
+        statuses = await post_all(server, [update(1)])
+        await server.stop()
+        return statuses, server.bot.webhook
+
+    statuses, webhook = asyncio.run(scenario())
+
+    assert statuses == [200]
+    assert handled == ["Как поступить?"]
+    assert webhook["url"] == "https://example.com/webhook"
+    assert webhook["secret_token"] == SECRET
+
+
+def test_wrong_secret_and_malformed_body_are_refused():
+    handled = []
+
+    async def scenario():
+        server = make_server(handled)
+        wrong = await post_all(server, [update(1)], secret="guess")
+        await server.stop()
+        server = make_server(handled)
+        malformed = await post_all(server, [b"not json", {"message": "no update id"}])
+        await server.stop()
+        return wrong + malformed
+
+    assert asyncio.run(scenario()) == [401, 400, 400]
+    assert handled == []
+
+
+def test_full_queue_answers_503():
+    handled = []
+
+    async def scenario():
+        server = make_server(handled, workers=0, max_queue_size=1)
+        statuses = await post_all(server, [update(1), update(2)])
+        depth = server.queue_depth
+        await server.stop(timeout=0.1)
+        return statuses, depth
+
+    assert asyncio.run(scenario()) == ([200, 503], 1)
+
+
+def test_stop_finishes_queued_updates():
+    handled = []
+
+    async def scenario():
+        server = make_server(handled, delay=0.05, workers=2)
+        statuses = await post_all(server, [update(i, f"вопрос {i}") for i in range(1, 6)])
+        await server.stop(timeout=5)
+        return statuses
+
+    assert asyncio.run(scenario()) == [200] * 5
+    assert sorted(handled) == [f"вопрос {i}" for i in range(1, 6)]
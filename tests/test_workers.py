@@ -0,0 +1,71 @@
+import asyncio
+import time
+import types
+
+import pytest
+
+from bot.config import SupervisorConfig
+from bot.workers import Supervisor, WorkerCrashLoop, WorkerProcess
+from tests.crashing_worker import exit_at_once
+
+
+def make_supervisor(**settings) -> Supervisor:
+    config = types.SimpleNamespace(
+        supervisor=SupervisorConfig(workers=1, **settings),
+        metrics=types.SimpleNamespace(enabled=False),
+        webhook=types.SimpleNamespace(enabled=False),
+    )
+    return Supervisor(config, exit_at_once)
+
+
+def test_restart_delay_doubles_up_to_the_cap():
+    supervisor = make_supervisor(restart_backoff=1.0, restart_backoff_max=5.0, max_restarts=0, restart_window=100.0)
+    worker = supervisor.workers[0]
+
+    delays = []
+    for now in range(6):
+        delays.append(supervisor._restart_delay(worker, float(now)))
+        worker.restarts.append(float(now))
+
+    assert delays == [0.0, 1.0, 2.0, 4.0, 5.0, 5.0]
+
+
+def test_restarts_outside_the_window_are_forgotten():
+    supervisor = make_supervisor(restart_backoff=1.0, max_restarts=2, restart_window=10.0)
+    worker = supervisor.workers[0]
+    worker.restarts.extend([0.0, 1.0])
+
+    with pytest.raises(WorkerCrashLoop):
+        supervisor._restart_delay(worker, 5.0)
+    assert supervisor._restart_delay(worker, 10.5) == 1.0
+    assert supervisor._restart_delay(worker, 11.0) == 0.0
+
+
+def test_crashing_worker_is_restarted_with_backoff_then_supervisor_stops(monkeypatch):
+    supervisor = make_supervisor(
+        heartbeat_interval=0.05,
+        restart_backoff=0.2,
+        restart_backoff_max=0.4,
+        max_restarts=3,
+        restart_window=60.0,
+        shutdown_timeout=1.0,
+    )
+    starts = []
+    start = WorkerProcess.start
+
+    def recording_start(worker, heartbeat_interval):
+        starts.append(time.monotonic())
+        start(worker, heartbeat_interval)
+
+    monkeypatch.setattr(WorkerProcess, "start", recording_start)
+    supervisor._poll = lambda: asyncio.Event().wait()
+
+    with pytest.raises(WorkerCrashLoop):
+        asyncio.run(asyncio.wait_for(supervisor.run(), timeout=30))
+
+    # Initial start and three restarts: immediate, then after 0.2s and 0.4s
+    assert len(starts) == 4
+    gaps = [b - a for a, b in zip(starts, starts[1:])]
+    assert gaps[1] >= 0.2
+    assert gaps[2] >= 0.4
+    assert not supervisor.workers[0].alive